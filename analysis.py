@@ -0,0 +1,479 @@
+################################################################################
+# Analysis Server.
+################################################################################
+"""Keeps engines warm and analyses positions sent over a local socket.
+
+One command per line in, one reply per line out, UTF-8:
+
+    position startpos [moves e2e4 e7e5 ...]
+    position fen FEN [moves ...]
+                    Position to work on. Moves may be UCI or SAN.
+    legal           -> legal e2e4 d2d4 ...
+    fen             -> fen FEN
+    go [depth N] [time S] [multipv K]
+                    Analyse the position. As each depth finishes, one line
+                    per principal variation is sent:
+                    -> info depth 5 multipv 1 score cp 40 nodes 14182
+                       nps 40000 time 0.35 pv g1f3 g8f6 b1c3 b8c6 d2d4
+                    and the analysis ends with
+                    -> bestmove g1f3        (bestmove none if no moves)
+                    With neither depth nor time it runs until stop. A go
+                    always ends with bestmove, after an error line if it
+                    could not run.
+    stop            End the running go. Its bestmove is still sent.
+    isready         -> readyok
+    quit            Close the connection.
+
+A bad command is answered with "error <reason>", and the connection stays
+open. A bad position leaves no position set until the next good one. A
+new position or go stops a running go first.
+
+Each connection is served on its own thread, up to max_connections; past
+that, a connection gets "error busy" and is closed. Every go borrows an
+Engine from a fixed pool for its search, so the transposition tables stay
+warm from one query to the next and no more than the pool's size run at
+once. A go waits for a free engine, and a stop ends the wait too.
+
+    python analysis.py serve --port 8765 --engines 2
+    python analysis.py serve --unix /tmp/turtlechess.sock
+    python analysis.py query --port 8765 --fen "FEN" --depth 8 --multipv 3
+"""
+import argparse
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+
+from position import Position, move_uci
+from movegen import generate_legal_moves
+from engine import Engine, SearchControl
+from pgn import PGNError, san_to_move
+
+DEFAULT_PORT = 8765
+
+
+class EnginePool:
+    """Fixed set of engines lent out one search at a time.
+
+    Attributes:
+        size: Number of engines.
+        searches: Searches run so far.
+        waits: Searches that had to wait for a free engine.
+    """
+
+    def __init__(self, size=2, tt_megabytes=16):
+        """Makes size engines, each with its own transposition table.
+
+        Args:
+            size: Number of engines.
+            tt_megabytes: Transposition table budget of each engine.
+        """
+        self.size = size
+        self.searches = 0
+        self.waits = 0
+        self._free = queue.Queue()
+        for index in range(size):
+            self._free.put(Engine(None, tt_megabytes=tt_megabytes))
+
+    def acquire(self, control):
+        """Borrows an engine, waiting for one if all are busy.
+
+        Args:
+            control: SearchControl of the search the engine is for. The
+                     wait ends with None if it is stopped.
+        """
+        try:
+            engine = self._free.get_nowait()
+        except queue.Empty:
+            self.waits += 1
+            engine = None
+            while engine is None and not control.stopped():
+                try:
+                    engine = self._free.get(timeout=0.05)
+                except queue.Empty:
+                    pass
+        if engine is not None:
+            self.searches += 1
+        return engine
+
+    def release(self, engine):
+        """Gives back an engine from acquire."""
+        self._free.put(engine)
+
+
+def parse_move(position, text):
+    """Legal move of position written in UCI or SAN.
+
+    Raises:
+        ValueError: text is not a legal move.
+    """
+    legal_moves = list(generate_legal_moves(position))
+    for move in legal_moves:
+        if move_uci(move) == text:
+            return move
+    try:
+        return san_to_move(position, text, legal_moves)
+    except PGNError as error:
+        raise ValueError(str(error))
+
+
+def parse_position(words):
+    """Position of the words after "position".
+
+    Raises:
+        ValueError: Bad FEN or move.
+    """
+    position = Position()
+    if "moves" in words:
+        index = words.index("moves")
+        words, moves = words[:index], words[index + 1:]
+    else:
+        moves = []
+    if words == ["startpos"]:
+        position.set_start_position()
+    elif len(words) > 1 and words[0] == "fen":
+        position.set_fen(" ".join(words[1:]))
+    else:
+        raise ValueError("position needs startpos or fen FEN")
+    for text in moves:
+        position.make_move(parse_move(position, text))
+    return position
+
+
+def _parse_go(words):
+    """(max_depth, seconds, lines) of the words after "go"."""
+    options = {"depth": None, "time": None, "multipv": 1}
+    if len(words) % 2:
+        raise ValueError("go options come in name value pairs")
+    for name, value in zip(words[::2], words[1::2]):
+        if name not in options:
+            raise ValueError("unknown go option %s" % name)
+        try:
+            options[name] = float(value) if name == "time" else int(value)
+        except ValueError:
+            raise ValueError("bad %s %s" % (name, value))
+    if options["multipv"] < 1:
+        raise ValueError("multipv must be at least 1")
+    if options["depth"] is not None and options["depth"] < 1:
+        raise ValueError("depth must be at least 1")
+    return options["depth"], options["time"], options["multipv"]
+
+
+def info_line(line, info):
+    """Protocol line of line number line's SearchInfo."""
+    return ("info depth %d multipv %d score %s nodes %d nps %d time %.3f "
+            "pv %s" % (info.depth, line, info.score_text(), info.nodes,
+                       info.nps, info.elapsed,
+                       " ".join(move_uci(move) for move in info.pv)))
+
+
+class _Session:
+    """State of one connection: its position and running analysis."""
+
+    def __init__(self, pool, out):
+        self.pool = pool
+        self.out = out
+        self.position = Position()
+        self.position.set_start_position()
+        self.closed = False
+        self._write_lock = threading.Lock()
+        self._control = None
+        self._thread = None
+
+    def send(self, text):
+        """Writes a reply line. A gone client stops the analysis."""
+        with self._write_lock:
+            if self.closed:
+                return
+            try:
+                self.out.write((text + "\n").encode("utf-8"))
+                self.out.flush()
+            except OSError:
+                self.closed = True
+                if self._control is not None:
+                    self._control.stop()
+
+    def stop(self):
+        """Stops the running go, if any, and waits for it to end."""
+        if self._control is not None:
+            self._control.stop()
+        if (self._thread is not None and
+                self._thread is not threading.current_thread()):
+            self._thread.join()
+        self._thread = None
+        self._control = None
+
+    def command(self, line):
+        """Runs one command line.
+
+        Returns:
+            False once the connection should close.
+        """
+        words = line.split()
+        name, words = words[0], words[1:]
+        try:
+            if name == "quit":
+                return False
+            elif name == "isready":
+                self.send("readyok")
+            elif name == "stop":
+                if self._control is not None:
+                    self._control.stop()
+            elif name == "position":
+                self.stop()
+                self.position = None
+                self.position = parse_position(words)
+            elif self.position is None and name in ("legal", "fen", "go"):
+                self.send("error no position set")
+                if name == "go":
+                    self.send("bestmove none")
+            elif name == "legal":
+                self.send(" ".join(["legal"] + [
+                    move_uci(move)
+                    for move in generate_legal_moves(self.position)]))
+            elif name == "fen":
+                self.send("fen " + self.position.fen())
+            elif name == "go":
+                try:
+                    max_depth, seconds, lines = _parse_go(words)
+                except ValueError as error:
+                    self.send("error %s" % error)
+                    self.send("bestmove none")
+                    return True
+                self.stop()
+                self._control = SearchControl(seconds)
+                self._thread = threading.Thread(
+                    target=self._analyse,
+                    args=(self.position.copy(), max_depth, lines,
+                          self._control),
+                    daemon=True)
+                self._thread.start()
+            else:
+                self.send("error unknown command %s" % name)
+        except ValueError as error:
+            self.send("error %s" % error)
+        return True
+
+    def _analyse(self, position, max_depth, lines, control):
+        """Body of a go, on its own thread. Always ends with bestmove."""
+        infos = []
+        try:
+            engine = self.pool.acquire(control)
+            if engine is not None:
+                try:
+                    infos = engine.analyse(position, lines, max_depth,
+                                           control, self._send_infos)
+                finally:
+                    self.pool.release(engine)
+        except Exception as error:
+            self.send("error analysis failed: %s: %s" % (
+                type(error).__name__, error))
+        finally:
+            self.send("bestmove %s" % (move_uci(infos[0].move) if infos
+                                       else "none"))
+
+    def _send_infos(self, infos):
+        for line, info in enumerate(infos):
+            self.send(info_line(line + 1, info))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Reads one connection's commands."""
+
+    def handle(self):
+        server = self.server
+        if not server.connections.acquire(blocking=False):
+            self.wfile.write(b"error busy\n")
+            return
+        session = _Session(server.pool, self.wfile)
+        try:
+            for raw in self.rfile:
+                line = raw.decode("utf-8", "replace").strip()
+                if line and not session.command(line):
+                    break
+        except OSError:
+            pass
+        finally:
+            session.stop()
+            server.connections.release()
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+else:
+    _UnixServer = None
+
+
+def make_server(address, engines=2, tt_megabytes=16, max_connections=16):
+    """Analysis server, ready for serve_forever().
+
+    Args:
+        address: (host, port) for TCP, or a file name for a Unix socket.
+        engines: Size of the engine pool.
+        tt_megabytes: Transposition table budget of each engine.
+        max_connections: Connections served at once.
+    """
+    if isinstance(address, str):
+        if _UnixServer is None:
+            raise ValueError("Unix sockets aren't supported here")
+        server = _UnixServer(address, _Handler)
+    else:
+        server = _TCPServer(address, _Handler)
+    server.pool = EnginePool(engines, tt_megabytes)
+    server.connections = threading.BoundedSemaphore(max_connections)
+    return server
+
+
+class AnalysisClient:
+    """Connection to an analysis server.
+
+    Attributes:
+        address: (host, port) or Unix socket file name.
+    """
+
+    def __init__(self, address, timeout=None):
+        """Connects.
+
+        Args:
+            address: (host, port) or Unix socket file name.
+            timeout: Seconds to wait on the socket, None for no limit.
+        """
+        self.address = address
+        if isinstance(address, str):
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(address)
+        self._in = self._socket.makefile("r", encoding="utf-8")
+
+    def close(self):
+        try:
+            self.send("quit")
+        except OSError:
+            pass
+        self._in.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def send(self, line):
+        """Sends one command line."""
+        self._socket.sendall((line + "\n").encode("utf-8"))
+
+    def read_line(self):
+        """Next reply line, without the newline.
+
+        Raises:
+            ConnectionError: The server closed the connection.
+        """
+        line = self._in.readline()
+        if not line:
+            raise ConnectionError("analysis server closed the connection")
+        return line.rstrip("\n")
+
+    def analyse(self, fen=None, moves=(), max_depth=None, seconds=None,
+                lines=1):
+        """Sends a position and go, and yields each reply line up to and
+        including bestmove. Error lines come before the bestmove.
+
+        Args:
+            fen: Position, None for the starting one.
+            moves: Moves played from it, UCI or SAN.
+            max_depth: Deepest iteration.
+            seconds: Time to analyse. With neither this nor max_depth the
+                     analysis runs until stop() is called.
+            lines: Number of principal variations.
+        """
+        command = "position startpos" if fen is None else "position fen " + fen
+        if moves:
+            command += " moves " + " ".join(moves)
+        self.send(command)
+        go = ["go", "multipv", str(lines)]
+        if max_depth is not None:
+            go += ["depth", str(max_depth)]
+        if seconds is not None:
+            go += ["time", str(seconds)]
+        self.send(" ".join(go))
+        while True:
+            line = self.read_line()
+            yield line
+            if line.startswith("bestmove"):
+                return
+
+    def stop(self):
+        """Ends the running analysis; its bestmove still comes."""
+        self.send("stop")
+
+
+def _address(args):
+    return args.unix if args.unix else (args.host, args.port)
+
+
+def main(argv=None):
+    """Command line server, or one query to a running server."""
+    parser = argparse.ArgumentParser(description="Analyse positions over a "
+                                                 "local socket.")
+    commands = parser.add_subparsers(dest="command")
+    serve = commands.add_parser("serve", help="run the analysis server")
+    query = commands.add_parser("query", help="analyse one position on a "
+                                              "running server")
+    for command in (serve, query):
+        command.add_argument("--host", default="127.0.0.1")
+        command.add_argument("--port", type=int, default=DEFAULT_PORT)
+        command.add_argument("--unix", help="Unix socket file instead of TCP")
+    serve.add_argument("--engines", type=int, default=2,
+                       help="engines searching at once (default 2)")
+    serve.add_argument("--hash", type=int, default=16,
+                       help="transposition table megabytes per engine")
+    serve.add_argument("--max-connections", type=int, default=16)
+    query.add_argument("--fen", help="position, default the starting one")
+    query.add_argument("--moves", nargs="*", default=[],
+                       help="moves played from the position")
+    query.add_argument("--depth", type=int, help="deepest iteration")
+    query.add_argument("--time", type=float, help="seconds to analyse")
+    query.add_argument("--multipv", type=int, default=1,
+                       help="principal variations (default 1)")
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error("give serve or query")
+
+    if args.command == "serve":
+        server = make_server(_address(args), args.engines, args.hash,
+                             args.max_connections)
+        sys.stderr.write("Analysis server on %s\n" % (_address(args),))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if args.unix:
+                os.remove(args.unix)
+        return 0
+
+    if args.depth is None and args.time is None:
+        parser.error("give --depth or --time")
+    failed = False
+    with AnalysisClient(_address(args)) as client:
+        for line in client.analyse(args.fen, args.moves, args.depth,
+                                   args.time, args.multipv):
+            print(line)
+            failed = failed or line.startswith("error")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
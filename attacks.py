@@ -0,0 +1,211 @@
+################################################################################
+# Attack Bitboards.
+################################################################################
+"""Squares attacked by each kind of piece, as bitboards.
+
+Uses the square numbering of position.py (square 0 is a8, white pawns move
+toward row 0). Leaper tables are built at import. Rook and bishop
+lookups are built once and cached on disk (see _cache_path), so later
+process starts only load them.
+"""
+import marshal
+import os
+
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                  (1, -2), (1, 2), (2, -1), (2, 1))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1),
+                (0, 1), (1, -1), (1, 0), (1, 1))
+# Directions come in opposite pairs (index ^ 1 is the opposite one).
+ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (1, 1), (-1, 1), (1, -1))
+
+
+def _leaper_table(offsets):
+    """Bitboard of squares reached from each square by one of the offsets."""
+    table = []
+    for sq in range(64):
+        row, col = sq >> 3, sq & 7
+        bitboard = 0
+        for dr, dc in offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                bitboard |= 1 << (r*8 + c)
+        table.append(bitboard)
+    return table
+
+
+def _ray_table(directions):
+    """For each square, a list per direction of the bits walked outward."""
+    table = []
+    for sq in range(64):
+        rays = []
+        for dr, dc in directions:
+            r, c = (sq >> 3) + dr, (sq & 7) + dc
+            ray = []
+            while 0 <= r < 8 and 0 <= c < 8:
+                ray.append(1 << (r*8 + c))
+                r += dr
+                c += dc
+            rays.append(ray)
+        table.append(rays)
+    return table
+
+
+KNIGHT_ATTACKS = _leaper_table(KNIGHT_OFFSETS)
+KING_ATTACKS = _leaper_table(KING_OFFSETS)
+# PAWN_ATTACKS[color][sq]: squares a pawn of color on sq attacks.
+PAWN_ATTACKS = [_leaper_table(((-1, -1), (-1, 1))),
+                _leaper_table(((1, -1), (1, 1)))]
+
+_ROOK_RAYS = _ray_table(ROOK_DIRECTIONS)
+_BISHOP_RAYS = _ray_table(BISHOP_DIRECTIONS)
+
+
+def _slide(rays, occupied):
+    """Walks each ray up to and including the first occupied square."""
+    attacks = 0
+    for ray in rays:
+        for bit in ray:
+            attacks |= bit
+            if occupied & bit:
+                break
+    return attacks
+
+
+def _relevant_mask(rays):
+    """Squares whose occupancy can change a slider's attacks. The last
+    square of each ray never blocks anything beyond it, so it is left out."""
+    mask = 0
+    for ray in rays:
+        for bit in ray[:-1]:
+            mask |= bit
+    return mask
+
+
+def _slider_table(ray_table):
+    """Masks and per square lookup of attacks by relevant occupancy.
+
+    Every subset of a square's relevant mask is enumerated (carry rippler)
+    and its attack set stored under it, so a lookup is the occupancy ANDed
+    with the mask used as the key. This is the PEXT idea with a dict doing
+    the bit extraction, which is faster in Python than a magic multiply.
+    """
+    masks = []
+    tables = []
+    for rays in ray_table:
+        mask = _relevant_mask(rays)
+        table = {}
+        subset = 0
+        while True:
+            table[subset] = _slide(rays, subset)
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+def _cache_path():
+    """File the slider tables are cached in between runs."""
+    directory = os.environ.get("TURTLECHESS_CACHE")
+    if not directory:
+        directory = os.path.join(os.path.expanduser("~"), ".cache",
+                                 "turtlechess")
+    return os.path.join(directory, "attacks-%d.marshal" % _CACHE_VERSION)
+
+
+def _load_slider_tables():
+    """Slider tables from the disk cache, building and saving on a miss.
+
+    Returns:
+        (rook masks, rook tables, bishop masks, bishop tables)
+    """
+    path = _cache_path()
+    try:
+        with open(path, "rb") as cache:
+            tables = marshal.loads(cache.read())
+        if len(tables) == 4 and len(tables[1]) == 64:
+            return tables
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    tables = _slider_table(_ROOK_RAYS) + _slider_table(_BISHOP_RAYS)
+    # Write to a temporary name first so a half written file is never read.
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = "%s.%d" % (path, os.getpid())
+        with open(temp_path, "wb") as cache:
+            marshal.dump(tables, cache)
+        os.replace(temp_path, path)
+    except OSError:
+        pass
+    return tables
+
+
+_CACHE_VERSION = 1
+_ROOK_MASKS, _ROOK_TABLES, _BISHOP_MASKS, _BISHOP_TABLES = \
+    _load_slider_tables()
+
+
+def rook_attacks(sq, occupied):
+    """Squares a rook on sq attacks given the occupied bitboard."""
+    return _ROOK_TABLES[sq][occupied & _ROOK_MASKS[sq]]
+
+
+def bishop_attacks(sq, occupied):
+    """Squares a bishop on sq attacks given the occupied bitboard."""
+    return _BISHOP_TABLES[sq][occupied & _BISHOP_MASKS[sq]]
+
+
+def queen_attacks(sq, occupied):
+    """Squares a queen on sq attacks given the occupied bitboard."""
+    return (_ROOK_TABLES[sq][occupied & _ROOK_MASKS[sq]] |
+            _BISHOP_TABLES[sq][occupied & _BISHOP_MASKS[sq]])
+
+
+def _line_tables():
+    """BETWEEN[a][b] squares strictly between a and b, LINE[a][b] the whole
+    line through both. Both are 0 when a and b are not on a line."""
+    between = [[0]*64 for sq in range(64)]
+    line = [[0]*64 for sq in range(64)]
+    for sq in range(64):
+        for rays in (_ROOK_RAYS[sq], _BISHOP_RAYS[sq]):
+            for index, ray in enumerate(rays):
+                opposite = rays[index ^ 1]
+                full = (1 << sq)
+                for bit in ray + opposite:
+                    full |= bit
+                walked = 0
+                for bit in ray:
+                    other = bit.bit_length() - 1
+                    between[sq][other] = walked
+                    line[sq][other] = full
+                    walked |= bit
+    return between, line
+
+
+BETWEEN, LINE = _line_tables()
+
+
+def attackers_to(position, sq, color, occupied=None):
+    """Bitboard of color's pieces attacking sq.
+
+    Args:
+        position: Position.
+        sq: Square attacked.
+        color: Color of the attackers.
+        occupied: Occupancy to slide through, default the position's.
+    """
+    if occupied is None:
+        occupied = position.all_occupied
+    pieces = position.pieces
+    base = color*6
+    queens = pieces[base + 4]
+    return ((PAWN_ATTACKS[color ^ 1][sq] & pieces[base]) |
+            (KNIGHT_ATTACKS[sq] & pieces[base + 1]) |
+            (_BISHOP_TABLES[sq][occupied & _BISHOP_MASKS[sq]] &
+             (pieces[base + 2] | queens)) |
+            (_ROOK_TABLES[sq][occupied & _ROOK_MASKS[sq]] &
+             (pieces[base + 3] | queens)) |
+            (KING_ATTACKS[sq] & pieces[base + 5]))
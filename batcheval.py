@@ -0,0 +1,286 @@
+################################################################################
+# Batch Evaluation With NumPy.
+################################################################################
+"""Scores many positions at once with NumPy.
+
+Positions come in as an N x 12 array of bitboards (one per piece code, see
+position.py) or as N x 12 x 64 planes of 0/1, and every term is worked
+out for the whole batch in array operations:
+    material    piece counts times PIECE_VALUES
+    psq         piece-square bonuses of engine.PIECE_TABLES
+    mobility    squares each side's knights, bishops, rooks and queens
+                attack that don't hold their own pieces, per piece type,
+                times MOBILITY_WEIGHTS. Sliders are flood filled through
+                empty squares on the bitboards, so it's exact for one
+                piece of a type and counts a square once when two pieces
+                of the same type both reach it.
+Material plus psq is exactly engine.evaluate. Terms are from white's side;
+evaluate_batch turns them to the side to move when given turns.
+
+NumPy is needed for this module only (pip install numpy, see README.md),
+and importing it without NumPy raises an ImportError saying so. Run as a
+script to score a packed position file (see packed.py) and report
+positions/sec:
+
+    python batcheval.py positions.bin --compare
+"""
+import argparse
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("batcheval.py needs NumPy, which the rest of "
+                      "TurtleChess doesn't: pip install numpy")
+
+from position import KNIGHT, BISHOP, ROOK, QUEEN
+from engine import PIECE_VALUES, PIECE_TABLES, evaluate
+from packed import RECORD_SIZE
+
+# Centipawns per square attacked, by piece type.
+MOBILITY_WEIGHTS = (0, 4, 5, 2, 1, 0)
+
+# Positions scored per chunk, to bound the temporary arrays.
+CHUNK = 65536
+
+_ROOK_DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+_BISHOP_DIRECTIONS = ((-1, -1), (1, 1), (-1, 1), (1, -1))
+_KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                   (1, -2), (1, 2), (2, -1), (2, 1))
+
+_FILE_A = 0x0101010101010101
+# Squares a shift by dc columns can land on without wrapping a row.
+_COLUMN_MASKS = {}
+for _dc in range(-2, 3):
+    _mask = 0
+    for _col in range(8):
+        if 0 <= _col - _dc < 8:
+            _mask |= _FILE_A << _col
+    _COLUMN_MASKS[_dc] = np.uint64(_mask)
+del _dc, _mask, _col
+
+# Material and piece-square value of each piece code on each square,
+# positive for white, as 12 x 64 arrays.
+MATERIAL = np.array([[PIECE_VALUES[piece % 6]*(1 if piece < 6 else -1)]*64
+                     for piece in range(12)], dtype=np.int32)
+PSQ = np.array([list(PIECE_TABLES[piece])
+                if piece < 6 else
+                [-PIECE_TABLES[piece - 6][sq ^ 56] for sq in range(64)]
+                for piece in range(12)], dtype=np.int32)
+
+
+def to_bitboards(positions):
+    """N x 12 uint64 array of the piece bitboards of positions."""
+    return np.array([position.pieces for position in positions],
+                    dtype=np.uint64).reshape(-1, 12)
+
+
+def to_planes(bitboards):
+    """N x 12 x 64 uint8 planes of N x 12 bitboards."""
+    data = np.ascontiguousarray(bitboards, dtype="<u8")
+    bits = np.unpackbits(data.view(np.uint8).reshape(-1, 12, 8), axis=2,
+                         bitorder="little")
+    return bits.reshape(-1, 12, 64)
+
+
+def from_planes(planes):
+    """N x 12 bitboards of N x 12 x 64 planes."""
+    planes = np.asarray(planes, dtype=np.uint8).reshape(-1, 12, 64)
+    packed = np.packbits(planes != 0, axis=2, bitorder="little")
+    return np.ascontiguousarray(packed).view("<u8").reshape(-1, 12).astype(
+        np.uint64)
+
+
+def load_packed(data):
+    """Bitboards and sides to move of packed.py records, decoded together.
+
+    Args:
+        data: Bytes of back to back 32 byte records, e.g. a whole file or
+              an mmap of one.
+
+    Returns:
+        (N x 12 uint64 bitboards, N uint8 turns).
+    """
+    records = np.frombuffer(data, dtype=np.uint8).reshape(-1, RECORD_SIZE)
+    count = len(records)
+    occupied_bits = np.unpackbits(records[:, :8], axis=1, bitorder="little")
+    # Piece codes packed 4 bits each in the order of the occupied squares.
+    nibbles = np.empty((count, 32), dtype=np.uint8)
+    nibbles[:, 0::2] = records[:, 8:24] & 15
+    nibbles[:, 1::2] = records[:, 8:24] >> 4
+    slot = np.cumsum(occupied_bits, axis=1) - 1
+    slot[occupied_bits == 0] = 0
+    codes = np.take_along_axis(nibbles, np.minimum(slot, 31), axis=1)
+    bitboards = np.zeros((count, 12), dtype=np.uint64)
+    squares = np.uint64(1) << np.arange(64, dtype=np.uint64)
+    for piece in range(12):
+        on = (codes == piece) & (occupied_bits == 1)
+        bitboards[:, piece] = np.bitwise_or.reduce(
+            np.where(on, squares, np.uint64(0)), axis=1)
+    return bitboards, records[:, 24] & 1
+
+
+def _popcount(bitboards):
+    """Set bits of each uint64."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bitboards).astype(np.int32)
+    bits = np.unpackbits(np.ascontiguousarray(bitboards, dtype="<u8")
+                         .view(np.uint8).reshape(bitboards.shape + (8,)),
+                         axis=-1)
+    return bits.sum(axis=-1, dtype=np.int32)
+
+
+def _shift(bitboards, dr, dc):
+    """Bitboards moved dr rows and dc cols, dropping what leaves the
+    board."""
+    step = dr*8 + dc
+    if step > 0:
+        moved = bitboards << np.uint64(step)
+    else:
+        moved = bitboards >> np.uint64(-step)
+    return moved & _COLUMN_MASKS[dc] if dc else moved
+
+
+def _leaper_attacks(bitboards, offsets):
+    """Squares attacked from any set square by one offset jump."""
+    attacks = np.zeros_like(bitboards)
+    for dr, dc in offsets:
+        attacks |= _shift(bitboards, dr, dc)
+    return attacks
+
+
+def _slider_attacks(bitboards, empty, directions):
+    """Squares attacked from any set square sliding through empty squares."""
+    attacks = np.zeros_like(bitboards)
+    for dr, dc in directions:
+        flood = ray = bitboards
+        for step in range(6):
+            ray = _shift(ray, dr, dc) & empty
+            flood = flood | ray
+        attacks |= _shift(flood, dr, dc)
+    return attacks
+
+
+def mobility(bitboards):
+    """Mobility term from white's side for N x 12 bitboards."""
+    white = np.bitwise_or.reduce(bitboards[:, :6], axis=1)
+    black = np.bitwise_or.reduce(bitboards[:, 6:], axis=1)
+    empty = ~(white | black)
+    score = np.zeros(len(bitboards), dtype=np.int32)
+    for color, own, sign in ((0, white, 1), (1, black, -1)):
+        base = color*6
+        queens = bitboards[:, base + QUEEN]
+        for ptype, attacks in (
+                (KNIGHT, _leaper_attacks(bitboards[:, base + KNIGHT],
+                                         _KNIGHT_OFFSETS)),
+                (BISHOP, _slider_attacks(bitboards[:, base + BISHOP], empty,
+                                         _BISHOP_DIRECTIONS)),
+                (ROOK, _slider_attacks(bitboards[:, base + ROOK], empty,
+                                       _ROOK_DIRECTIONS)),
+                (QUEEN, _slider_attacks(queens, empty,
+                                        _ROOK_DIRECTIONS +
+                                        _BISHOP_DIRECTIONS))):
+            score += sign*MOBILITY_WEIGHTS[ptype]*_popcount(attacks & ~own)
+    return score
+
+
+def evaluate_terms(boards):
+    """Material, piece-square and mobility terms of a batch.
+
+    Args:
+        boards: N x 12 bitboards or N x 12 x 64 planes.
+
+    Returns:
+        Dict of term name to N int32 scores from white's side.
+    """
+    boards = np.asarray(boards)
+    if boards.ndim == 3:
+        planes = boards
+        bitboards = from_planes(boards)
+    else:
+        bitboards = boards.astype(np.uint64).reshape(-1, 12)
+        planes = None
+    count = len(bitboards)
+    terms = {"material": np.empty(count, dtype=np.int32),
+             "psq": np.empty(count, dtype=np.int32),
+             "mobility": np.empty(count, dtype=np.int32)}
+    material = MATERIAL.reshape(768)
+    psq = PSQ.reshape(768)
+    for first in range(0, count, CHUNK):
+        end = min(first + CHUNK, count)
+        chunk = bitboards[first:end]
+        flat = (to_planes(chunk) if planes is None else
+                planes[first:end]).reshape(-1, 768).astype(np.int32)
+        terms["material"][first:end] = flat @ material
+        terms["psq"][first:end] = flat @ psq
+        terms["mobility"][first:end] = mobility(chunk)
+    return terms
+
+
+def evaluate_batch(boards, turns=None, with_mobility=True):
+    """Total score of each position in a batch.
+
+    Args:
+        boards: N x 12 bitboards or N x 12 x 64 planes.
+        turns: N sides to move (WHITE 0, BLACK 1) to score for, None for
+               white's side.
+        with_mobility: False for material and psq only, which matches
+                       engine.evaluate.
+
+    Returns:
+        N int32 scores.
+    """
+    terms = evaluate_terms(boards)
+    total = terms["material"] + terms["psq"]
+    if with_mobility:
+        total += terms["mobility"]
+    if turns is not None:
+        total = np.where(np.asarray(turns) == 1, -total, total)
+    return total
+
+
+def main(argv=None):
+    """Command line batch scoring of a packed position file."""
+    parser = argparse.ArgumentParser(description="Score every position of "
+                                                 "a packed file with NumPy.")
+    parser.add_argument("packed_file")
+    parser.add_argument("--compare", action="store_true",
+                        help="also time engine.evaluate one position at a "
+                             "time and check it agrees")
+    parser.add_argument("--scores", help="write one score per line here")
+    args = parser.parse_args(argv)
+
+    with open(args.packed_file, "rb") as source:
+        data = source.read()
+    start = time.perf_counter()
+    bitboards, turns = load_packed(data)
+    loaded = time.perf_counter()
+    scores = evaluate_batch(bitboards, turns)
+    elapsed = time.perf_counter() - start
+    count = len(scores)
+    print("Positions: %d" % count)
+    print("Decode: %.3f s, evaluate: %.3f s" % (loaded - start,
+                                                elapsed - (loaded - start)))
+    print("Positions/sec: %d" % (count / elapsed if elapsed > 0 else 0))
+
+    if args.compare:
+        from packed import read_positions
+        base = evaluate_batch(bitboards, turns, with_mobility=False)
+        start = time.perf_counter()
+        mismatches = 0
+        with open(args.packed_file, "rb") as source:
+            for index, position in enumerate(read_positions(source)):
+                if evaluate(position) != base[index]:
+                    mismatches += 1
+        elapsed = time.perf_counter() - start
+        print("One at a time positions/sec: %d (%d mismatches)" %
+              (count / elapsed if elapsed > 0 else 0, mismatches))
+
+    if args.scores:
+        np.savetxt(args.scores, scores, fmt="%d")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
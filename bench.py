@@ -0,0 +1,362 @@
+################################################################################
+# Benchmarks.
+################################################################################
+"""Times the rules, replay, move generation and board drawing, no display
+needed, and checks the numbers against a saved baseline.
+
+Benchmarks, each best of --repeat runs:
+    legal_move.<piece>     ChessPiece.legal_move calls/sec, the check
+                           clicks go through, every from square of that
+                           piece type to every square of a set of
+                           middlegame positions, cache cleared each
+                           position so its legal moves are generated once
+    legal_destinations     ChessPiece.legal_destinations calls/sec for
+                           every square of the same positions, cache
+                           cleared each position
+    is_move_valid.<piece>  ChessPiece.is_move_valid calls/sec on the same
+                           moves, cache cleared each position so each call
+                           works it out. The game doesn't use it; it is
+                           the reference implementation of the rules
+    is_check_or_mate       microseconds per call on the same positions,
+                           both colors, cache cleared each call
+    pgn_replay             moves/sec reading and replaying PGN games
+                           (seeded random games, made before timing)
+    perft.<position>.d<n>  nodes/sec of perft, node counts checked
+    draw_board             boards/sec of draw_board, draw_pieces and
+                           flush into an OffscreenCanvas
+    flush_move             frames/sec of making a move and flushing it
+
+    python bench.py --save baseline.json
+    python bench.py --compare baseline.json --threshold 0.1
+
+Compare mode flags every result more than threshold (a fraction) worse
+than the baseline's and exits with status 1 if there are any.
+"""
+import argparse
+import datetime
+import json
+import platform
+import random
+import sys
+import time
+
+from position import Position, piece_type
+from movegen import generate_legal_moves, perft
+from pgn import move_to_san, game_to_pgn, read_games, replay_game
+from main import ChessBoard, ChessPiece
+from instrument import PIECE_TYPE_NAMES
+from render import OffscreenCanvas
+
+MIDDLEGAME_FENS = (
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP3PPP/R2QKB1R w KQ - 0 8",
+    "r2q1rk1/1b2bppp/p2ppn2/1p6/3NP3/1BN1B3/PPP1QPPP/R4RK1 w - - 0 12",
+    "2r2rk1/pp1bqppp/2n1pn2/3p4/3P4/2PBPN2/P1Q2PPP/R1B2RK1 b - - 0 13",
+    "r1b1k2r/ppppqppp/2n2n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQK2R w KQkq - 0 6",
+    "rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3",
+)
+
+# (name, FEN, depth, nodes)
+PERFT_CASES = (
+    ("startpos", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     4, 197281),
+    ("kiwipete", MIDDLEGAME_FENS[0], 3, 97862),
+)
+
+# Times each short benchmark runs over its cases, so one timing is long
+# enough (tens of milliseconds) not to be mostly noise.
+ROUNDS = 20
+
+
+def _best_time(repeat, run):
+    """Least seconds run() took out of repeat calls."""
+    best = None
+    for index in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def _result(value, unit, higher_is_better=True):
+    return {"value": value, "unit": unit,
+            "higher_is_better": higher_is_better}
+
+
+def _rules(fen):
+    """ChessPiece on a display-less board set to fen."""
+    return ChessPiece(ChessBoard(None, 40, fen=fen))
+
+
+def _move_cases(ptype):
+    """(ChessPiece, [(from row, from col, to row, to col)]) of each of
+    MIDDLEGAME_FENS, from every square holding a piece of type ptype."""
+    cases = []
+    for fen in MIDDLEGAME_FENS:
+        pieces = _rules(fen)
+        mailbox = pieces.board.position.mailbox
+        pairs = [(sq >> 3, sq & 7, to_sq >> 3, to_sq & 7)
+                 for sq in range(64)
+                 if mailbox[sq] is not None and
+                 piece_type(mailbox[sq]) == ptype
+                 for to_sq in range(64) if to_sq != sq]
+        cases.append((pieces, pairs))
+    return cases
+
+
+def _bench_move_checks(repeat, method):
+    """Calls/sec of a ChessPiece move check for each piece type."""
+    results = {}
+    for ptype, name in enumerate(PIECE_TYPE_NAMES):
+        cases = _move_cases(ptype)
+        calls = ROUNDS*sum(len(pairs) for pieces, pairs in cases)
+
+        def run():
+            for index in range(ROUNDS):
+                for pieces, pairs in cases:
+                    pieces.cache.clear()
+                    check = getattr(pieces, method)
+                    for pair in pairs:
+                        check(*pair)
+        seconds = _best_time(repeat, run)
+        results[method + "." + name] = _result(calls / seconds, "calls/s")
+    return results
+
+
+def bench_legal_move(repeat):
+    """legal_move calls/sec for each piece type, and legal_destinations
+    calls/sec."""
+    results = _bench_move_checks(repeat, "legal_move")
+    cases = [_rules(fen) for fen in MIDDLEGAME_FENS]
+    calls = ROUNDS*64*len(cases)
+
+    def run():
+        for index in range(ROUNDS):
+            for pieces in cases:
+                pieces.cache.clear()
+                for sq in range(64):
+                    pieces.legal_destinations(sq >> 3, sq & 7)
+    seconds = _best_time(repeat, run)
+    results["legal_destinations"] = _result(calls / seconds, "calls/s")
+    return results
+
+
+def bench_is_move_valid(repeat):
+    """is_move_valid calls/sec for each piece type."""
+    return _bench_move_checks(repeat, "is_move_valid")
+
+
+def bench_is_check_or_mate(repeat):
+    """is_check_or_mate microseconds per call."""
+    cases = [_rules(fen) for fen in MIDDLEGAME_FENS]
+    calls = 2*len(cases)*ROUNDS*10
+
+    def run():
+        for pieces in cases:
+            for index in range(ROUNDS*10):
+                for color in ("white", "black"):
+                    pieces.cache.clear()
+                    pieces.is_check_or_mate(color)
+    seconds = _best_time(repeat, run)
+    return {"is_check_or_mate": _result(seconds / calls*1e6, "us/call",
+                                        False)}
+
+
+def make_games(count=40, max_plies=120, seed=1):
+    """PGN text of count seeded random games, and their total moves."""
+    rng = random.Random(seed)
+    texts = []
+    moves = 0
+    for game in range(count):
+        position = Position()
+        position.set_start_position()
+        sans = []
+        for ply in range(max_plies):
+            legal = list(generate_legal_moves(position))
+            if not legal:
+                break
+            move = rng.choice(legal)
+            sans.append(move_to_san(position, move))
+            position.make_move(move)
+        moves += len(sans)
+        texts.append(game_to_pgn({"Round": str(game + 1)}, sans))
+    return "\n".join(texts), moves
+
+
+def bench_pgn_replay(repeat):
+    """Moves/sec reading and replaying PGN games."""
+    text, moves = make_games()
+    lines = text.splitlines(True)
+
+    def run():
+        for game in read_games(lines):
+            replay_game(game)
+    seconds = _best_time(repeat, run)
+    return {"pgn_replay": _result(moves / seconds, "moves/s")}
+
+
+def bench_perft(repeat):
+    """perft nodes/sec of each of PERFT_CASES."""
+    results = {}
+    for name, fen, depth, expected in PERFT_CASES:
+        position = Position()
+        position.set_fen(fen)
+        counted = []
+        seconds = _best_time(repeat,
+                             lambda: counted.append(perft(position, depth)))
+        if counted[-1] != expected:
+            raise AssertionError("perft %s depth %d counted %d, not %d" %
+                                 (name, depth, counted[-1], expected))
+        results["perft.%s.d%d" % (name, depth)] = _result(
+            expected / seconds, "nodes/s")
+    return results
+
+
+def bench_draw_board(repeat):
+    """Headless board drawing: whole boards and single move frames."""
+    boards = 5*ROUNDS
+
+    def draw():
+        for index in range(boards):
+            board = ChessBoard(OffscreenCanvas(), 40,
+                               fen=MIDDLEGAME_FENS[index % 2])
+            board.draw_board()
+            board.draw_pieces()
+            board.flush()
+    draw_seconds = _best_time(repeat, draw)
+
+    board = ChessBoard(OffscreenCanvas(), 40, fen=MIDDLEGAME_FENS[0])
+    board.draw_board()
+    board.draw_pieces()
+    board.flush()
+    position = board.position
+    moves = list(generate_legal_moves(position))
+    frames = 2*len(moves)*ROUNDS
+
+    def flush_moves():
+        for index in range(ROUNDS):
+            for move in moves:
+                position.make_move(move)
+                board.draw_move(move)
+                board.flush()
+                position.unmake_move()
+                board.draw_move(move)
+                board.flush()
+    flush_seconds = _best_time(repeat, flush_moves)
+    return {"draw_board": _result(boards / draw_seconds, "boards/s"),
+            "flush_move": _result(frames / flush_seconds, "frames/s")}
+
+
+BENCHMARKS = (
+    ("legal_move", bench_legal_move),
+    ("is_move_valid", bench_is_move_valid),
+    ("is_check_or_mate", bench_is_check_or_mate),
+    ("pgn_replay", bench_pgn_replay),
+    ("perft", bench_perft),
+    ("draw_board", bench_draw_board),
+)
+
+
+def run_benchmarks(repeat=5, only=None, out=None):
+    """Runs the benchmarks.
+
+    Args:
+        repeat: Runs of each, the best is kept.
+        only: Names (from BENCHMARKS) to run, None for all.
+        out: File to write each result to as it comes, None for quiet.
+
+    Returns:
+        Baseline dict: {"created", "python", "platform", "results":
+        {name: {"value", "unit", "higher_is_better"}}}.
+    """
+    results = {}
+    for name, run in BENCHMARKS:
+        if only and name not in only:
+            continue
+        for result_name, result in sorted(run(repeat).items()):
+            results[result_name] = result
+            if out is not None:
+                out.write("%-28s %14.1f %s\n" % (result_name,
+                                                  result["value"],
+                                                  result["unit"]))
+                out.flush()
+    return {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results}
+
+
+def compare(baseline, current, threshold=0.1):
+    """Results of current set against baseline's.
+
+    Args:
+        baseline: Baseline dict from run_benchmarks (or its JSON file).
+        current: Baseline dict of this run.
+        threshold: Fraction worse than the baseline that is a regression.
+
+    Returns:
+        List of (name, baseline value, current value, change, regressed)
+        for the results in both. change is the fraction better (+) or
+        worse (-) than the baseline.
+    """
+    rows = []
+    old_results = baseline["results"]
+    for name, result in sorted(current["results"].items()):
+        old = old_results.get(name)
+        if old is None or not old["value"]:
+            continue
+        ratio = result["value"] / old["value"]
+        change = ratio - 1 if result["higher_is_better"] else 1 / ratio - 1
+        rows.append((name, old["value"], result["value"], change,
+                     change < -threshold))
+    return rows
+
+
+def main(argv=None):
+    """Command line benchmark run, save and compare."""
+    parser = argparse.ArgumentParser(description="Benchmark the rules, "
+                                                 "replay, perft and "
+                                                 "headless drawing.")
+    parser.add_argument("--save", metavar="FILE",
+                        help="write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="baseline JSON to check the results against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="fraction worse than the baseline that counts "
+                             "as a regression (default 0.1)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs of each benchmark, best kept (default 5)")
+    parser.add_argument("--only", nargs="+",
+                        choices=[name for name, run in BENCHMARKS],
+                        help="run just these benchmarks")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as source:
+            baseline = json.load(source)
+    current = run_benchmarks(args.repeat, args.only, sys.stdout)
+    if args.save:
+        with open(args.save, "w") as out:
+            json.dump(current, out, indent=2)
+            out.write("\n")
+    if baseline is None:
+        return 0
+
+    print()
+    print("%-28s %14s %14s %8s" % ("benchmark", "baseline", "now", "change"))
+    regressions = 0
+    for name, old, new, change, regressed in compare(baseline, current,
+                                                     args.threshold):
+        print("%-28s %14.1f %14.1f %+7.1f%%%s" % (
+            name, old, new, 100*change, "  REGRESSION" if regressed else ""))
+        regressions += regressed
+    print("%d regression%s beyond %.0f%%" % (
+        regressions, "" if regressions == 1 else "s", 100*args.threshold))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
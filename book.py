@@ -0,0 +1,250 @@
+################################################################################
+# Opening Book.
+################################################################################
+"""Opening book in a sorted file of fixed size records, read through mmap.
+
+Each 16 byte record is (Zobrist key, move, weight, count), big endian,
+sorted by key then move. A lookup is a binary search straight on the
+mapped file, so nothing is loaded up front and every process opening the
+same book shares one copy of it in the page cache.
+
+Run as a script to build a book from PGN games, or list a position's book
+moves:
+
+    python book.py build games.pgn book.bin --plies 16
+    python book.py probe book.bin --fen "FEN"
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+
+from position import Position, move_uci
+from movegen import generate_legal_moves
+from pgn import PGNError, read_games, san_to_move
+
+RECORD_SIZE = 16
+_RECORD = struct.Struct(">QHHI")
+_KEY = struct.Struct(">Q")
+
+
+class OpeningBook:
+    """Read only opening book file.
+
+    Attributes:
+        path: File name of the book.
+        entries: Number of records.
+        lookups: Number of moves() calls.
+        hits: Number of moves() calls that found book moves.
+    """
+
+    def __init__(self, path):
+        """Opens and maps a book file.
+
+        Args:
+            path: Book made by write_book.
+
+        Raises:
+            ValueError: The file size isn't a whole number of records.
+        """
+        self.path = path
+        self.lookups = 0
+        self.hits = 0
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size % RECORD_SIZE:
+            self._file.close()
+            raise ValueError("%s is not a book file" % path)
+        self.entries = size // RECORD_SIZE
+        # mmap can't map an empty file; an empty book just never hits.
+        self._map = b""
+        if size:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+    def close(self):
+        """Unmaps and closes the file."""
+        if self._map:
+            self._map.close()
+        self._map = b""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _lower_bound(self, key):
+        """Index of the first record with key at least key."""
+        low = 0
+        high = self.entries
+        data = self._map
+        unpack_from = _KEY.unpack_from
+        while low < high:
+            middle = (low + high) >> 1
+            if unpack_from(data, middle*RECORD_SIZE)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def moves(self, position):
+        """Book moves of position.
+
+        Moves that aren't legal in position (a key collision, or a book
+        built from bad games) are left out.
+
+        Returns:
+            List of (move, weight), empty if position is not in the book.
+        """
+        self.lookups += 1
+        key = position.key
+        index = self._lower_bound(key)
+        found = []
+        data = self._map
+        while index < self.entries:
+            record_key, move, weight, count = _RECORD.unpack_from(
+                data, index*RECORD_SIZE)
+            if record_key != key:
+                break
+            found.append((move, weight))
+            index += 1
+        if found:
+            legal = set(generate_legal_moves(position))
+            found = [(move, weight) for move, weight in found
+                     if move in legal]
+        if found:
+            self.hits += 1
+        return found
+
+    def choose_move(self, position, rng=random):
+        """Book move picked at random in proportion to weight.
+
+        Returns:
+            Move, None if position is not in the book.
+        """
+        found = self.moves(position)
+        total = sum(weight for move, weight in found)
+        if total <= 0:
+            return found[0][0] if found else None
+        pick = rng.randrange(total)
+        for move, weight in found:
+            pick -= weight
+            if pick < 0:
+                return move
+
+
+def collect_games(games, plies=16, counts=None):
+    """Counts how often each move was played in each position.
+
+    Args:
+        games: Iterable of PGNGame. Games that don't replay are skipped.
+        plies: Moves taken from the start of each game.
+        counts: Dict to add to, {(key, move): count}.
+
+    Returns:
+        (counts, games used).
+    """
+    if counts is None:
+        counts = {}
+    used = 0
+    for game in games:
+        if "FEN" in game.headers:
+            continue
+        position = Position()
+        position.set_start_position()
+        seen = []
+        try:
+            for san in game.sans[:plies]:
+                move = san_to_move(position, san)
+                seen.append((position.key, move))
+                position.make_move(move)
+        except PGNError:
+            continue
+        used += 1
+        for entry in seen:
+            counts[entry] = counts.get(entry, 0) + 1
+    return counts, used
+
+
+def write_book(path, counts, min_count=1):
+    """Writes a book file from move counts.
+
+    Weights are the counts scaled to fit 16 bits.
+
+    Args:
+        path: File to write.
+        counts: {(key, move): times played}, from collect_games.
+        min_count: Leave out moves played fewer times than this.
+
+    Returns:
+        Number of records written.
+    """
+    top = max(counts.values()) if counts else 1
+    scale = 65535.0 / top if top > 65535 else 1
+    written = 0
+    with open(path, "wb") as out:
+        for (key, move), count in sorted(counts.items()):
+            if count < min_count:
+                continue
+            weight = max(1, int(count*scale))
+            out.write(_RECORD.pack(key, move, weight, min(count, 0xFFFFFFFF)))
+            written += 1
+    return written
+
+
+def main(argv=None):
+    """Command line book building and probing."""
+    parser = argparse.ArgumentParser(description="Build or probe an opening "
+                                                 "book.")
+    commands = parser.add_subparsers(dest="command")
+    build = commands.add_parser("build", help="book from PGN files")
+    build.add_argument("pgn_files", nargs="+")
+    build.add_argument("book_file")
+    build.add_argument("--plies", type=int, default=16,
+                       help="moves from each game (default 16)")
+    build.add_argument("--min-count", type=int, default=1,
+                       help="leave out moves played fewer times")
+    probe = commands.add_parser("probe", help="list a position's book moves")
+    probe.add_argument("book_file")
+    probe.add_argument("--fen", help="position, default the starting one")
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error("give build or probe")
+
+    if args.command == "build":
+        start = time.perf_counter()
+        counts = {}
+        used = 0
+        for path in args.pgn_files:
+            with open(path, encoding="utf-8", errors="replace") as source:
+                counts, file_used = collect_games(read_games(source),
+                                                  args.plies, counts)
+            used += file_used
+        written = write_book(args.book_file, counts, args.min_count)
+        sys.stderr.write("Games: %d, positions/moves: %d, time %.2f s\n" %
+                         (used, written, time.perf_counter() - start))
+        return 0
+
+    position = Position()
+    if args.fen is None:
+        position.set_start_position()
+    else:
+        position.set_fen(args.fen)
+    with OpeningBook(args.book_file) as book:
+        found = book.moves(position)
+        total = sum(weight for move, weight in found)
+        for move, weight in sorted(found, key=lambda entry: -entry[1]):
+            print("%s %d %.1f%%" % (move_uci(move), weight,
+                                    100.0*weight / total))
+        if not found:
+            print("not in book")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
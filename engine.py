@@ -0,0 +1,722 @@
+################################################################################
+# Alpha-Beta Search Engine.
+################################################################################
+"""Lets the computer play a side.
+
+Iterative deepening principal variation search with a transposition table,
+quiescence search on captures, and move ordering by transposition table
+move, MVV-LVA for captures, killer moves and the history heuristic. Each
+search stops inside its time budget and reports nodes/sec and effective
+branching factor per iteration.
+
+A SearchControl lets another thread stop a search or give it a time limit
+part way through, which is how the game ponders on the player's turn.
+
+Run as a script to watch a search of the starting position:
+
+    python engine.py --time 2
+"""
+import argparse
+import sys
+import threading
+import time
+from array import array
+
+from position import Position, WHITE, PAWN, move_uci
+from movegen import generate_legal_moves
+from tt import TranspositionTable, EXACT, LOWER, UPPER
+
+INFINITE = 32000
+MATE = 30000
+MATE_BOUND = MATE - 1000   # scores beyond this are mates
+MAX_PLY = 64
+
+PIECE_VALUES = (100, 320, 330, 500, 900, 0)
+
+# Piece-square bonuses from white's side, laid out like the board on screen
+# (row 0 is the 8th rank). Black uses the same tables flipped.
+_PAWN_TABLE = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     10,  10,  20,  30,  30,  20,  10,  10,
+      5,   5,  10,  25,  25,  10,   5,   5,
+      0,   0,   0,  20,  20,   0,   0,   0,
+      5,  -5, -10,   0,   0, -10,  -5,   5,
+      5,  10,  10, -20, -20,  10,  10,   5,
+      0,   0,   0,   0,   0,   0,   0,   0)
+_KNIGHT_TABLE = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50)
+_BISHOP_TABLE = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20)
+_ROOK_TABLE = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+      5,  10,  10,  10,  10,  10,  10,   5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+      0,   0,   0,   5,   5,   0,   0,   0)
+_QUEEN_TABLE = (
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+     -5,   0,   5,   5,   5,   5,   0,  -5,
+      0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20)
+_KING_TABLE = (
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+     20,  20,   0,   0,   0,   0,  20,  20,
+     20,  30,  10,   0,   0,  10,  30,  20)
+PIECE_TABLES = (_PAWN_TABLE, _KNIGHT_TABLE, _BISHOP_TABLE, _ROOK_TABLE,
+                _QUEEN_TABLE, _KING_TABLE)
+
+# PIECE_SQUARE[piece][sq]: material plus square bonus, positive for white.
+PIECE_SQUARE = ([[PIECE_VALUES[ptype] + PIECE_TABLES[ptype][sq]
+                  for sq in range(64)] for ptype in range(6)] +
+                [[-PIECE_VALUES[ptype] - PIECE_TABLES[ptype][sq ^ 56]
+                  for sq in range(64)] for ptype in range(6)])
+
+# Moves with either of these flag bits set are captures or promotions.
+_TACTICAL = 0xC000
+_CAPTURE_BIT = 0x4000
+
+
+def evaluate(position):
+    """Static score of position for the side to move, in centipawns."""
+    score = 0
+    table = PIECE_SQUARE
+    for sq, piece in enumerate(position.mailbox):
+        if piece is not None:
+            score += table[piece][sq]
+    return score if position.turn == WHITE else -score
+
+
+def _score_to_tt(score, ply):
+    """Mate scores are stored as distance from the stored node."""
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def _score_from_tt(score, ply):
+    """Undoes _score_to_tt for a node ply plies from the root."""
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+
+class _Timeout(Exception):
+    """Raised inside the search when the time budget runs out."""
+
+
+class SearchControl:
+    """Time limit of a search that another thread can change or end while
+    the search runs.
+
+    A ponder search starts with no limit; when the opponent plays the
+    predicted move it is given one with set_time, and when they don't it
+    is ended with stop.
+
+    Attributes:
+        deadline: perf_counter time the search must stop by, None for no
+                  limit.
+        soft_deadline: perf_counter time after which no new iteration is
+                       started, None for no limit.
+    """
+
+    def __init__(self, think_time=None, stop_event=None):
+        """Inits control.
+
+        Args:
+            think_time: Seconds from now to search, None for no limit.
+            stop_event: Event that stops the search when set, e.g. a
+                        multiprocessing.Event shared with other processes.
+                        None for a new threading.Event.
+        """
+        self.deadline = None
+        self.soft_deadline = None
+        self._stopped = (stop_event if stop_event is not None else
+                         threading.Event())
+        if think_time:
+            self.set_time(think_time)
+
+    def set_time(self, think_time):
+        """Limits the search to think_time seconds from now. The next
+        iteration takes several times as long as the last one, so none is
+        started after half of it."""
+        now = time.perf_counter()
+        self.soft_deadline = now + think_time*0.5
+        self.deadline = now + think_time
+
+    def stop(self):
+        """Ends the search at its next time check."""
+        self._stopped.set()
+
+    def stopped(self):
+        """True once stop has been called."""
+        return self._stopped.is_set()
+
+    def out_of_time(self):
+        """True if the search must stop now."""
+        return self._stopped.is_set() or (
+            self.deadline is not None and time.perf_counter() > self.deadline)
+
+
+class SearchInfo:
+    """Result of one completed iterative deepening iteration.
+
+    Attributes:
+        depth: Depth searched.
+        move: Best move found.
+        score: Score for the side to move, centipawns or mate score.
+        nodes: Nodes searched so far in this search.
+        elapsed: Seconds since the search started.
+        pv: Principal variation, list of moves.
+        ebf: Effective branching factor, nodes of this iteration over
+             nodes of the one before. None for the first iteration.
+        book: True if move came from the opening book without a search.
+    """
+    __slots__ = ("depth", "move", "score", "nodes", "elapsed", "pv", "ebf",
+                 "book")
+
+    def __init__(self, depth, move, score, nodes, elapsed, pv, ebf,
+                 book=False):
+        self.book = book
+        self.depth = depth
+        self.move = move
+        self.score = score
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.pv = pv
+        self.ebf = ebf
+
+    @property
+    def nps(self):
+        """Nodes searched per second."""
+        return int(self.nodes / self.elapsed) if self.elapsed > 0 else 0
+
+    def score_text(self):
+        """'cp 35' or 'mate 3' (negative when being mated)."""
+        if self.score >= MATE_BOUND:
+            return "mate %d" % ((MATE - self.score + 1) // 2)
+        if self.score <= -MATE_BOUND:
+            return "mate %d" % -((MATE + self.score + 1) // 2)
+        return "cp %d" % self.score
+
+    def __str__(self):
+        if self.book:
+            return "book move %s time %.3f" % (move_uci(self.move),
+                                               self.elapsed)
+        return ("depth %d score %s nodes %d nps %d ebf %s time %.2f pv %s" %
+                (self.depth, self.score_text(), self.nodes, self.nps,
+                 "-" if self.ebf is None else "%.2f" % self.ebf,
+                 self.elapsed, " ".join(move_uci(move) for move in self.pv)))
+
+
+class Engine:
+    """Chooses moves by iterative deepening alpha-beta search.
+
+    Attributes:
+        think_time: Default seconds per move.
+        max_depth: Default deepest iteration.
+        tt: TranspositionTable shared by every search of this engine.
+        nodes: Nodes searched by the current or last search.
+        infos: SearchInfo of each iteration of the last search.
+    """
+
+    def __init__(self, think_time=1.0, max_depth=MAX_PLY, tt_megabytes=16,
+                 tt=None, book=None):
+        """Inits engine.
+
+        Args:
+            think_time: Default seconds per move. None for no time limit.
+            max_depth: Default deepest iteration.
+            tt_megabytes: Transposition table budget, if tt is not passed.
+            tt: TranspositionTable to use instead of making one.
+            book: OpeningBook to play from before searching, None for none.
+        """
+        self.think_time = think_time
+        self.max_depth = max_depth
+        self.tt = tt if tt is not None else TranspositionTable(tt_megabytes)
+        self.book = book
+        self.nodes = 0
+        self.infos = []
+        self.killers = [[0, 0] for ply in range(MAX_PLY + 1)]
+        self.history = [[0]*64 for piece in range(12)]
+        self._control = None
+        self._root_best = None
+
+    def choose_move(self, position):
+        """Best move for the side to move within think_time.
+
+        Returns:
+            Move, None if there are no legal moves.
+        """
+        info = self.search(position)
+        return info.move if info is not None else None
+
+    def search(self, position, think_time=None, max_depth=None,
+               on_iteration=None, control=None, first_depth=1):
+        """Searches position deeper and deeper until out of time or depth.
+
+        Position is searched in place and left as it was.
+
+        Args:
+            position: Position to search.
+            think_time: Seconds to search, default self.think_time.
+            max_depth: Deepest iteration, default self.max_depth.
+            on_iteration: Called with the SearchInfo of each finished
+                          iteration.
+            control: SearchControl another thread can stop or time the
+                     search with. When passed, think_time is not used.
+            first_depth: Depth of the first iteration.
+
+        Returns:
+            SearchInfo of the deepest finished iteration, None if the side
+            to move has no legal moves. A book move comes back at once with
+            book set and nothing searched.
+        """
+        if think_time is None:
+            think_time = self.think_time
+        if max_depth is None:
+            max_depth = self.max_depth
+        max_depth = min(max_depth, MAX_PLY)
+
+        start = time.perf_counter()
+        if control is None:
+            control = SearchControl(think_time)
+        self._control = control
+        self.nodes = 0
+        self.infos = []
+        if self.book is not None:
+            move = self.book.choose_move(position)
+            if move is not None:
+                return SearchInfo(0, move, 0, 0, time.perf_counter() - start,
+                                  [move], None, book=True)
+        self._new_search()
+
+        # The root moves are kept (and reordered) for the whole search, so
+        # they live in a 16 bit buffer.
+        root_moves = array("H", self._order(
+            position, list(generate_legal_moves(position)), 0, 0))
+        if not root_moves:
+            return None
+        root_height = len(position.undo_stack)
+        best = None
+        last_nodes = 0
+
+        for depth in range(first_depth, max_depth + 1):
+            nodes_before = self.nodes
+            self._root_best = None
+            try:
+                score, move = self._search_root(position, root_moves, depth)
+            except _Timeout:
+                while len(position.undo_stack) > root_height:
+                    position.unmake_move()
+                # Part of an iteration still counts if it found a better
+                # move; the previous best was searched first.
+                if self._root_best is not None and best is not None:
+                    move, score = self._root_best
+                    best = SearchInfo(best.depth, move, score, self.nodes,
+                                      time.perf_counter() - start,
+                                      [move], best.ebf)
+                break
+
+            iteration_nodes = self.nodes - nodes_before
+            ebf = iteration_nodes / last_nodes if last_nodes else None
+            last_nodes = iteration_nodes
+            elapsed = time.perf_counter() - start
+            best = SearchInfo(depth, move, score, self.nodes, elapsed,
+                              self._principal_variation(position, depth),
+                              ebf)
+            self.infos.append(best)
+            if on_iteration is not None:
+                on_iteration(best)
+
+            root_moves.remove(move)
+            root_moves.insert(0, move)
+            if len(root_moves) == 1 or abs(score) >= MATE_BOUND:
+                break
+            # The next iteration takes several times as long as this one,
+            # don't start it if it can't finish.
+            if (control.soft_deadline is not None and
+                    time.perf_counter() > control.soft_deadline):
+                break
+
+        if best is None:
+            best = SearchInfo(0, root_moves[0], 0, self.nodes,
+                              time.perf_counter() - start, [root_moves[0]],
+                              None)
+        return best
+
+    def analyse(self, position, lines=1, max_depth=None, control=None,
+                on_iteration=None):
+        """Best few lines of position, deeper and deeper.
+
+        Line n is the best line once the first moves of lines 1 to n-1
+        are left out, so each line after the first costs one more root
+        search and is only worked out when asked for. The opening book is
+        not used.
+
+        Args:
+            position: Position to analyse. It is left as it was.
+            lines: Number of best lines wanted (Multi-PV).
+            max_depth: Deepest iteration, default self.max_depth.
+            control: SearchControl to stop or time the analysis with,
+                     default think_time from now.
+            on_iteration: Called with the list of SearchInfo, best line
+                          first, of each finished depth.
+
+        Returns:
+            List of SearchInfo of the deepest finished depth, best line
+            first. Empty if the side to move has no legal moves.
+        """
+        if max_depth is None:
+            max_depth = self.max_depth
+        max_depth = min(max_depth, MAX_PLY)
+        start = time.perf_counter()
+        if control is None:
+            control = SearchControl(self.think_time)
+        self._control = control
+        self.nodes = 0
+        self._new_search()
+
+        root_moves = array("H", self._order(
+            position, list(generate_legal_moves(position)), 0, 0))
+        lines = min(lines, len(root_moves))
+        root_height = len(position.undo_stack)
+        found = []
+        for depth in range(1, max_depth + 1):
+            infos = []
+            remaining = array("H", root_moves)
+            try:
+                for line in range(lines):
+                    score, move = self._search_root(position, remaining,
+                                                    depth, line == 0)
+                    remaining.remove(move)
+                    position.make_move(move)
+                    pv = [move] + self._principal_variation(position,
+                                                            depth - 1)
+                    position.unmake_move()
+                    infos.append(SearchInfo(depth, move, score, self.nodes,
+                                            time.perf_counter() - start, pv,
+                                            None))
+            except _Timeout:
+                while len(position.undo_stack) > root_height:
+                    position.unmake_move()
+                break
+            found = infos
+            if on_iteration is not None:
+                on_iteration(infos)
+            # the next depth tries this depth's lines first
+            root_moves = array("H", [info.move for info in infos])
+            root_moves.extend(remaining)
+            if len(root_moves) == 1:
+                break
+            if (control.soft_deadline is not None and
+                    time.perf_counter() > control.soft_deadline):
+                break
+        return found
+
+    def _new_search(self):
+        """Ages the move ordering tables for a new search."""
+        self.killers = [[0, 0] for ply in range(MAX_PLY + 1)]
+        for row in self.history:
+            for sq in range(64):
+                row[sq] >>= 2
+        self.tt.new_search()
+
+    def _check_time(self):
+        if self._control.out_of_time():
+            raise _Timeout()
+
+    def _search_root(self, position, moves, depth, store=True):
+        """Searches every root move with a full window on the first.
+
+        Args:
+            store: False to leave the best move of moves out of the
+                   transposition table, when moves aren't all the root
+                   moves.
+
+        Returns:
+            (score, best move)
+        """
+        alpha = -INFINITE
+        beta = INFINITE
+        best_move = moves[0]
+        for index, move in enumerate(moves):
+            position.make_move(move)
+            if index == 0:
+                score = -self._search(position, depth - 1, -beta, -alpha, 1)
+            else:
+                score = -self._search(position, depth - 1, -alpha - 1,
+                                      -alpha, 1)
+                if score > alpha:
+                    score = -self._search(position, depth - 1, -beta,
+                                          -alpha, 1)
+            position.unmake_move()
+            if score > alpha:
+                alpha = score
+                best_move = move
+                self._root_best = (move, score)
+        if store:
+            self.tt.store(position.key, best_move, alpha, depth, EXACT)
+        return alpha, best_move
+
+    def _search(self, position, depth, alpha, beta, ply):
+        """Negamax alpha-beta with principal variation search.
+
+        Returns:
+            Score for the side to move.
+        """
+        if depth <= 0:
+            return self._quiesce(position, alpha, beta, ply)
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            self._check_time()
+        if position.halfmove_clock >= 100 or self._is_repetition(position):
+            return 0
+        if ply >= MAX_PLY:
+            return evaluate(position)
+
+        key = position.key
+        tt_move = 0
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_move, tt_score, tt_depth, bound = entry
+            if tt_depth >= depth:
+                tt_score = _score_from_tt(tt_score, ply)
+                if (bound == EXACT or
+                        (bound == LOWER and tt_score >= beta) or
+                        (bound == UPPER and tt_score <= alpha)):
+                    return tt_score
+
+        in_check = position.in_check()
+        if in_check:
+            depth += 1
+        moves = list(generate_legal_moves(position))
+        if not moves:
+            return -MATE + ply if in_check else 0
+
+        original_alpha = alpha
+        best_score = -INFINITE
+        best_move = 0
+        for index, move in enumerate(self._order(position, moves, tt_move,
+                                                 ply)):
+            position.make_move(move)
+            if index == 0:
+                score = -self._search(position, depth - 1, -beta, -alpha,
+                                      ply + 1)
+            else:
+                score = -self._search(position, depth - 1, -alpha - 1,
+                                      -alpha, ply + 1)
+                if alpha < score < beta:
+                    score = -self._search(position, depth - 1, -beta,
+                                          -alpha, ply + 1)
+            position.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        if not move & _TACTICAL:
+                            self._remember_quiet(position, move, depth, ply)
+                        break
+
+        if best_score >= beta:
+            bound = LOWER
+        elif best_score > original_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+        self.tt.store(key, best_move, _score_to_tt(best_score, ply), depth,
+                      bound)
+        return best_score
+
+    def _quiesce(self, position, alpha, beta, ply):
+        """Searches captures and promotions until the position is quiet.
+
+        When in check every evasion is searched instead, so mates at the
+        end of a line are seen.
+        """
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            self._check_time()
+        if ply >= MAX_PLY:
+            return evaluate(position)
+
+        in_check = position.in_check()
+        if in_check:
+            best_score = -INFINITE
+            moves = list(generate_legal_moves(position))
+            if not moves:
+                return -MATE + ply
+        else:
+            best_score = evaluate(position)
+            if best_score >= beta:
+                return best_score
+            if best_score > alpha:
+                alpha = best_score
+            moves = [move for move in generate_legal_moves(position)
+                     if move & _TACTICAL]
+
+        for move in self._order(position, moves, 0, ply):
+            position.make_move(move)
+            score = -self._quiesce(position, -beta, -alpha, ply + 1)
+            position.unmake_move()
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if score >= beta:
+                        break
+        return best_score
+
+    def _order(self, position, moves, tt_move, ply):
+        """Moves sorted best first: transposition table move, captures by
+        most valuable victim / least valuable attacker, promotions, killer
+        moves, then quiet moves by history score."""
+        mailbox = position.mailbox
+        killers = self.killers[ply]
+        history = self.history
+        scored = []
+        for move in moves:
+            if move == tt_move:
+                score = 10000000
+            elif move & _CAPTURE_BIT:
+                victim = mailbox[(move >> 6) & 63]
+                victim_value = PIECE_VALUES[victim % 6] if victim is not None \
+                    else PIECE_VALUES[PAWN]
+                score = 1000000 + victim_value*8 - mailbox[move & 63] % 6
+            elif move & _TACTICAL:
+                score = 900000
+            elif move == killers[0]:
+                score = 800000
+            elif move == killers[1]:
+                score = 700000
+            else:
+                score = history[mailbox[move & 63]][(move >> 6) & 63]
+            scored.append((score, move))
+        scored.sort(reverse=True)
+        return [move for score, move in scored]
+
+    def _remember_quiet(self, position, move, depth, ply):
+        """Updates killers and history for a quiet move that cut off."""
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        row = self.history[position.mailbox[move & 63]]
+        row[(move >> 6) & 63] += depth*depth
+        if row[(move >> 6) & 63] > 500000:
+            for piece_history in self.history:
+                for sq in range(64):
+                    piece_history[sq] >>= 1
+
+    def _is_repetition(self, position):
+        """True if position occurred before since the last capture or pawn
+        move."""
+        key = position.key
+        stack = position.undo_stack
+        # undo_stack[-n] holds the key before the nth last move.
+        last = min(position.halfmove_clock, len(stack))
+        for back in range(4, last + 1, 2):
+            if stack[-back][5] == key:
+                return True
+        return False
+
+    def expected_reply(self, position, info):
+        """Move the opponent is expected to answer info.move with, to
+        ponder on.
+
+        Args:
+            position: Position after info.move.
+            info: SearchInfo of the search that chose the move.
+
+        Returns:
+            Second move of the principal variation, else the transposition
+            table's move for position. None if neither is a legal move.
+        """
+        legal = set(generate_legal_moves(position))
+        if len(info.pv) >= 2 and info.pv[1] in legal:
+            return info.pv[1]
+        entry = self.tt.probe(position.key)
+        if entry is not None and entry[0] in legal:
+            return entry[0]
+        return None
+
+    def _principal_variation(self, position, depth):
+        """Best line read back out of the transposition table."""
+        pv = []
+        for ply in range(depth):
+            entry = self.tt.probe(position.key)
+            if entry is None or entry[0] == 0:
+                break
+            move = entry[0]
+            if move not in generate_legal_moves(position):
+                break
+            pv.append(move)
+            position.make_move(move)
+        for move in pv:
+            position.unmake_move()
+        return pv
+
+
+def main(argv=None):
+    """Command line search of the starting position."""
+    parser = argparse.ArgumentParser(description="Search a position and "
+                                                 "report each iteration.")
+    parser.add_argument("--time", type=float, default=2.0,
+                        help="seconds to search (default 2)")
+    parser.add_argument("--depth", type=int, default=MAX_PLY,
+                        help="deepest iteration")
+    parser.add_argument("--hash", type=int, default=16,
+                        help="transposition table megabytes (default 16)")
+    parser.add_argument("--book", help="opening book file")
+    args = parser.parse_args(argv)
+
+    position = Position()
+    position.set_start_position()
+    book = None
+    if args.book is not None:
+        from book import OpeningBook
+        book = OpeningBook(args.book)
+    engine = Engine(args.time, args.depth, args.hash, book=book)
+    info = engine.search(position, on_iteration=print)
+    if info is not None:
+        if info.book:
+            print(info)
+        print("bestmove %s" % move_uci(info.move))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
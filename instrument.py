@@ -0,0 +1,291 @@
+################################################################################
+# Instrumentation.
+################################################################################
+"""Opt in counters and histograms for the rules, the board and input.
+
+Nothing here runs until enable() is called. It swaps timing wrappers in
+for these methods of the classes in main.py, and disable() puts the
+originals back, so with instrumentation off the game runs exactly the
+code it always did:
+
+    ChessPiece.legal_move         legal_move.<piece type> / .illegal
+                                  counters, legal_move_us histogram
+    ChessPiece._legal_targets     legal_targets.hits / .misses counters
+                                  (MoveCache), movegen_us histogram of
+                                  the misses, which generate the moves
+    ChessPiece.is_check_or_mate   check_scans.<result> counters,
+                                  check_scan_us histogram
+    ChessBoard.flush              frames counter, draw_calls_per_frame
+                                  (canvas items changed) and flush_us
+                                  histograms
+    Input.onclick                 clicks.rendered / clicks.ignored
+                                  counters, click_to_render_us histogram
+    Input._computer_move_found    search_depth, search_ms and search_nps
+                                  histograms, search_errors counter,
+                                  ponder.* gauges
+
+Histograms keep count, total, min, max and power of two buckets, and
+report percentiles from the buckets. snapshot() returns all of it as a
+dict ready for json.dump; write_snapshot() writes it to a file.
+
+    import instrument
+    instrument.enable()
+    ...
+    instrument.write_snapshot("stats.json")
+"""
+import json
+import math
+import time
+
+PIECE_TYPE_NAMES = ("pawn", "knight", "bishop", "rook", "queen", "king")
+CHECK_RESULTS = ("none", "check", "mate")
+
+
+class Histogram:
+    """Distribution of observed values in power of two buckets.
+
+    Attributes:
+        count: Values observed.
+        total: Sum of the values.
+        low: Smallest value, None before the first.
+        high: Largest value, None before the first.
+        buckets: {k: values v with 2**(k-1) <= v < 2**k}, k 0 for v < 1.
+    """
+    __slots__ = ("count", "total", "low", "high", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.low = None
+        self.high = None
+        self.buckets = {}
+
+    def add(self, value):
+        """Records one value."""
+        self.count += 1
+        self.total += value
+        if self.low is None or value < self.low:
+            self.low = value
+        if self.high is None or value > self.high:
+            self.high = value
+        bucket = math.frexp(value)[1] if value >= 1 else 0
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the fraction point of the
+        values, capped at the largest value. None with no values."""
+        if not self.count:
+            return None
+        wanted = fraction*self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= wanted:
+                return min(2**bucket, self.high)
+        return self.high
+
+    def as_dict(self):
+        """Summary for JSON."""
+        return {"count": self.count,
+                "mean": self.total / self.count if self.count else None,
+                "min": self.low, "max": self.high,
+                "p50": self.percentile(0.5), "p90": self.percentile(0.9),
+                "p99": self.percentile(0.99),
+                "buckets": {"<%d" % 2**bucket: self.buckets[bucket]
+                            for bucket in sorted(self.buckets)}}
+
+
+class Stats:
+    """Counters, gauges and histograms by name.
+
+    Attributes:
+        counters: {name: int}, added to.
+        gauges: {name: value}, overwritten.
+        histograms: {name: Histogram}.
+        started: time.time() the stats started from.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    def count(self, name, amount=1):
+        """Adds amount to a counter."""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set(self, name, value):
+        """Sets a gauge."""
+        self.gauges[name] = value
+
+    def observe(self, name, value):
+        """Adds a value to a histogram."""
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.add(value)
+
+    def reset(self):
+        """Forgets everything recorded."""
+        self.__init__()
+
+    def snapshot(self):
+        """Everything recorded, as a dict ready for json.dump."""
+        return {"enabled": True,
+                "seconds": round(time.time() - self.started, 3),
+                "counters": dict(sorted(self.counters.items())),
+                "gauges": dict(sorted(self.gauges.items())),
+                "histograms": {name: self.histograms[name].as_dict()
+                               for name in sorted(self.histograms)}}
+
+
+# Stats being recorded, None while instrumentation is off.
+stats = None
+# (class, method name, original function) of each installed wrapper.
+_installed = []
+
+
+def _wrap_legal_move(original, stats):
+    def legal_move(self, from_row, from_col, to_row, to_col):
+        start = time.perf_counter()
+        move = original(self, from_row, from_col, to_row, to_col)
+        stats.observe("legal_move_us", (time.perf_counter() - start)*1e6)
+        if move is None:
+            stats.count("legal_move.illegal")
+        else:
+            piece = self.board.position.mailbox[from_row*8 + from_col]
+            stats.count("legal_move." + PIECE_TYPE_NAMES[piece % 6])
+        return move
+    return legal_move
+
+
+def _wrap_legal_targets(original, stats):
+    def _legal_targets(self):
+        misses = self.cache.misses
+        start = time.perf_counter()
+        targets = original(self)
+        if self.cache.misses != misses:
+            stats.observe("movegen_us", (time.perf_counter() - start)*1e6)
+            stats.count("legal_targets.misses")
+        else:
+            stats.count("legal_targets.hits")
+        return targets
+    return _legal_targets
+
+
+def _wrap_is_check_or_mate(original, stats):
+    def is_check_or_mate(self, color_move):
+        start = time.perf_counter()
+        result = original(self, color_move)
+        stats.observe("check_scan_us", (time.perf_counter() - start)*1e6)
+        stats.count("check_scans." + CHECK_RESULTS[result])
+        return result
+    return is_check_or_mate
+
+
+def _wrap_flush(original, stats):
+    def flush(self):
+        start = time.perf_counter()
+        changed = original(self)
+        if self.canvas is not None:
+            stats.observe("flush_us", (time.perf_counter() - start)*1e6)
+            stats.observe("draw_calls_per_frame", changed)
+            stats.count("frames")
+        return changed
+    return flush
+
+
+def _wrap_onclick(original, stats):
+    def onclick(self, x, y):
+        frames = stats.counters.get("frames", 0)
+        start = time.perf_counter()
+        original(self, x, y)
+        if stats.counters.get("frames", 0) != frames:
+            stats.observe("click_to_render_us",
+                          (time.perf_counter() - start)*1e6)
+            stats.count("clicks.rendered")
+        else:
+            stats.count("clicks.ignored")
+    return onclick
+
+
+def _wrap_computer_move_found(original, stats):
+    def _computer_move_found(self, key, info, error=None):
+        if error is not None:
+            stats.count("search_errors")
+        elif info is not None and not info.book:
+            stats.observe("search_depth", info.depth)
+            stats.observe("search_ms", info.elapsed*1000)
+            stats.observe("search_nps", info.nps)
+        original(self, key, info, error)
+        if self.ponder:
+            for name, value in self.ponder_stats().items():
+                stats.set("ponder." + name, value)
+        stats.set("clicks.dropped", self.dropped_clicks)
+    return _computer_move_found
+
+
+def enable(classes=None):
+    """Starts recording, installing the wrappers. Does nothing if already
+    on.
+
+    Input hooks its onclick when it is made, so enable before making the
+    game's objects.
+
+    Args:
+        classes: (ChessBoard, ChessPiece, Input) to instrument, default
+                 those of main.py. Pass them when main.py runs as
+                 __main__.
+
+    Returns:
+        The Stats being recorded.
+    """
+    global stats
+    if stats is not None:
+        return stats
+    if classes is None:
+        from main import ChessBoard, ChessPiece, Input
+    else:
+        ChessBoard, ChessPiece, Input = classes
+    stats = Stats()
+    for cls, name, wrap in (
+            (ChessPiece, "legal_move", _wrap_legal_move),
+            (ChessPiece, "_legal_targets", _wrap_legal_targets),
+            (ChessPiece, "is_check_or_mate", _wrap_is_check_or_mate),
+            (ChessBoard, "flush", _wrap_flush),
+            (Input, "onclick", _wrap_onclick),
+            (Input, "_computer_move_found", _wrap_computer_move_found)):
+        original = cls.__dict__[name]
+        _installed.append((cls, name, original))
+        setattr(cls, name, wrap(original, stats))
+    return stats
+
+
+def disable():
+    """Stops recording and puts the original methods back.
+
+    Returns:
+        The Stats recorded, None if it wasn't on.
+    """
+    global stats
+    for cls, name, original in reversed(_installed):
+        setattr(cls, name, original)
+    del _installed[:]
+    recorded = stats
+    stats = None
+    return recorded
+
+
+def snapshot():
+    """What has been recorded, as a dict ready for json.dump."""
+    if stats is None:
+        return {"enabled": False}
+    return stats.snapshot()
+
+
+def write_snapshot(path):
+    """Writes snapshot() to a JSON file."""
+    with open(path, "w") as out:
+        json.dump(snapshot(), out, indent=2)
+        out.write("\n")
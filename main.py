@@ -1,17 +1,35 @@
 ################################################################################
 # Chess Using Turtle Graphics.
+#   Importing this module doesn't start turtle. The rules (ChessPiece) and
+#   board model (ChessBoard with pen None) work without a display; the game
+#   window only opens from main() / running this file.
 ################################################################################
+import queue
+import threading
+import time
+
+from position import (Position, PIECE_SYMBOLS, COLOR_NAMES, PAWN, KNIGHT,
+                      BISHOP, ROOK, QUEEN, KING, KING_CASTLE, QUEEN_CASTLE,
+                      EP_CAPTURE, square, piece_type, move_from, move_to,
+                      move_flags, W_KING, W_QUEEN, W_ROOK, W_BISHOP,
+                      W_KNIGHT, W_PAWN, B_KING, B_QUEEN, B_ROOK, B_BISHOP,
+                      B_KNIGHT, B_PAWN)
+from attacks import (KNIGHT_ATTACKS, KING_ATTACKS, rook_attacks,
+                     bishop_attacks, queen_attacks)
+from movegen import generate_legal_moves
+from movecache import MoveCache
+
+
 class Chess:
     """Plays Chess Game. This initializes what needs to be done. However it is
     in the Input class that deals with driving the game.
     
     Attributes:
         board: Object of ChessBoard.
-        pen: Pen to Turtle.
         piece: Object of ChessPiece.
-        update: Update the screen after disabling tracer for faster draw.
         user_input: Object of Input.
-        window: Turtle Screen used for Input class to hook the mouse.
+        window: Turtle Screen used for Input class to hook the mouse. The
+                board draws on its canvas.
         mouse_x: x of mouse. If None, then haven't done anything yet.
         mouse_y: y of mouse. If None, then haven't done anything yet.
     """
@@ -19,17 +37,21 @@ class Chess:
 
     def __init__(self):
         import turtle
-        self.pen = turtle.Turtle()
         self.window = turtle.Screen()
-        self.board = ChessBoard(self.pen, Chess.SQUARE_SIZE)
+        turtle.tracer(0,0)
+        self.board = ChessBoard(self.window.getcanvas(), Chess.SQUARE_SIZE)
         self.piece = ChessPiece(self.board)
-        self.update = turtle.update
         self.user_input = Input(self.board, self.piece, self.window, 
                                 self.update)
-        turtle.tracer(0,0)
-        self.pen.speed(0)
-        self.pen.ht()
-        self.pen.pensize(.5)
+
+    def update(self):
+        """Flush the board's dirty squares and status, then show the frame.
+        
+        Called once at the end of each mouse click or computer move, so
+        everything that changed in between goes out together.
+        """
+        self.board.flush()
+        self.window.update()
 
     def _select_piece(self, row, col):
         self.board.select_piece(row, col)
@@ -39,12 +61,42 @@ class Chess:
         self.board.move_piece(frow, fcol, trow, tcol)
         self.update()
         
-    def run(self):
-        import time
+    def run(self, computer_color=None, think_time=1.0, fen=None,
+            book_path=None, ponder=False):
+        """Draws the board and starts the game.
+        
+        Args:
+            computer_color: "white" or "black" for the computer to play
+                            that side. None for two players.
+            think_time: Seconds the computer may think per move.
+            fen: FEN of the position to start from. None for the normal
+                 starting position.
+            book_path: Opening book file the computer plays from before
+                       it starts searching. None for no book.
+            ponder: True to let the computer think on its predicted reply
+                    during the player's turn.
+        """
         self.board.draw_board()
-        self.piece.start_at_beginning()
+        if fen == None:
+            self.piece.start_at_beginning()
+        else:
+            self.board.position.set_fen(fen)
+            self.board.draw_pieces()
+        self.user_input.start_turn()
         self.update()
 
+        if computer_color != None:
+            from engine import Engine
+            book = None
+            if book_path != None:
+                from book import OpeningBook
+                book = OpeningBook(book_path)
+            self.user_input.computer_color = computer_color
+            self.user_input.engine = Engine(think_time, book=book)
+            self.user_input.ponder = ponder
+            if computer_color == self.user_input.turn_color:
+                self.window.ontimer(self.user_input.play_computer_move, 1)
+
         # Listen for mousse clicks.
         self.window.listen()
 
@@ -53,14 +105,23 @@ class Chess:
 class ChessBoard:
     """Handles anything related to the chess board.
     
+    The board is drawn once as canvas items: a rectangle and a text item
+    per square, the notation and two status lines. After that nothing is
+    drawn directly. Changes only mark squares or status lines dirty, and
+    flush() reconfigures the items that actually changed, so the number
+    of canvas items stays the same however long the game goes on.
+    
     Attributes:
-        # Turtle Graphics Ability to Draw
-        pen: Turtle pen.
+        # Tk canvas the board is drawn on
+        canvas: Canvas (or turtle's ScrolledCanvas). None keeps the position
+                and draws nothing.
 
         # Colors
         border_color: Oak Brown (128, 101, 23).
         select_color: Blue (0, 0, 255).
         not_select_color: Black (0, 0, 0)
+        highlight_color: Light Blue (150, 190, 230), squares selected piece
+                         can move to.
         square_dark: Off Red (188, 23, 15).
         square_light: White (255, 255, 255).
 
@@ -73,8 +134,8 @@ class ChessBoard:
         square_side_size: Size of each individual side of a square on board.
 
         # Piece to Board DataStructure.
-        squares: 2 dimensional list representing each square on board.
-                       1st dimensional
+        position: Position the board is a view of. Square row*8 + col.
+                       row
                          0
                          1
                          2
@@ -83,82 +144,89 @@ class ChessBoard:
                          5
                          6
                          7
-                           0 1 2 3 4 5 6 7 2nd dimension
+                           0 1 2 3 4 5 6 7 col
+
+        # Rendering
+        selected: Square of the highlighted piece, None if none.
+        highlighted: Set of squares shown in highlight_color.
+        turn_text: Text of the turn line, e.g. "Turn: White".
+        check_text: Text of the check line, "" when not in check.
+        updates: Canvas item changes made by flush() so far.
     """
+    TAG = "chessboard"  # tag of every canvas item the board owns
 
-    def __init__(self, pen, square_side_size):
+    def __init__(self, canvas, square_side_size, fen=None):
         """Inits chess board attributes.
         
         Args:
-            pen: Object of turtle pen.
+            canvas: Tk canvas to draw on, such as turtle.Screen().getcanvas().
+                    None for a board that keeps the position but draws
+                    nothing (no display needed).
             square_side_size: Integer representing side of square.
-            squares: If pass, setup board with particular setup.
-                           This could be used for testing or for practice.
-            board_top_y: Chess Board top y coord.
-            board_lft_x: Chess Board left x coord.
+            fen: If passed, setup board with particular setup (FEN string).
+                 This could be used for testing or for practice.
         """
         self.border_color = (128, 101, 23)
         self.square_dark = (188, 100, 75)
         self.square_light = (255, 255, 255)
         self.not_select_color = (0, 0, 0)
         self.select_color = (0, 0, 255)
-        self.pen = pen
+        self.highlight_color = (150, 190, 230)
+        self.canvas = canvas
         self.next_square = square_side_size + 1
         self.board_side = square_side_size*8 + 7
         self.board_top_y = self.next_square*4
         self.board_lft_x = self.next_square*-4
         self.square_side_size = square_side_size
         self.border_size = square_side_size*1.2
-        self.squares = [[None for col in range(8)] for row in range(8)]
+        self.position = Position()
+        if fen != None:
+            self.position.set_fen(fen)
+        self.selected = None
+        self.highlighted = set()
+        self.turn_text = "Turn: White"
+        self.check_text = ""
+        self.updates = 0
+        self._font = ("Courier", round(square_side_size*.7), "normal")
+        self._square_items = None   # rectangle item per square
+        self._glyph_items = None    # text item per square
+        self._status_items = None   # {"turn": item, "check": item}
+        self._shown = [None]*64     # (glyph, color) each text item shows
+        self._shown_fill = [None]*64  # fill each rectangle shows
+        self._dirty = set()
+        self._dirty_status = set()
 
-    def _draw_square(self, left_x, top_y, side, color, fill):
-        """Draws a square at a given row, col on board.
-        
-        Args:
-            left_x: Left x of square.
-            top_y: Top y of square.
-            side: Square side.
-            color: Color tuple (r,g,b).
-            fill: True if fill.
-        """
-        self.pen.up()
-        self.pen.color(color)
-        self.pen.goto(left_x, top_y)
-        self.pen.down()
-        self.pen.fill(fill)
-        for i in range(4):
-            self.pen.forward(side)
-            self.pen.right(90)
-        self.pen.fill(False)
+    def _color(self, rgb):
+        """Tk color string of an (r,g,b) tuple of 0-255."""
+        return "#%02x%02x%02x" % rgb
 
-    def _goto_piece_xy(self, row, col, adjustment_x=0):
-        """Goto x,y based upon row,col to display piece.
+    def _text_xy(self, row, col, adjustment_x=0):
+        """Canvas x,y to put text at based upon row,col.
         
         Args:
             row: 1st dimension.
             col: 2nd dimension.
             adjustment_x: Fraction * square_side_size added to x.
         """
-        self.pen.up()
         x = (self.board_lft_x + col*(self.next_square) + 
              self.square_side_size*.05) + adjustment_x*self.square_side_size
         y = (self.board_top_y - row*(self.next_square) -
              self.square_side_size*.8)
-        self.pen.goto(x, y)
+        # Canvas y grows downward, turtle y upward.
+        return x, -y
 
-    def _put_chr_at(self, char, row, col, color, adjustment_x=0):
-        """Put piece on chess board or notation on border.
-        
-        Args:
-            char: Unicode of char.
-            row: 1st dimension location.
-            col: 2nd dimension location.
-            adjustment_x: Fraction * square_side_size added to x. (text)
-        """
-        self._goto_piece_xy(row, col, adjustment_x)
-        self.pen.color(color)
-        self.pen.write(char, font=("Courier", round(self.square_side_size*.7),
-                                   "normal"))
+    def _create_rect(self, left_x, top_y, side, color):
+        """New filled square item with turtle coord top left corner."""
+        return self.canvas.create_rectangle(
+            left_x, -top_y, left_x + side, -top_y + side,
+            fill=self._color(color), outline="", tags=ChessBoard.TAG)
+
+    def _create_text(self, text, row, col, color, adjustment_x=0):
+        """New text item placed at row, col like a piece or notation."""
+        x, y = self._text_xy(row, col, adjustment_x)
+        return self.canvas.create_text(
+            x, y, text=text, anchor="sw", font=self._font,
+            fill=self._color(color), tags=ChessBoard.TAG)
                                    
     def xy_to_rowcol(self, x, y):
         """Convert x,y to row,col on chess board.
@@ -175,66 +243,187 @@ class ChessBoard:
         return [row, col]
 
     def overwrite_board_square(self, row, col):
-        """Overwrite board with new square.
+        """Mark square to be drawn again on the next flush.
         
         Args:
             row: Row of board, 0-7 from top to bottom.
             col: Col of board, 0-7 from left to right.
         """
-        x = self.board_lft_x + col*self.next_square
-        y = self.board_top_y - row*self.next_square
-        color = self.square_light if (row+col)%2 == 0 else self.square_dark
-        self._draw_square(x, y, self.square_side_size, color, True)
+        self._dirty.add(square(row, col))
     
+    def piece_at(self, row, col):
+        """Piece code (see position.py) at row, col. None if square is
+        empty."""
+        return self.position.mailbox[square(row, col)]
+
     def put_piece(self, piece, row, col):
         """Put piece on chess board.
         
         Args:
-            piece: Unicode of chess piece.
+            piece: Piece code of chess piece.
             row: 1st dimension location.
             col: 2nd dimension location.
         """
-        self.squares[row][col] = piece
-        self._put_chr_at(piece, row, col, self.not_select_color, 0)
+        self.position.put_piece(piece, square(row, col))
+        self.overwrite_board_square(row, col)
+
+    def draw_pieces(self):
+        """Marks every square so the next flush shows the whole position."""
+        self._dirty.update(range(64))
 
     def draw_board(self):
-        """Draws border and board. No pieces are drawn."""
-        # Clears screen of all turtle drawings
-        self.pen.clear()
+        """Creates the board's canvas items, replacing any made before.
+        
+        Squares come out empty; the pieces and status show on the next
+        flush.
+        """
+        self._dirty.update(range(64))
+        self._dirty_status.update(("turn", "check"))
+        self._shown = [None]*64
+        self._shown_fill = [None]*64
+        if self.canvas == None:
+            return
 
-        # Draw border and fill everything.
-        self._draw_square(self.board_lft_x - self.border_size,
+        canvas = self.canvas
+        canvas.delete(ChessBoard.TAG)
+
+        # Border and light background showing between squares.
+        self._create_rect(self.board_lft_x - self.border_size,
                           self.board_top_y + self.border_size,
-                          self.board_side + 2*self.border_size, 
-                          self.border_color, True)
-
-        # Draw white squares of board.
-        self._draw_square(self.board_lft_x, self.board_top_y,
-                          self.board_side, self.square_light, True)
-                          
-        # Draw dark squares of board.
-        #   Automatically add a square side to x. 
-        #   Subtract that square side when row is odd.
-        for row in range(8):
-            x = self.board_lft_x + self.next_square - row%2*self.next_square
-            y = self.board_top_y - row*self.next_square
-            for col in range(4):
-                self._draw_square(x, y, self.square_side_size, self.square_dark,
-                                  True)
-                x += 2*self.next_square
+                          self.board_side + 2*self.border_size,
+                          self.border_color)
+        self._create_rect(self.board_lft_x, self.board_top_y,
+                          self.board_side, self.square_light)
+
+        # One rectangle and one text item per square, reused all game.
+        self._square_items = []
+        self._glyph_items = []
+        for sq in range(64):
+            row, col = sq >> 3, sq & 7
+            color = self.square_light if (row+col)%2 == 0 else self.square_dark
+            self._square_items.append(self._create_rect(
+                self.board_lft_x + col*self.next_square,
+                self.board_top_y - row*self.next_square,
+                self.square_side_size, color))
+            self._glyph_items.append(self._create_text(
+                "", row, col, self.not_select_color))
 
         # Draw Notation 1-8 on border.
         for row in range(8):
-            self._put_chr_at(chr(ord(str(8-row))), row, -1, (0,0,0), .2)
+            self._create_text(str(8-row), row, -1, (0,0,0), .2)
             
         # Draw Notation a-h on border.
         for col in range(8):
-            self._put_chr_at(chr(ord('a')+col), 8, col, (0,0,0), .2)
+            self._create_text(chr(ord('a')+col), 8, col, (0,0,0), .2)
             
-        # Draw White Turn.
-        self._put_chr_at("Turn: White", 9, 1, (0,0,0), .2)
+        # Turn and check lines, text filled in by flush.
+        self._status_items = {
+            "turn": self._create_text("", 9, 1, (0,0,0), .2),
+            "check": self._create_text("", 10, 3, (0,0,0), .2),
+        }
+
+    def set_highlights(self, squares):
+        """Highlight squares on the next flush, replacing the last ones.
+        
+        Args:
+            squares: Iterable of (row, col).
+        """
+        highlighted = set(square(row, col) for row, col in squares)
+        self._dirty.update(highlighted ^ self.highlighted)
+        self.highlighted = highlighted
+
+    def set_turn(self, color):
+        """Show whose turn it is on the next flush.
+        
+        Args:
+            color: "white" or "black".
+        """
+        text = "Turn: " + color.capitalize()
+        if text != self.turn_text:
+            self.turn_text = text
+            self._dirty_status.add("turn")
+
+    def set_check(self, text):
+        """Show text such as "Check" or "Checkmate" on the next flush.
+        
+        Args:
+            text: Check line text, "" to clear it.
+        """
+        if text != self.check_text:
+            self.check_text = text
+            self._dirty_status.add("check")
+
+    def flush(self):
+        """Bring the canvas items up to date with everything marked dirty.
+        
+        Items already showing the right glyph and color are left alone.
+        
+        Returns:
+            Number of canvas items changed.
+        """
+        dirty = self._dirty
+        dirty_status = self._dirty_status
+        if self.canvas == None or self._glyph_items == None:
+            dirty.clear()
+            dirty_status.clear()
+            return 0
+
+        itemconfigure = self.canvas.itemconfigure
+        mailbox = self.position.mailbox
+        shown = self._shown
+        shown_fill = self._shown_fill
+        changed = 0
+        for sq in dirty:
+            if sq in self.highlighted:
+                fill = self.highlight_color
+            elif (sq >> 3) + (sq & 7) & 1:
+                fill = self.square_dark
+            else:
+                fill = self.square_light
+            if shown_fill[sq] != fill:
+                shown_fill[sq] = fill
+                itemconfigure(self._square_items[sq], fill=self._color(fill))
+                changed += 1
+            piece = mailbox[sq]
+            glyph = "" if piece is None else PIECE_SYMBOLS[piece]
+            color = (self.select_color if sq == self.selected else
+                     self.not_select_color)
+            if shown[sq] != (glyph, color):
+                shown[sq] = (glyph, color)
+                itemconfigure(self._glyph_items[sq], text=glyph,
+                              fill=self._color(color))
+                changed += 1
+        for name in dirty_status:
+            text = self.turn_text if name == "turn" else self.check_text
+            itemconfigure(self._status_items[name], text=text)
+            changed += 1
+        dirty.clear()
+        dirty_status.clear()
+        self.updates += changed
+        return changed
+
+    def redraw_square(self, row, col):
+        """Mark square to show whatever piece position has on it."""
+        self.overwrite_board_square(row, col)
+
+    def draw_move(self, move):
+        """Mark the squares a move already made on position touched.
+        
+        Args:
+            move: 16 bit move (see position.encode_move).
+        """
+        from_sq = move_from(move)
+        to_sq = move_to(move)
+        squares = [from_sq, to_sq]
+        flags = move_flags(move)
+        if flags == EP_CAPTURE:
+            squares.append(square(from_sq >> 3, to_sq & 7))
+        elif flags == KING_CASTLE:
+            squares += [from_sq + 3, from_sq + 1]
+        elif flags == QUEEN_CASTLE:
+            squares += [from_sq - 4, from_sq - 1]
+        self._dirty.update(squares)
 
-    
     def move_piece(self, from_row, from_col, to_row, to_col):
         """Move from row,col to row,col.
         
@@ -250,18 +439,14 @@ class ChessBoard:
         Returns:
             False there was no piece at location.
         """
-        # Get piece from-square
-        piece = self.squares[from_row][from_col]
+        if self.piece_at(from_row, from_col) == None:
+            return False
         
-        # overwrite from-square and update board to relect nothing.
-        self.squares[from_row][from_col] = None
+        # Update board (including any pieces taken) and mark both squares.
+        self.position.move_piece(square(from_row, from_col),
+                                 square(to_row, to_col))
         self.overwrite_board_square(from_row, from_col)
-
-        # Overwrite to-square (including any pieces taken).
         self.overwrite_board_square(to_row, to_col)
-        self.put_piece(piece, to_row, to_col)
-        self.squares[to_row][to_col] =  piece
-        
         return True
 
     def select_piece(self, row, col):
@@ -272,12 +457,13 @@ class ChessBoard:
             col: Col a-h on board of piece.
             
         Returns:
-            A string representing the piece selected.
+            The piece code of the piece selected.
             None is returned if there is no piece at first selection or unselection.
         """
-        piece = self.squares[row][col]
+        piece = self.piece_at(row, col)
         if piece != None:
-            self._put_chr_at(piece, row, col, self.select_color)
+            self.selected = square(row, col)
+            self.overwrite_board_square(row, col)
         return piece
 
     def unselect_piece(self, row, col):
@@ -287,26 +473,33 @@ class ChessBoard:
             row: Row wanting to unselect.
             col: Col wanting to unselect.
         """
-        piece = self.squares[row][col]
+        if self.selected == square(row, col):
+            self.selected = None
         self.overwrite_board_square(row, col)
-        self._put_chr_at(piece, row, col, self.not_select_color)
 
 
 ################################################################################
 class ChessPiece:
-    """Checks valid moves of pieces."""
-    W_KING = u'♔'
-    W_QUEEN = u'♕'
-    W_ROOK = u'♖'
-    W_BISHOP = u'♗'
-    W_KNIGHT = u'♘'
-    W_PAWN = u'♙'
-    B_KING = u'♚'
-    B_QUEEN = u'♛'
-    B_ROOK = u'♜'
-    B_BISHOP = u'♝'
-    B_KNIGHT = u'♞'
-    B_PAWN = u'♟'
+    """Checks valid moves of pieces.
+    
+    Attributes:
+        board: Object of ChessBoard.
+        cache: MoveCache of legal moves, check status and is_move_valid
+               answers by position, with hit/miss counters.
+    """
+    # Piece codes; color is code // 6 and type code % 6.
+    W_KING = W_KING
+    W_QUEEN = W_QUEEN
+    W_ROOK = W_ROOK
+    W_BISHOP = W_BISHOP
+    W_KNIGHT = W_KNIGHT
+    W_PAWN = W_PAWN
+    B_KING = B_KING
+    B_QUEEN = B_QUEEN
+    B_ROOK = B_ROOK
+    B_BISHOP = B_BISHOP
+    B_KNIGHT = B_KNIGHT
+    B_PAWN = B_PAWN
     
     def __init__(self, chess_board):
         """Inits attributes.
@@ -315,47 +508,26 @@ class ChessPiece:
             chess_board: Object of ChessBoard.
         """
         self.board = chess_board
+        self.cache = MoveCache()
 
     def start_at_beginning(self):
         """Draw pieces at the beginning of game."""
-        b_pieces = [ChessPiece.B_ROOK, 
-                    ChessPiece.B_KNIGHT,
-                    ChessPiece.B_BISHOP,
-                    ChessPiece.B_QUEEN,
-                    ChessPiece.B_KING,
-                    ChessPiece.B_BISHOP,
-                    ChessPiece.B_KNIGHT,
-                    ChessPiece.B_ROOK]
-        w_pieces = [ChessPiece.W_ROOK, 
-                    ChessPiece.W_KNIGHT,
-                    ChessPiece.W_BISHOP,
-                    ChessPiece.W_QUEEN,
-                    ChessPiece.W_KING,
-                    ChessPiece.W_BISHOP,
-                    ChessPiece.W_KNIGHT,
-                    ChessPiece.W_ROOK]
-
-        for i in range(8):
-            self.board.put_piece(b_pieces[i], 0, i)
-            self.board.put_piece(ChessPiece.B_PAWN, 1, i)
-            self.board.put_piece(w_pieces[i], 7, i)
-            self.board.put_piece(ChessPiece.W_PAWN, 6, i)
+        self.board.position.set_start_position()
+        self.board.draw_pieces()
 
     def piece_color(self, piece):
         """Tells the color of the piece.
         
         Args:
-            piece: The unicode of the piece.
+            piece: The piece code of the piece.
             
         Returns:
             "white" is returned for white and "black" for black pieces.
             None is returned for blank piece.
         """
-        if piece == None:
+        if piece is None:
             return None
-        if ord(ChessPiece.W_KING) <= ord(piece) <= ord(ChessPiece.W_PAWN):
-            return "white"
-        return "black"
+        return COLOR_NAMES[piece // 6]
         
     def _is_taking_own_piece(self, from_row, from_col, to_row, to_col):
         """Trying to take own piece?
@@ -370,15 +542,14 @@ class ChessPiece:
             True if trying to take own piece.
         """
         # Get piece being moved
-        piece = self.board.squares[from_row][from_col]
-        piece_color = self.piece_color(piece)
+        position = self.board.position
+        piece = position.mailbox[square(from_row, from_col)]
+        if piece == None:
+            return False
         
         # is piece trying to take it's own piece?
-        to_piece = self.board.squares[to_row][to_col]
-        if to_piece != None:
-            if self.piece_color(to_piece) == piece_color:
-                return True
-        return False
+        to_sq = square(to_row, to_col)
+        return (position.occupied[piece // 6] >> to_sq) & 1 == 1
 
     def _any_piece_in_way(self, from_row, from_col, dr, dc, dm):
         """Is any pieces are in the way for bishop or rook like moves?
@@ -396,8 +567,11 @@ class ChessPiece:
         Return:
             True if valid move.
         """
+        occupied = self.board.position.all_occupied
+        sq = square(from_row, from_col)
+        step = dr*8 + dc
         for i in range(1, dm):
-            if self.board.squares[from_row+i*dr][from_col+i*dc] != None:
+            if (occupied >> (sq + i*step)) & 1:
                 return False
         return True
         
@@ -413,20 +587,10 @@ class ChessPiece:
         Return:
             True if valid move.
         """
-        # if not on same column or row
-        if ((from_row != to_row and from_col != to_col) or 
-            (from_row == to_row and from_col == to_col)):
-            return False
-        
-        # check if any pieces are in the way of destination
-        if from_row != to_row:
-            dc = 0
-            dr = 1 if to_row - from_row > 0 else -1
-        if from_col != to_col:
-            dr = 0
-            dc = 1 if to_col - from_col > 0 else -1
-        dm = abs(to_row - from_row)
-        return self._any_piece_in_way(from_row, from_col, dr, dc, dm)
+        # look up squares attacked from the table for this occupancy
+        attacked = rook_attacks(square(from_row, from_col),
+                                self.board.position.all_occupied)
+        return (attacked >> square(to_row, to_col)) & 1 == 1
 
     def _is_knight_move_valid(self, from_row, from_col, to_row, to_col):
         """Is move valid for a knight?
@@ -440,12 +604,9 @@ class ChessPiece:
         Return:
             True if valid move.
         """
-        # check for valid move
-        if ((abs(from_row - to_row) == 1 and abs(from_col - to_col) == 2) or
-            (abs(from_row - to_row) == 2 and abs(from_col - to_col) == 1)):
-            return True
-        return False
-        
+        attacked = KNIGHT_ATTACKS[square(from_row, from_col)]
+        return (attacked >> square(to_row, to_col)) & 1 == 1
+
     def _is_bishop_move_valid(self, from_row, from_col, to_row, to_col):
         """Is move valid for a bishop?
         
@@ -458,15 +619,10 @@ class ChessPiece:
         Return:
             True if valid move.
         """
-        # if not on same colored diagonal exit.
-        if abs(from_row - to_row) != abs(from_col - to_col):
-            return False
-        
-        # check if any pieces are in the way of destination
-        dr = 1 if to_row - from_row > 0 else -1
-        dc = 1 if to_col - from_col > 0 else -1
-        dm = abs(to_row - from_row)
-        return self._any_piece_in_way(from_row, from_col, dr, dc, dm)
+        # look up squares attacked from the table for this occupancy
+        attacked = bishop_attacks(square(from_row, from_col),
+                                  self.board.position.all_occupied)
+        return (attacked >> square(to_row, to_col)) & 1 == 1
 
     def _is_queen_move_valid(self, from_row, from_col, to_row, to_col):
         """Is move valid for a queen?
@@ -480,28 +636,11 @@ class ChessPiece:
         Return:
             True if valid move.
         """
-        # if not on same colored diagonal
-        if abs(from_row - to_row) != abs(from_col - to_col):
-            # if on same row? (like rook)
-            if from_row != to_row:
-                dc = 0
-                dr = 1 if to_row - from_row > 0 else -1
-            # elif on same col?
-            elif from_col != to_col:
-                dr = 0
-                dc = 1 if to_col - from_col > 0 else -1
-            else:
-                # if not on same col or row
-                return False
-        else:
-            # on same colored diagonal (moves like bishop)
-            dr = 1 if to_row - from_row > 0 else -1
-            dc = 1 if to_col - from_col > 0 else -1
+        # look up squares attacked from the table for this occupancy
+        attacked = queen_attacks(square(from_row, from_col),
+                                 self.board.position.all_occupied)
+        return (attacked >> square(to_row, to_col)) & 1 == 1
 
-        # check if any pieces are in the way of destination
-        dm = abs(to_row - from_row)
-        return self._any_piece_in_way(from_row, from_col, dr, dc, dm)
-    
     def _is_king_move_valid(self, from_row, from_col, to_row, to_col):
         """Is move valid for a king?
         
@@ -514,10 +653,9 @@ class ChessPiece:
         Return:
             True if valid move.
         """
-        if abs(to_row - from_row) <= 1 and abs(to_col - from_col) <= 1:
-            return True
-        return False
-        
+        attacked = KING_ATTACKS[square(from_row, from_col)]
+        return (attacked >> square(to_row, to_col)) & 1 == 1
+
     def _is_pawn_move_valid(self, from_row, from_col, to_row, to_col):
         """Is move valid for a pawn?
         
@@ -531,8 +669,9 @@ class ChessPiece:
             True if valid move.
         """
         # Setup variables used
-        piece = self.board.squares[from_row][from_col]
-        to_piece = self.board.squares[to_row][to_col]
+        position = self.board.position
+        piece = self.board.piece_at(from_row, from_col)
+        to_piece = position.mailbox[square(to_row, to_col)]
         row_diff = abs(from_row - to_row)
         col_diff = abs(from_col - to_col)
         dc = 0
@@ -575,6 +714,15 @@ class ChessPiece:
     def is_move_valid(self, from_row, from_col, to_row, to_col):
         """Is the piece attempting to move from - to valid?
         
+        Reference implementation of the pieces' movement rules (with
+        _is_piece_move_valid and the _is_*_move_valid methods). The game
+        doesn't call it: clicks are checked with legal_move and
+        legal_destinations, which use the move generator and also know
+        about check, castling and en passant. bench.py times this as the
+        is_move_valid.* results, not the game's hot path.
+        
+        Answers are remembered per position in self.cache.
+        
         Args:
             from_row: row of source square.
             from_col: col of source square.
@@ -584,73 +732,125 @@ class ChessPiece:
         Return:
             True if valid move.
         """
+        return self.cache.move_valid(
+            self.board.position, square(from_row, from_col),
+            square(to_row, to_col),
+            lambda: self._is_piece_move_valid(from_row, from_col,
+                                              to_row, to_col))
+
+    def _is_piece_move_valid(self, from_row, from_col, to_row, to_col):
+        """is_move_valid worked out from the piece's movement rules."""
         # check is taking own piece?
         if self._is_taking_own_piece(from_row, from_col, to_row, to_col):
             return False
 
-        piece = self.board.squares[from_row][from_col]
-        if piece == ChessPiece.W_ROOK or piece == ChessPiece.B_ROOK:
+        piece = self.board.position.mailbox[square(from_row, from_col)]
+        if piece == None:
+            return False
+        ptype = piece_type(piece)
+        if ptype == ROOK:
             return self._is_rook_move_valid(from_row, from_col, 
                                               to_row, to_col)
-        if piece == ChessPiece.W_KNIGHT or piece == ChessPiece.B_KNIGHT:
+        if ptype == KNIGHT:
             return self._is_knight_move_valid(from_row, from_col,
                                               to_row, to_col)
-        if piece == ChessPiece.W_BISHOP or piece == ChessPiece.B_BISHOP:
+        if ptype == BISHOP:
             return self._is_bishop_move_valid(from_row, from_col, 
                                               to_row, to_col)
-        if piece == ChessPiece.W_QUEEN or piece == ChessPiece.B_QUEEN:
+        if ptype == QUEEN:
             return self._is_queen_move_valid(from_row, from_col, 
                                              to_row, to_col)
-        if piece == ChessPiece.W_KING or piece == ChessPiece.B_KING:
+        if ptype == KING:
             return self._is_king_move_valid(from_row, from_col, 
                                             to_row, to_col)
-        if piece == ChessPiece.W_PAWN or piece == ChessPiece.B_PAWN:
+        if ptype == PAWN:
             return self._is_pawn_move_valid(from_row, from_col, 
                                             to_row, to_col)
                                             
-    def is_check_or_mate(self, color_move):
-        print("is_check_or_mate()")
-        """Is check of mate?
+    def _legal_targets(self):
+        """Legal moves of the side to move, as a dict of from square to
+        {to square: move}, from self.cache.
+        """
+        return self.cache.legal_targets(self.board.position)
+
+    def legal_destinations(self, row, col):
+        """Every square the piece at row, col can legally move to.
+        
+        Args:
+            row: row of source square.
+            col: col of source square.
+            
+        Return:
+            List of (row, col). Empty if it isn't the piece's turn.
+        """
+        moves = self._legal_targets().get(square(row, col), {})
+        return [(to_sq >> 3, to_sq & 7) for to_sq in sorted(moves)]
+
+    def are_moves_legal(self, moves):
+        """Is each of many candidate moves legal for the side to move?
+        
+        Args:
+            moves: Iterable of (from_row, from_col, to_row, to_col).
+            
+        Return:
+            List of True/False, one per move.
+        """
+        targets = self._legal_targets()
+        results = []
+        for from_row, from_col, to_row, to_col in moves:
+            to_squares = targets.get(square(from_row, from_col))
+            results.append(to_squares is not None and
+                           square(to_row, to_col) in to_squares)
+        return results
+
+    def legal_move(self, from_row, from_col, to_row, to_col):
+        """Legal move from - to for the side to move, including castling
+        and en passant. Pawns reaching the last row become queens.
         
         Args:
-            possible_squares: possible board squares[row][col]
-            color_move: color being moved.
             from_row: row of source square.
             from_col: col of source square.
             to_row: row of destination square.
             to_col: col of destination square.
             
+        Return:
+            16 bit move, None if not legal.
+        """
+        moves = self._legal_targets().get(square(from_row, from_col), {})
+        return moves.get(square(to_row, to_col))
+
+    def is_check_or_mate(self, color_move):
+        """Is check of mate?
+        
+        Args:
+            color_move: color being moved. Its opponent's king is tested.
+            
         Return:
             0 - not check or mate
             1 - check
             2 - check mate
         """
-        # Get all pieces of color_move and get opposing king
-        pieces = [] # a tuple (row,col) of where piece is located
-        krow = None # row of opposing king
-        kcol = None # col of opposing king
-        for row in range(8):
-            for col in range(8):
-                piece = self.board.squares[row][col]
-                if self.piece_color(piece) == color_move:
-                   pieces.append((row,col))
-                elif piece == ChessPiece.W_KING or piece == ChessPiece.B_KING:
-                    krow = row
-                    kcol = col
-
-        # Check if place in Check
-        num_piece_check = 0
-        return_result = 0
-        
-        for piece_rowcol in pieces:
-            frow, fcol = piece_rowcol
-            if self.is_move_valid(frow, fcol, krow, kcol):
-                num_piece_check += 1
-            if num_piece_check == 2:
-                break
-        if num_piece_check > 0:
-            return_result += 1
-        return return_result
+        position = self.board.position
+        defender = 1 - COLOR_NAMES.index(color_move)
+        king_sq = position.king_squares[defender]
+        if king_sq == None:
+            return 0
+
+        # The usual question, about the side to move, is cached.
+        if defender == position.turn:
+            return self.cache.check_status(position)
+
+        # Look outward from the king for attackers instead of trying every
+        # piece against it.
+        if not position.square_attacked_by(1 - defender, king_sq):
+            return 0
+
+        # Check mate if the side in check has no legal move at all.
+        turn = position.turn
+        position.turn = defender
+        any_move = next(generate_legal_moves(position), None) != None
+        position.turn = turn
+        return 1 if any_move else 2
 
 
 ################################################################################
@@ -660,12 +860,28 @@ class Input:
     Attributes:
         board: refers to ChessBoard object.
         pieces: refers to ChessPieces object.
-        update: Update draw. Needed because tracer(0,0) is used.
+        update: Flush the board's changes to the screen, once per click
+                or computer move.
         is_piece_selected: true if piece was selected.
         selected_row: row of selected piece.
         selected_col: col of selected piece.
         turn_color: color of player taking current turn.
         check_color: color of player in check.
+        game_over: True once a side has been check mated.
+        computer_color: color the engine plays, None if nobody.
+        engine: Engine choosing computer_color's moves.
+        worker: Worker the engine searches on, so the window keeps
+                responding while the computer thinks.
+        click_debounce: Seconds in which a second click on the same square
+                        is taken as a bounce and dropped.
+        dropped_clicks: Clicks dropped while thinking or as bounces.
+        thinking: True while the computer searches for the move it plays.
+        ponder: True to let the computer search the reply it expects
+                while the player is choosing a move.
+        ponder_hits: Player moves the computer had pondered on.
+        ponder_misses: Player moves it hadn't.
+        ponder_time_saved: Seconds of searching done before ponder hits,
+                           which the computer doesn't spend after them.
     """
     def __init__(self, chess_board, pieces, window, update):
         """Inits and setup keyboard input handlers.
@@ -684,10 +900,47 @@ class Input:
         self.selected_col = -1
         self.turn_color = "white"
         self.check_color = None
+        self.game_over = False
+        self.computer_color = None
+        self.engine = None
+        self.window = window
+        self.worker = Worker(window)
+        self.click_debounce = 0.15
+        self.dropped_clicks = 0
+        self._last_click = (None, 0.0)
+        self.thinking = False
+        self.ponder = False
+        self.ponder_hits = 0
+        self.ponder_misses = 0
+        self.ponder_time_saved = 0.0
+        self._ponder = None
         
         window.onclick(self.onclick)
+
+    def start_turn(self):
+        """Take turn and check status from the board's position, for a game
+        starting from any position."""
+        position = self.board.position
+        self.turn_color = COLOR_NAMES[position.turn]
+        self.board.set_turn(self.turn_color)
+        result = self.pieces.is_check_or_mate(COLOR_NAMES[1 - position.turn])
+        self.check_color = self.turn_color if result != 0 else None
+        self.game_over = result == 2
+        if result == 0:
+            self.board.set_check("")
+        else:
+            self.board.set_check("Checkmate" if self.game_over else "Check")
     
     def onclick(self, x, y):
+        # No more moves once the game has ended.
+        if self.game_over:
+            return
+
+        # Drop clicks while the computer is thinking or it is its move.
+        if self.thinking or self.turn_color == self.computer_color:
+            self.dropped_clicks += 1
+            return
+
         # Check to see if within board for x. Do nothing if not.
         board_x = x - self.board.board_lft_x
         if (board_x < 0 or
@@ -703,6 +956,16 @@ class Input:
         # Get the row, col from x, y.
         row, col = self.board.xy_to_rowcol(x, y)
 
+        # Drop a second click on the same square straight after the first
+        # (a bounce).
+        now = time.perf_counter()
+        last_square, last_time = self._last_click
+        self._last_click = ((row, col), now)
+        if (last_square == (row, col) and
+                now - last_time < self.click_debounce):
+            self.dropped_clicks += 1
+            return
+
         # if first time selecting piece
         if self.is_piece_selected == False:
             selected_piece = self.board.select_piece(row, col)
@@ -712,12 +975,13 @@ class Input:
             
             # if piece is not correct turn color then exit
             piece_color = self.pieces.piece_color(selected_piece)
-            if self.turn_color is not piece_color:
+            if self.turn_color != piece_color:
                 self.board.unselect_piece(row, col)
                 return
             
-            # update selected piece
-            print("update selected piece") # debug
+            # update selected piece and where it can go, in one flush
+            self.board.set_highlights(
+                self.pieces.legal_destinations(row, col))
             self.update() # update selected color in self.board.select_piece(row,col)
             self.is_piece_selected = True
             self.selected_row = row
@@ -728,6 +992,7 @@ class Input:
         # if new row,col is the same as selected one, then unselect
         if row == self.selected_row and col == self.selected_col:
             self.board.unselect_piece(row, col)
+            self.board.set_highlights(())
             self.update()
             self.is_piece_selected = False
             self.selected_row = -1
@@ -735,40 +1000,156 @@ class Input:
             return
         
         # (must have piece already selected and new location)
-        # check if valid move
-        if self.pieces.is_move_valid(self.selected_row, 
-                                     self.selected_col, row, col) == False:
+        # check if legal move, from the moves the highlight came from
+        move = self.pieces.legal_move(self.selected_row, self.selected_col,
+                                      row, col)
+        if move == None:
             return
-        
-        # if in check, check if move would get out of check
-        pass
-        
-        # save original board just in case can't move there
-        #  (because copy can't be imported in this version of python)
-        org_selected_row = self.selected_row
-        org_selected_col = self.selected_col
-        org_selected_piece = self.board.squares[self.selected_row][self.selected_col]
-        org_row = row
-        org_col = col
-        org_to_piece = self.board.squares[row][col]
+        self.board.position.make_move(move)
     
-        # move piece
-        self.board.move_piece(self.selected_row, self.selected_col, row, col)
-        print self.board.squares
-        self.update()
+        self.board.unselect_piece(self.selected_row, self.selected_col)
+        self.board.set_highlights(())
         self.is_piece_selected = False
         self.selected_row = -1
         self.selected_col = -1
+        self._finish_move(move)
+
+        # let computer reply once the human move is on screen
+        if not self.game_over and self.turn_color == self.computer_color:
+            self.window.ontimer(self.play_computer_move, 1)
+
+    def play_computer_move(self):
+        """Let the engine choose a move for computer_color on the worker
+        thread. The move is played by _computer_move_found once the
+        search is done.
+        
+        If the computer was pondering on the move just played, that search
+        carries on with what is left of its think time. Otherwise a ponder
+        search is stopped, and the real search starts once it has ended.
+        """
+        if (self.game_over or self.turn_color != self.computer_color or
+                self.thinking):
+            return
+        ponder = self._ponder
+        if ponder != None:
+            if ponder.key == self.board.position.key:
+                self._ponder_hit(ponder)
+                return
+            self.ponder_misses += 1
+            self._stop_ponder()
+        # wait for the stopped ponder search, it calls back here
+        if self.worker.busy:
+            return
+        # The search makes and unmakes moves, so it gets its own copy.
+        position = self.board.position.copy()
+        key = position.key
+        self.thinking = True
+        self.worker.submit(lambda: self.engine.search(position),
+                           lambda info, error:
+                           self._computer_move_found(key, info, error))
+
+    def _computer_move_found(self, key, info, error=None):
+        """Play the engine's move, back on the event loop thread.
+
+        If the search failed, the computer stops playing: the failure is
+        shown on the check line and the player moves for both sides.
+
+        Args:
+            key: Zobrist key of the position searched.
+            info: SearchInfo, None if there was no legal move.
+            error: Exception the search raised, None if it finished.
+        """
+        self.thinking = False
+        if error != None:
+            self._stop_ponder()
+            self.computer_color = None
+            self.board.set_check("Engine failed: %s" % type(error).__name__)
+            self.update()
+            return
+        # the board changed while the computer was thinking
+        if self.game_over or self.board.position.key != key:
+            return
+        # no legal move and not in check: stale mate
+        if info == None:
+            self.game_over = True
+            return
+        self.board.position.make_move(info.move)
+        self._finish_move(info.move)
+        self._start_ponder(info)
+
+    def _start_ponder(self, info):
+        """Search the position after the player's expected reply until
+        they move."""
+        if not self.ponder or self.game_over:
+            return
+        position = self.board.position.copy()
+        guess = self.engine.expected_reply(position, info)
+        if guess == None:
+            return
+        position.make_move(guess)
+        ponder = _Ponder(position.key)
+        self._ponder = ponder
+        self.worker.submit(
+            lambda: self.engine.search(position, control=ponder.control),
+            lambda info, error: self._ponder_done(ponder, info, error))
+
+    def _ponder_hit(self, ponder):
+        """The player made the pondered move: time the ponder search from
+        now with what is left of think_time, or play its move at once if
+        it is already done."""
+        pondered = time.perf_counter() - ponder.start
+        think_time = self.engine.think_time
+        self.ponder_hits += 1
+        self.ponder_time_saved += (min(pondered, think_time) if think_time
+                                   else pondered)
+        self.thinking = True
+        ponder.hit = True
+        if ponder.done:
+            self._ponder = None
+            self._computer_move_found(ponder.key, ponder.info, ponder.error)
+        elif think_time and pondered >= think_time:
+            ponder.control.stop()
+        elif think_time:
+            ponder.control.set_time(think_time - pondered)
+
+    def _ponder_done(self, ponder, info, error=None):
+        """A ponder search ended, back on the event loop thread."""
+        ponder.done = True
+        ponder.info = info
+        ponder.error = error
+        if ponder is not self._ponder:
+            # stopped by a miss: the real search can start now
+            self.play_computer_move()
+        elif ponder.hit:
+            self._ponder = None
+            self._computer_move_found(ponder.key, info, error)
+
+    def _stop_ponder(self):
+        """End the ponder search, if any, without using it."""
+        if self._ponder != None:
+            self._ponder.control.stop()
+            self._ponder = None
+
+    def ponder_stats(self):
+        """Ponder counters as a dict, the ponder.* gauges of instrument."""
+        moves = self.ponder_hits + self.ponder_misses
+        return {"hits": self.ponder_hits, "misses": self.ponder_misses,
+                "hit_rate": round(self.ponder_hits / moves, 4) if moves
+                            else 0.0,
+                "time_saved": round(self.ponder_time_saved, 3)}
+
+    def _finish_move(self, move):
+        """Draw a move already made on position, then update check status
+        and switch turns.
+        
+        Args:
+            move: 16 bit move just made.
+        """
+        # draw move
+        self.board.draw_move(move)
 
-        # if in check, check if move would get out of check
-        '''
-        result = self.pieces.is_check_or_mate("black" if self.turn_color == "white" else "white")
-        '''
         # if move would result in check or mate
-        '''
-        result = self.pieces.is_check_or_mate(self.turn_color,
-                                              self.selected_row, self.selected_col,
-                                              row, col)
+        result = self.pieces.is_check_or_mate(self.turn_color)
         # if not check
         if result == 0:
             self.check_color = None
@@ -780,31 +1161,152 @@ class Input:
         # if checkmate
         if result == 2:
             # end game
-            pass
-        '''
+            self.check_color = "black" if self.turn_color == "white" else "white"
+            self.game_over = True
 
         # switch player        
         self.turn_color = "black" if self.turn_color == "white" else "white"
         
         # display turn before next selected piece begins
-        if self.turn_color == "white":
-            self.board._put_chr_at("Turn: Black", 9, 1, (255,255,255), .2)
-            self.board._put_chr_at("Turn: White", 9, 1, (0,0,0), .2)
-        else:
-            self.board._put_chr_at("Turn: White", 9, 1, (255,255,255), .2)
-            self.board._put_chr_at("Turn: Black", 9, 1, (0,0,0), .2)
+        self.board.set_turn(self.turn_color)
             
         # if turn to move is in check
         if self.turn_color == self.check_color:
-            self.board._put_chr_at("Check", 10, 3, (0,0,0), .2)
+            self.board.set_check("Checkmate" if self.game_over else "Check")
         else:
-            self.board._put_chr_at("Check", 10, 3, (255,255,255), .2)
+            self.board.set_check("")
             
+        # one flush for the move and the status together
         self.update()
+        if self.game_over:
+            self._stop_ponder()
+
+################################################################################
+class Worker:
+    """Runs slow work on a background thread so the Tk event loop never
+    waits on it.
+
+    Tk may only be touched from the thread running its event loop, so the
+    worker thread never calls back into the board. Finished results go on
+    a queue, and the event loop picks them up by polling with
+    window.ontimer, calling each job's done() on its own thread.
+
+    Attributes:
+        window: Turtle screen whose ontimer polls for results.
+        poll_ms: Milliseconds between polls while a job is running.
+        busy: True from submit() until the job's done() is called.
+    """
+    def __init__(self, window, poll_ms=20):
+        """Inits attributes.
+
+        Args:
+            window: Turtle screen (anything with ontimer(fun, ms)).
+            poll_ms: Milliseconds between polls for a finished job.
+        """
+        self.window = window
+        self.poll_ms = poll_ms
+        self.busy = False
+        self._results = queue.Queue()
+
+    def submit(self, work, done):
+        """Start work() on a new daemon thread.
+
+        Args:
+            work: Called with no arguments on the worker thread. It must not
+                  touch the board, the canvas or anything the event loop
+                  changes; give it its own copies.
+            done: Called on the event loop thread as done(result, error):
+                  work's result and None, or None and the exception work
+                  raised.
+
+        Returns:
+            False, and nothing is started, if a job is already running.
+        """
+        if self.busy:
+            return False
+        self.busy = True
+        thread = threading.Thread(target=self._run, args=(work, done),
+                                  daemon=True)
+        thread.start()
+        self.window.ontimer(self._poll, self.poll_ms)
+        return True
+
+    def _run(self, work, done):
+        try:
+            self._results.put((done, work(), None))
+        except Exception as error:
+            self._results.put((done, None, error))
+
+    def _poll(self):
+        try:
+            done, result, error = self._results.get_nowait()
+        except queue.Empty:
+            self.window.ontimer(self._poll, self.poll_ms)
+            return
+        self.busy = False
+        done(result, error)
+
+
+class _Ponder:
+    """One ponder search: the position after the expected reply, and how
+    far the search on it has got."""
+    __slots__ = ("key", "control", "start", "hit", "done", "info", "error")
+
+    def __init__(self, key):
+        from engine import SearchControl
+        self.key = key
+        self.control = SearchControl()
+        self.start = time.perf_counter()
+        self.hit = False
+        self.done = False
+        self.info = None
+        self.error = None
+
 
 ################################################################################
 # Run the Game.
 #print "\x1b[30m \x1b[0m"
-chess = Chess()
-chess.run()
+def main(argv=None):
+    """Opens the turtle window and plays.
+    
+    Args:
+        argv: Command line arguments, default sys.argv[1:].
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description="Chess using turtle "
+                                                 "graphics.")
+    parser.add_argument("computer_color", nargs="?",
+                        choices=["white", "black"],
+                        help="let the computer play this color")
+    parser.add_argument("--think-time", type=float, default=1.0,
+                        help="seconds the computer thinks per move")
+    parser.add_argument("--fen", help="start from this position")
+    parser.add_argument("--book", help="opening book file for the computer")
+    parser.add_argument("--ponder", action="store_true",
+                        help="let the computer think during your turn")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="record counters and timings, and write them "
+                             "to FILE as JSON when the window closes")
+    args = parser.parse_args(argv)
+    if args.fen != None:
+        try:
+            Position().set_fen(args.fen)
+        except ValueError as error:
+            parser.error(str(error))
+
+    if args.stats != None:
+        import instrument
+        instrument.enable((ChessBoard, ChessPiece, Input))
+
+    import turtle
+    chess = Chess()
+    chess.run(args.computer_color, args.think_time, args.fen, args.book,
+              args.ponder)
+    turtle.mainloop()
+    if args.stats != None:
+        instrument.write_snapshot(args.stats)
+
+
+if __name__ == "__main__":
+    main()
 
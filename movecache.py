@@ -0,0 +1,137 @@
+################################################################################
+# Move Cache.
+################################################################################
+"""Remembers legal moves, check status and move checks per position.
+
+Positions are keyed by their Zobrist key, so a position reached again by a
+take back, a transposition or a replay is answered without generating
+anything. The cache holds a fixed number of positions and forgets the
+least recently used one when full.
+"""
+from collections import OrderedDict
+
+from movegen import generate_legal_moves
+
+
+class _Entry:
+    """What is known about one position so far."""
+    __slots__ = ("targets", "status", "valid")
+
+    def __init__(self):
+        self.targets = None    # {from square: {to square: move}}
+        self.status = None     # 0 not in check, 1 check, 2 check mate
+        self.valid = {}        # from | to << 6 -> is_move_valid answer
+
+
+class MoveCache:
+    """LRU cache of per position move answers.
+
+    Attributes:
+        max_positions: Positions kept before the oldest is evicted.
+        hits: Queries answered from the cache.
+        misses: Queries that had to be worked out.
+        evictions: Positions dropped to make room.
+    """
+
+    def __init__(self, max_positions=4096):
+        """Inits an empty cache.
+
+        Args:
+            max_positions: Most positions remembered at once.
+        """
+        self.max_positions = max_positions
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Forgets every position and resets the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hit_rate(self):
+        """Fraction of queries answered from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _entry(self, key):
+        """Entry of a key, made (evicting if full) if not there, and marked
+        most recently used."""
+        entries = self._entries
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = _Entry()
+            if len(entries) > self.max_positions:
+                entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            entries.move_to_end(key)
+        return entry
+
+    def legal_targets(self, position):
+        """Legal moves of the side to move as {from square: {to square:
+        move}}, keeping only the queen of the four promotions. Don't change
+        the dicts returned."""
+        entry = self._entry(position.key)
+        if entry.targets is not None:
+            self.hits += 1
+            return entry.targets
+        self.misses += 1
+        targets = {}
+        for move in generate_legal_moves(position):
+            moves = targets.setdefault(move & 63, {})
+            to_sq = (move >> 6) & 63
+            if to_sq not in moves or move > moves[to_sq]:
+                moves[to_sq] = move
+        entry.targets = targets
+        return targets
+
+    def check_status(self, position):
+        """0 if the side to move is not in check, 1 if in check, 2 if
+        check mated."""
+        entry = self._entry(position.key)
+        if entry.status is not None:
+            self.hits += 1
+            return entry.status
+        self.misses += 1
+        if not position.in_check():
+            status = 0
+        elif entry.targets is not None:
+            status = 1 if entry.targets else 2
+        else:
+            status = 1 if next(generate_legal_moves(position), None) \
+                is not None else 2
+        entry.status = status
+        return status
+
+    def move_valid(self, position, from_sq, to_sq, compute):
+        """Cached answer of a move check.
+
+        Args:
+            position: Position the move is checked in.
+            from_sq: From square.
+            to_sq: To square.
+            compute: Called with no arguments to work out the answer on a
+                     miss.
+        """
+        valid = self._entry(position.key).valid
+        index = from_sq | (to_sq << 6)
+        result = valid.get(index)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = valid[index] = compute()
+        return result
+
+    def stats(self):
+        """Counters as a dict, for printing or JSON."""
+        return {"positions": len(self._entries), "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": round(self.hit_rate(), 4)}
@@ -0,0 +1,321 @@
+################################################################################
+# Legal Move Generation.
+################################################################################
+"""Generates every legal move of a position, and perft to check it.
+
+Run as a script to count perft nodes from the starting position or any
+FEN:
+
+    python movegen.py 4 --divide
+    python movegen.py 3 --fen "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"
+"""
+import argparse
+import sys
+import time
+
+from position import (Position, WHITE, PAWN, KNIGHT, BISHOP, ROOK,
+                      QUEEN, FULL, WHITE_OO, WHITE_OOO, BLACK_OO,
+                      BLACK_OOO, QUIET, DOUBLE_PUSH, KING_CASTLE,
+                      QUEEN_CASTLE, CAPTURE, EP_CAPTURE, PROMOTION,
+                      PROMO_CAPTURE, move_uci, iter_squares)
+from attacks import (KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, BETWEEN,
+                     LINE, rook_attacks, bishop_attacks, attackers_to)
+
+# Known node counts from the starting position, by depth.
+START_PERFT = {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609,
+               6: 119060324}
+
+# Per color: (right, king from, king to, rook square, must be empty,
+#             squares king crosses, flags)
+_CASTLES = (
+    ((WHITE_OO, 60, 62, 63, (1 << 61) | (1 << 62), (61, 62), KING_CASTLE),
+     (WHITE_OOO, 60, 58, 56, (1 << 57) | (1 << 58) | (1 << 59), (59, 58),
+      QUEEN_CASTLE)),
+    ((BLACK_OO, 4, 6, 7, (1 << 5) | (1 << 6), (5, 6), KING_CASTLE),
+     (BLACK_OOO, 4, 2, 0, (1 << 1) | (1 << 2) | (1 << 3), (3, 2),
+      QUEEN_CASTLE)),
+)
+
+
+def _pawn_moves(from_sq, to_sq, flags):
+    """Yields a pawn move, or all four promotions when it reaches the end."""
+    if to_sq < 8 or to_sq >= 56:
+        flags = PROMO_CAPTURE if flags == CAPTURE else PROMOTION
+        for promotion in range(4):
+            yield from_sq | (to_sq << 6) | ((flags + promotion) << 12)
+    else:
+        yield from_sq | (to_sq << 6) | (flags << 12)
+
+
+def generate_legal_moves(position):
+    """Yields every legal move of the side to move.
+
+    Handles pins, checks, castling, en passant and promotion directly,
+    so nothing yielded has to be played to test for leaving the king in
+    check.
+
+    Args:
+        position: Position to generate moves from.
+
+    Yields:
+        16 bit moves (see position.encode_move).
+    """
+    us = position.turn
+    them = us ^ 1
+    pieces = position.pieces
+    occupied = position.all_occupied
+    own = position.occupied[us]
+    enemy = position.occupied[them]
+    not_own = FULL ^ own
+    base = us*6
+    enemy_base = them*6
+    enemy_queens = pieces[enemy_base + QUEEN]
+    enemy_rooks = pieces[enemy_base + ROOK] | enemy_queens
+    enemy_bishops = pieces[enemy_base + BISHOP] | enemy_queens
+
+    king_sq = position.king_squares[us]
+    checkers = attackers_to(position, king_sq, them)
+
+    # King moves. Take the king off the board so it can't hide behind itself.
+    without_king = occupied ^ (1 << king_sq)
+    for to_sq in iter_squares(KING_ATTACKS[king_sq] & not_own):
+        if not attackers_to(position, to_sq, them, without_king):
+            flags = CAPTURE if (enemy >> to_sq) & 1 else QUIET
+            yield king_sq | (to_sq << 6) | (flags << 12)
+
+    # Double check. Only the king can move.
+    if checkers & (checkers - 1):
+        return
+
+    if checkers:
+        target = BETWEEN[king_sq][checkers.bit_length() - 1] | checkers
+    else:
+        target = FULL
+        for (right, king_from, king_to, rook_sq, empty, crossed,
+             flags) in _CASTLES[us]:
+            if (position.castling & right and king_sq == king_from and
+                    position.mailbox[rook_sq] == base + ROOK and
+                    not occupied & empty):
+                for sq in crossed:
+                    if attackers_to(position, sq, them):
+                        break
+                else:
+                    yield king_from | (king_to << 6) | (flags << 12)
+
+    # Pinned pieces. Slide out from the king through own pieces only.
+    pinned = 0
+    snipers = ((rook_attacks(king_sq, enemy) & enemy_rooks) |
+               (bishop_attacks(king_sq, enemy) & enemy_bishops))
+    for sniper_sq in iter_squares(snipers):
+        blockers = BETWEEN[king_sq][sniper_sq] & occupied
+        if blockers and not blockers & (blockers - 1):
+            pinned |= blockers & own
+    line = LINE[king_sq]
+
+    # Knights. A pinned knight can never move.
+    for from_sq in iter_squares(pieces[base + KNIGHT] & ~pinned):
+        for to_sq in iter_squares(KNIGHT_ATTACKS[from_sq] & not_own & target):
+            flags = CAPTURE if (enemy >> to_sq) & 1 else QUIET
+            yield from_sq | (to_sq << 6) | (flags << 12)
+
+    # Sliders. A pinned slider may only move along the pin.
+    queens = pieces[base + QUEEN]
+    for slide, sliders in ((bishop_attacks, pieces[base + BISHOP] | queens),
+                           (rook_attacks, pieces[base + ROOK] | queens)):
+        for from_sq in iter_squares(sliders):
+            moves = slide(from_sq, occupied) & not_own & target
+            if (pinned >> from_sq) & 1:
+                moves &= line[from_sq]
+            for to_sq in iter_squares(moves):
+                flags = CAPTURE if (enemy >> to_sq) & 1 else QUIET
+                yield from_sq | (to_sq << 6) | (flags << 12)
+
+    # Pawns.
+    if us == WHITE:
+        push = -8
+        start_row_low, start_row_high = 48, 55
+    else:
+        push = 8
+        start_row_low, start_row_high = 8, 15
+    ep_square = position.ep_square
+    pawn_attacks = PAWN_ATTACKS[us]
+    for from_sq in iter_squares(pieces[base + PAWN]):
+        allowed = target
+        if (pinned >> from_sq) & 1:
+            allowed &= line[from_sq]
+
+        to_sq = from_sq + push
+        if not (occupied >> to_sq) & 1:
+            if (allowed >> to_sq) & 1:
+                for move in _pawn_moves(from_sq, to_sq, QUIET):
+                    yield move
+            if start_row_low <= from_sq <= start_row_high:
+                to_sq += push
+                if not (occupied >> to_sq) & 1 and (allowed >> to_sq) & 1:
+                    yield from_sq | (to_sq << 6) | (DOUBLE_PUSH << 12)
+
+        for to_sq in iter_squares(pawn_attacks[from_sq] & enemy & allowed):
+            for move in _pawn_moves(from_sq, to_sq, CAPTURE):
+                yield move
+
+        if ep_square is not None and (pawn_attacks[from_sq] >> ep_square) & 1:
+            taken_sq = ep_square - push
+            if checkers and not (checkers >> taken_sq) & 1 and \
+                    not (target >> ep_square) & 1:
+                continue
+            # Both pawns leave their squares at once, which can uncover
+            # the king along a row, so test the sliders directly.
+            after = (occupied ^ (1 << from_sq) ^ (1 << taken_sq) |
+                     (1 << ep_square))
+            if (rook_attacks(king_sq, after) & enemy_rooks or
+                    bishop_attacks(king_sq, after) & enemy_bishops):
+                continue
+            yield from_sq | (ep_square << 6) | (EP_CAPTURE << 12)
+
+
+def is_insufficient_material(position):
+    """True if neither side has mating material: bare kings, or kings with
+    a single knight or bishop, or with bishops all on one square color."""
+    pieces = position.pieces
+    if (pieces[PAWN] | pieces[ROOK] | pieces[QUEEN] | pieces[6 + PAWN] |
+            pieces[6 + ROOK] | pieces[6 + QUEEN]):
+        return False
+    knights = pieces[KNIGHT] | pieces[6 + KNIGHT]
+    bishops = pieces[BISHOP] | pieces[6 + BISHOP]
+    minors = bin(knights | bishops).count("1")
+    if minors <= 1:
+        return True
+    # Only bishops, all on light squares or all on dark squares.
+    light = 0xAA55AA55AA55AA55
+    return not knights and (bishops & light == bishops or
+                            not bishops & light)
+
+
+def repetitions(position):
+    """How many times the position occurred before, going back through the
+    undo stack as far as the last capture or pawn move."""
+    key = position.key
+    stack = position.undo_stack
+    count = 0
+    for back in range(2, min(position.halfmove_clock, len(stack)) + 1, 2):
+        if stack[-back][5] == key:
+            count += 1
+    return count
+
+
+def game_result(position):
+    """Result if the game is over in position.
+
+    Returns:
+        (result, reason) such as ("1-0", "checkmate") or
+        ("1/2-1/2", "stalemate"), None if the game goes on.
+    """
+    if next(generate_legal_moves(position), None) is None:
+        if position.in_check():
+            return ("0-1" if position.turn == WHITE else "1-0", "checkmate")
+        return ("1/2-1/2", "stalemate")
+    if position.halfmove_clock >= 100:
+        return ("1/2-1/2", "fifty move rule")
+    if repetitions(position) >= 2:
+        return ("1/2-1/2", "threefold repetition")
+    if is_insufficient_material(position):
+        return ("1/2-1/2", "insufficient material")
+    return None
+
+
+def perft(position, depth):
+    """Counts leaf nodes of the legal move tree to a depth.
+
+    Args:
+        position: Position to count from. Moves are made and unmade on it,
+                  so it is unchanged afterwards.
+        depth: Plies to search.
+
+    Returns:
+        Number of positions at depth.
+    """
+    if depth == 0:
+        return 1
+    moves = list(generate_legal_moves(position))
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+
+def divide(position, depth):
+    """Perft split by root move.
+
+    Returns:
+        List of (move, nodes) for each legal root move.
+    """
+    results = []
+    for move in list(generate_legal_moves(position)):
+        position.make_move(move)
+        results.append((move, perft(position, depth - 1)))
+        position.unmake_move()
+    return results
+
+
+def run_perft(position, depth, show_divide=False, out=sys.stdout):
+    """Runs perft and writes nodes, time and nodes/sec.
+
+    Args:
+        position: Position to count from.
+        depth: Plies to search.
+        show_divide: True to also write the count under each root move.
+        out: File to write to.
+
+    Returns:
+        Number of nodes counted.
+    """
+    start = time.perf_counter()
+    if show_divide and depth > 0:
+        nodes = 0
+        for move, count in sorted(divide(position, depth),
+                                  key=lambda result: move_uci(result[0])):
+            out.write("%s: %d\n" % (move_uci(move), count))
+            nodes += count
+        out.write("\n")
+    else:
+        nodes = perft(position, depth)
+    elapsed = time.perf_counter() - start
+    out.write("Depth: %d\n" % depth)
+    out.write("Nodes: %d\n" % nodes)
+    out.write("Time: %.3f s\n" % elapsed)
+    out.write("Nodes/sec: %d\n" % (nodes / elapsed if elapsed > 0 else 0))
+    return nodes
+
+
+def main(argv=None):
+    """Command line perft from the starting position or a FEN."""
+    parser = argparse.ArgumentParser(description="Perft move generation "
+                                                 "count and speed.")
+    parser.add_argument("depth", type=int, help="plies to search")
+    parser.add_argument("--divide", action="store_true",
+                        help="show node count under each root move")
+    parser.add_argument("--fen", help="count from this position instead")
+    args = parser.parse_args(argv)
+
+    position = Position()
+    if args.fen is None:
+        position.set_start_position()
+    else:
+        try:
+            position.set_fen(args.fen)
+        except ValueError as error:
+            parser.error(str(error))
+    nodes = run_perft(position, args.depth, args.divide)
+    expected = None if args.fen else START_PERFT.get(args.depth)
+    if expected is not None and nodes != expected:
+        print("MISMATCH: expected %d" % expected)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
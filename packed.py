@@ -0,0 +1,183 @@
+################################################################################
+# Packed Binary Positions.
+################################################################################
+"""Fixed width 32 byte position records for storing positions in bulk.
+
+Record layout, little endian:
+    bytes 0-7    occupancy bitboard
+    bytes 8-23   piece code of each occupied square, 4 bits each, in square
+                 order (lowest square in the low nibble of byte 8)
+    byte 24      side to move (bit 0) and castling rights (bits 1-4)
+    byte 25      en passant square, 255 for none
+    byte 26      halfmove clock, capped at 255
+    bytes 27-28  fullmove number, capped at 65535
+    bytes 29-31  zero
+
+A file of positions is just records back to back, so position n is at byte
+32*n. Run as a script to convert between FEN lines and packed files:
+
+    python packed.py pack positions.fen positions.bin
+    python packed.py unpack positions.bin
+"""
+import argparse
+import struct
+import sys
+import time
+
+from position import Position, iter_squares
+
+RECORD_SIZE = 32
+_RECORD = struct.Struct("<Q16sBBBH3x")
+assert _RECORD.size == RECORD_SIZE
+
+_NO_EP = 255
+
+
+def pack_position(position):
+    """32 byte record of position. The undo stack is not kept, and the
+    move counters are capped to fit their fields.
+
+    Raises:
+        ValueError: position has more than 32 pieces.
+    """
+    occupied = position.all_occupied
+    mailbox = position.mailbox
+    nibbles = 0
+    shift = 0
+    for sq in iter_squares(occupied):
+        nibbles |= mailbox[sq] << shift
+        shift += 4
+    if shift > 128:
+        raise ValueError("can't pack more than 32 pieces")
+    ep_square = position.ep_square
+    return _RECORD.pack(occupied, nibbles.to_bytes(16, "little"),
+                        position.turn | (position.castling << 1),
+                        _NO_EP if ep_square is None else ep_square,
+                        min(position.halfmove_clock, 255),
+                        min(position.fullmove_number, 65535))
+
+
+def unpack_position(data, offset=0, position=None):
+    """Position from a record made by pack_position.
+
+    Args:
+        data: Bytes holding the record.
+        offset: Where the record starts in data.
+        position: Position to set up in place, None for a new one.
+
+    Returns:
+        The position.
+    """
+    (occupied, nibbles, state, ep_square, halfmove_clock,
+     fullmove_number) = _RECORD.unpack_from(data, offset)
+    if position is None:
+        position = Position()
+    else:
+        position.clear()
+    nibbles = int.from_bytes(nibbles, "little")
+    for sq in iter_squares(occupied):
+        position.put_piece(nibbles & 15, sq)
+        nibbles >>= 4
+    position.turn = state & 1
+    position.castling = (state >> 1) & 15
+    position.ep_square = None if ep_square == _NO_EP else ep_square
+    position.halfmove_clock = halfmove_clock
+    position.fullmove_number = fullmove_number
+    position.update_key()
+    return position
+
+
+def write_positions(out, positions):
+    """Writes positions as records to a binary file.
+
+    Args:
+        out: File opened for binary writing.
+        positions: Iterable of Position.
+
+    Returns:
+        Number of positions written.
+    """
+    count = 0
+    chunk = []
+    for position in positions:
+        chunk.append(pack_position(position))
+        if len(chunk) == 4096:
+            out.write(b"".join(chunk))
+            count += len(chunk)
+            chunk = []
+    out.write(b"".join(chunk))
+    return count + len(chunk)
+
+
+def read_positions(source, chunk_records=4096):
+    """Yields each position of a packed file, reading it in chunks.
+
+    The same Position object is set up again for every record, so copy()
+    any that need keeping.
+
+    Args:
+        source: File opened for binary reading.
+        chunk_records: Records read at a time.
+
+    Raises:
+        ValueError: The file ends part way through a record.
+    """
+    position = Position()
+    while True:
+        data = source.read(RECORD_SIZE*chunk_records)
+        if not data:
+            return
+        if len(data) % RECORD_SIZE:
+            raise ValueError("packed file ends inside a record")
+        for offset in range(0, len(data), RECORD_SIZE):
+            yield unpack_position(data, offset, position)
+
+
+def read_position_at(source, index):
+    """Position number index (from 0) of a packed file."""
+    source.seek(index*RECORD_SIZE)
+    data = source.read(RECORD_SIZE)
+    if len(data) != RECORD_SIZE:
+        raise IndexError("no position %d" % index)
+    return unpack_position(data)
+
+
+def main(argv=None):
+    """Command line FEN <-> packed file conversion."""
+    parser = argparse.ArgumentParser(description="Convert between FEN lines "
+                                                 "and packed positions.")
+    commands = parser.add_subparsers(dest="command")
+    pack = commands.add_parser("pack", help="FEN lines to packed file")
+    pack.add_argument("fen_file", help="one FEN per line, - for stdin")
+    pack.add_argument("packed_file")
+    unpack = commands.add_parser("unpack", help="packed file to FEN lines")
+    unpack.add_argument("packed_file")
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error("give pack or unpack")
+
+    start = time.perf_counter()
+    if args.command == "pack":
+        def positions(lines):
+            position = Position()
+            for line in lines:
+                if line.strip():
+                    position.set_fen(line)
+                    yield position
+        source = sys.stdin if args.fen_file == "-" else open(args.fen_file)
+        with source, open(args.packed_file, "wb") as out:
+            count = write_positions(out, positions(source))
+    else:
+        count = 0
+        with open(args.packed_file, "rb") as source:
+            for position in read_positions(source):
+                sys.stdout.write(position.fen() + "\n")
+                count += 1
+    elapsed = time.perf_counter() - start
+    sys.stderr.write("Positions: %d in %.3f s (%d positions/sec)\n" %
+                     (count, elapsed, count / elapsed if elapsed > 0 else 0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,449 @@
+################################################################################
+# PGN Games.
+################################################################################
+"""Standard algebraic notation (SAN) and PGN game text.
+
+Games are read one at a time from any iterable of lines, so a database of
+any size is checked with the memory of a single game. Run as a script to
+replay and validate every game in PGN files:
+
+    python pgn.py games.pgn more.pgn
+"""
+import argparse
+import re
+import sys
+import time
+from array import array
+
+from position import (Position, WHITE, KING, PAWN, KING_CASTLE, QUEEN_CASTLE,
+                      PROMOTION, START_FEN, move_promotion, square_name,
+                      parse_square)
+from movegen import generate_legal_moves, game_result
+
+PIECE_LETTERS = "PNBRQK"
+
+# Tags every PGN game has, in the order they are written.
+SEVEN_TAG_ROSTER = ("Event", "Site", "Date", "Round", "White", "Black",
+                    "Result")
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+_TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_UNESCAPE = re.compile(r'\\(.)')
+# Movetext tokens: comments, NAGs, variation brackets, move numbers,
+# results, then anything else is a move.
+_TOKEN = re.compile(r'\{[^}]*\}?|;.*|\$\d+|[()]|\d+\.+|1-0|0-1|1/2-1/2|\*|'
+                    r'[^\s{}();$]+')
+_SAN = re.compile(r'([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+
+class PGNError(ValueError):
+    """A PGN game that can't be read or replayed."""
+
+
+class PGNGame:
+    """One game as read from PGN text.
+
+    Attributes:
+        headers: Dict of tag name to value, in file order.
+        sans: List of main line SAN moves. Comments, NAGs and variations
+              are dropped.
+        result: Game termination marker, one of RESULTS.
+        line: Line number in the file the game starts on.
+    """
+    __slots__ = ("headers", "sans", "result", "line")
+
+    def __init__(self, headers=None, sans=None, result="*", line=0):
+        self.headers = {} if headers is None else headers
+        self.sans = [] if sans is None else sans
+        self.result = result
+        self.line = line
+
+    def to_pgn(self):
+        """PGN text of the game."""
+        return game_to_pgn(self.headers, self.sans, self.result)
+
+
+def move_to_san(position, move, legal_moves=None):
+    """SAN of a legal move in position, e.g. 'Nbd7', 'exd6', 'e8=Q+'.
+
+    Args:
+        position: Position before the move. Left unchanged.
+        move: 16 bit legal move.
+        legal_moves: Legal moves of position, if already generated.
+    """
+    flags = move >> 12
+    if flags == KING_CASTLE:
+        san = "O-O"
+    elif flags == QUEEN_CASTLE:
+        san = "O-O-O"
+    else:
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        piece = position.mailbox[from_sq]
+        ptype = piece % 6
+        capture = flags & 4
+        if ptype == PAWN:
+            san = square_name(from_sq)[0] + "x" if capture else ""
+            san += square_name(to_sq)
+            promotion = move_promotion(move)
+            if promotion is not None:
+                san += "=" + PIECE_LETTERS[promotion]
+        else:
+            san = PIECE_LETTERS[ptype]
+            if ptype != KING:
+                san += _disambiguation(position, move, piece, legal_moves)
+            if capture:
+                san += "x"
+            san += square_name(to_sq)
+
+    position.make_move(move)
+    if position.in_check():
+        if next(generate_legal_moves(position), None) is None:
+            san += "#"
+        else:
+            san += "+"
+    position.unmake_move()
+    return san
+
+
+def san_to_move(position, san, legal_moves=None):
+    """Legal move of position written as san.
+
+    Check, mate and annotation marks ('+', '#', '!', '?') are ignored, as
+    are the '0-0' castling spelling and a missing '=' before a promotion.
+
+    Args:
+        position: Position the move is played from.
+        san: SAN text, e.g. 'Nbd7'.
+        legal_moves: Legal moves of position, if already generated.
+
+    Returns:
+        16 bit move.
+
+    Raises:
+        PGNError: san is not a legal move, or more than one.
+    """
+    text = san.rstrip("+#!?")
+    if legal_moves is None:
+        legal_moves = generate_legal_moves(position)
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        flags = KING_CASTLE if len(text) == 3 else QUEEN_CASTLE
+        for move in legal_moves:
+            if move >> 12 == flags:
+                return move
+        raise PGNError("illegal move %s" % san)
+
+    match = _SAN.match(text)
+    if match is None:
+        raise PGNError("bad move %s" % san)
+    letter, from_file, from_rank, to_name, promotion = match.groups()
+    ptype = PAWN if letter is None else PIECE_LETTERS.index(letter)
+    piece = position.turn*6 + ptype
+    to_sq = parse_square(to_name)
+    from_col = None if from_file is None else ord(from_file) - ord("a")
+    from_row = None if from_rank is None else ord("8") - ord(from_rank)
+    flags = None if promotion is None else \
+        PROMOTION + PIECE_LETTERS.index(promotion) - 1
+
+    mailbox = position.mailbox
+    found = None
+    for move in legal_moves:
+        if (move >> 6) & 63 != to_sq:
+            continue
+        from_sq = move & 63
+        if (mailbox[from_sq] != piece or
+                (from_col is not None and from_sq & 7 != from_col) or
+                (from_row is not None and from_sq >> 3 != from_row)):
+            continue
+        if move & 0x8000:
+            if flags is None or (move >> 12) & 11 != flags:
+                continue
+        elif flags is not None:
+            continue
+        if found is not None:
+            raise PGNError("ambiguous move %s" % san)
+        found = move
+    if found is None:
+        raise PGNError("illegal move %s" % san)
+    return found
+
+
+def _disambiguation(position, move, piece, legal_moves):
+    """File, rank or both of the from square when another piece of the
+    same kind can also move to the to square."""
+    from_sq = move & 63
+    to_sq = (move >> 6) & 63
+    if legal_moves is None:
+        legal_moves = generate_legal_moves(position)
+    same_file = same_row = ambiguous = False
+    for other in legal_moves:
+        other_from = other & 63
+        if (other_from == from_sq or (other >> 6) & 63 != to_sq or
+                position.mailbox[other_from] != piece):
+            continue
+        ambiguous = True
+        if other_from & 7 == from_sq & 7:
+            same_file = True
+        if other_from >> 3 == from_sq >> 3:
+            same_row = True
+    if not ambiguous:
+        return ""
+    name = square_name(from_sq)
+    if not same_file:
+        return name[0]
+    if not same_row:
+        return name[1]
+    return name
+
+
+def game_to_pgn(headers, sans, result="*", comment=None):
+    """PGN text of one game.
+
+    Args:
+        headers: Dict of tag name to value. Seven tag roster tags missing
+                 from it are written as '?', Result as result.
+        sans: List of SAN moves from the starting position (or the FEN
+              tag's position).
+        result: "1-0", "0-1", "1/2-1/2" or "*".
+        comment: Text put in braces after the last move, None for none.
+
+    Returns:
+        PGN text ending with a blank line.
+    """
+    lines = []
+    headers = dict(headers)
+    headers["Result"] = result
+    for tag in SEVEN_TAG_ROSTER:
+        lines.append('[%s "%s"]' % (tag, _escape(headers.get(tag, "?"))))
+    for tag, value in headers.items():
+        if tag not in SEVEN_TAG_ROSTER:
+            lines.append('[%s "%s"]' % (tag, _escape(value)))
+    lines.append("")
+
+    # Black moves first when the game starts from a FEN with black to move.
+    ply = 1 if " b " in headers.get("FEN", "") else 0
+    number = 1
+    if "FEN" in headers:
+        fields = headers["FEN"].split()
+        if len(fields) > 5 and fields[5].isdigit():
+            number = int(fields[5])
+    tokens = []
+    for index, san in enumerate(sans):
+        if ply % 2 == 0:
+            tokens.append("%d." % number)
+        elif index == 0:
+            tokens.append("%d..." % number)
+        tokens.append(san)
+        if ply % 2 == 1:
+            number += 1
+        ply += 1
+    if comment:
+        tokens.append("{%s}" % comment)
+    tokens.append(result)
+
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 79:
+            lines.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    lines.append(line)
+    lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    """Tag value with quotes and backslashes escaped."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def position_to_pgn(position, headers=None, result=None):
+    """PGN text of the moves made on position, from its undo stack.
+
+    Args:
+        position: Position reached by make_move. When the moves didn't
+                  start from the normal starting position, FEN and SetUp
+                  tags are added.
+        headers: Dict of tags, e.g. {"White": "me"}.
+        result: Result to write. None works it out from position: the
+                game_result if the game is over, else "*".
+    """
+    if result is None:
+        outcome = game_result(position)
+        result = "*" if outcome is None else outcome[0]
+    moves = array("H", [undo[0] for undo in position.undo_stack])
+    replay = position.copy()
+    while replay.undo_stack:
+        replay.unmake_move()
+    headers = dict(headers or {})
+    fen = replay.fen()
+    if fen != START_FEN:
+        headers["SetUp"] = "1"
+        headers["FEN"] = fen
+    sans = []
+    for move in moves:
+        sans.append(move_to_san(replay, move))
+        replay.make_move(move)
+    return game_to_pgn(headers, sans, result)
+
+
+def read_games(lines):
+    """Yields each game of PGN text, one at a time.
+
+    Only the game being read is held in memory, so this streams databases
+    far bigger than memory. Games are not checked; see replay_game.
+
+    Args:
+        lines: Iterable of lines, such as an open file.
+
+    Yields:
+        PGNGame for each game. A game cut off at the end of the text gets
+        result "*".
+    """
+    game = None
+    in_comment = False
+    depth = 0           # variation nesting
+    for number, line in enumerate(lines, 1):
+        if in_comment:
+            end = line.find("}")
+            if end < 0:
+                continue
+            line = line[end + 1:]
+            in_comment = False
+        if line.startswith("%"):
+            continue
+        stripped = line.strip()
+        if not stripped:
+            continue
+
+        if stripped.startswith("[") and depth == 0:
+            match = _TAG.match(stripped)
+            if match is not None:
+                if game is not None and game.sans:
+                    yield game
+                    game = None
+                if game is None:
+                    game = PGNGame(line=number)
+                game.headers[match.group(1)] = _UNESCAPE.sub(r"\1",
+                                                             match.group(2))
+                continue
+
+        for token in _TOKEN.findall(line):
+            first = token[0]
+            if first == "{":
+                if token[-1] != "}" or len(token) == 1:
+                    in_comment = True
+                continue
+            if first == ";" or first == "$" or first.isdigit() and \
+                    token[-1] == ".":
+                continue
+            if first == "(":
+                depth += 1
+                continue
+            if first == ")":
+                depth -= 1 if depth else 0
+                continue
+            if depth:
+                continue
+            if game is None:
+                game = PGNGame(line=number)
+            if token in RESULTS:
+                game.result = token
+                yield game
+                game = None
+                continue
+            game.sans.append(token)
+    if game is not None:
+        yield game
+
+
+def replay_game(game):
+    """Plays every move of a game, checking each is legal.
+
+    Args:
+        game: PGNGame.
+
+    Returns:
+        Position after the last move, with the moves on its undo stack.
+
+    Raises:
+        PGNError: Naming the first bad move and its move number, or the
+                  bad FEN tag. Errors setting up or replaying the position
+                  come as PGNError too, so one bad game can be reported
+                  and skipped.
+    """
+    position = Position()
+    if "FEN" in game.headers:
+        try:
+            position.set_fen(game.headers["FEN"])
+        except (ValueError, TypeError) as error:
+            raise PGNError("bad FEN tag: %s" % error)
+    else:
+        position.set_start_position()
+    for san in game.sans:
+        try:
+            move = san_to_move(position, san)
+            position.make_move(move)
+        except (ValueError, TypeError) as error:
+            raise PGNError("move %d%s %s" % (
+                position.fullmove_number,
+                "." if position.turn == WHITE else "...", error))
+    return position
+
+
+def validate_files(paths, out=sys.stdout, errors=sys.stderr):
+    """Replays every game in PGN files, writing each bad game to errors
+    and totals with games/sec and moves/sec to out.
+
+    Args:
+        paths: File names, "-" for stdin.
+        out: File the totals are written to.
+        errors: File bad games are written to.
+
+    Returns:
+        (games, moves, bad games).
+    """
+    games = moves = bad = 0
+    start = time.perf_counter()
+    for path in paths:
+        if path == "-":
+            source = sys.stdin
+        else:
+            source = open(path, encoding="utf-8", errors="replace")
+        try:
+            for game in read_games(source):
+                games += 1
+                try:
+                    replay_game(game)
+                except PGNError as error:
+                    bad += 1
+                    errors.write("%s:%d: game %d: %s\n" %
+                                 (path, game.line, games, error))
+                    continue
+                moves += len(game.sans)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+    elapsed = time.perf_counter() - start
+    out.write("Games: %d (%d bad)\n" % (games, bad))
+    out.write("Moves: %d\n" % moves)
+    out.write("Time: %.3f s\n" % elapsed)
+    out.write("Games/sec: %.1f\n" % (games / elapsed if elapsed > 0 else 0))
+    out.write("Moves/sec: %d\n" % (moves / elapsed if elapsed > 0 else 0))
+    return games, moves, bad
+
+
+def main(argv=None):
+    """Command line bulk PGN validation."""
+    parser = argparse.ArgumentParser(description="Replay and validate every "
+                                                 "game in PGN files.")
+    parser.add_argument("files", nargs="+", help="PGN files, - for stdin")
+    args = parser.parse_args(argv)
+    games, moves, bad = validate_files(args.files)
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
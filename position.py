@@ -0,0 +1,587 @@
+################################################################################
+# Headless Chess Position Backed By Bitboards.
+################################################################################
+"""Board model with no drawing in it.
+
+Squares are numbered the way ChessBoard lays them out on screen:
+square = row*8 + col, so square 0 is a8 (top left) and square 63 is h1
+(bottom right). Bit n of every bitboard stands for square n.
+"""
+import random
+
+from attacks import PAWN_ATTACKS, attackers_to
+
+WHITE = 0
+BLACK = 1
+COLOR_NAMES = ("white", "black")
+
+# Piece types.
+PAWN = 0
+KNIGHT = 1
+BISHOP = 2
+ROOK = 3
+QUEEN = 4
+KING = 5
+
+# Piece codes. color*6 + type, so both can be pulled out with one operation.
+W_PAWN = 0
+W_KNIGHT = 1
+W_BISHOP = 2
+W_ROOK = 3
+W_QUEEN = 4
+W_KING = 5
+B_PAWN = 6
+B_KNIGHT = 7
+B_BISHOP = 8
+B_ROOK = 9
+B_QUEEN = 10
+B_KING = 11
+
+# Unicode glyph of each piece code, in piece code order.
+PIECE_SYMBOLS = u'♙♘♗♖♕♔♟♞♝♜♛♚'
+SYMBOL_TO_PIECE = dict((symbol, piece)
+                       for piece, symbol in enumerate(PIECE_SYMBOLS))
+
+# Castling rights bits.
+WHITE_OO = 1
+WHITE_OOO = 2
+BLACK_OO = 4
+BLACK_OOO = 8
+ALL_CASTLING = 15
+
+FULL = 0xFFFFFFFFFFFFFFFF
+
+START_BACK_RANK = (ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK)
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# FEN letter of each piece code, in piece code order.
+FEN_LETTERS = "PNBRQKpnbrqk"
+_CASTLING_LETTERS = ((WHITE_OO, "K"), (WHITE_OOO, "Q"), (BLACK_OO, "k"),
+                     (BLACK_OOO, "q"))
+
+# Castling rights kept after a move touches a square (king or rook moved
+# away, or a rook was captured at home).
+CASTLING_KEPT = [ALL_CASTLING]*64
+CASTLING_KEPT[0] = ALL_CASTLING ^ BLACK_OOO
+CASTLING_KEPT[4] = ALL_CASTLING ^ (BLACK_OO | BLACK_OOO)
+CASTLING_KEPT[7] = ALL_CASTLING ^ BLACK_OO
+CASTLING_KEPT[56] = ALL_CASTLING ^ WHITE_OOO
+CASTLING_KEPT[60] = ALL_CASTLING ^ (WHITE_OO | WHITE_OOO)
+CASTLING_KEPT[63] = ALL_CASTLING ^ WHITE_OO
+
+################################################################################
+# Zobrist Keys.
+#   A position's key is the XOR of one random number per (piece, square),
+#   one per castling rights value, one per en passant file and one for black
+#   to move. Seeded so keys are the same in every process and every run.
+################################################################################
+_zobrist_random = random.Random(0x7C4E55)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for sq in range(64)]
+                  for piece in range(12)]
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for rights in range(16)]
+ZOBRIST_EP = [_zobrist_random.getrandbits(64) for col in range(8)]
+ZOBRIST_BLACK = _zobrist_random.getrandbits(64)
+del _zobrist_random
+
+################################################################################
+# Moves.
+#   A move is a 16 bit int: bits 0-5 from square, 6-11 to square, 12-15 flags.
+################################################################################
+QUIET = 0
+DOUBLE_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EP_CAPTURE = 5
+PROMOTION = 8     # flags 8-11 promote to knight, bishop, rook, queen.
+PROMO_CAPTURE = 12
+
+NULL_MOVE = 0
+
+
+def square(row, col):
+    """Square number of row, col."""
+    return row*8 + col
+
+
+def square_row(sq):
+    """Row (0 top - 7 bottom) of square."""
+    return sq >> 3
+
+
+def square_col(sq):
+    """Col (0 left - 7 right) of square."""
+    return sq & 7
+
+
+def square_name(sq):
+    """Algebraic name of square, e.g. 0 -> 'a8'."""
+    return "abcdefgh"[sq & 7] + str(8 - (sq >> 3))
+
+
+def parse_square(name):
+    """Square of an algebraic name, e.g. 'a8' -> 0. None if not a square."""
+    if (len(name) != 2 or not "a" <= name[0] <= "h" or
+            not "1" <= name[1] <= "8"):
+        return None
+    return (ord("8") - ord(name[1]))*8 + ord(name[0]) - ord("a")
+
+
+def piece_color(piece):
+    """WHITE or BLACK for a piece code."""
+    return piece // 6
+
+
+def piece_type(piece):
+    """PAWN..KING for a piece code."""
+    return piece % 6
+
+
+def make_piece(color, ptype):
+    """Piece code from color and type."""
+    return color*6 + ptype
+
+
+def encode_move(from_sq, to_sq, flags=QUIET):
+    """Packs a move into a 16 bit int."""
+    return from_sq | (to_sq << 6) | (flags << 12)
+
+
+def move_from(move):
+    """From square of move."""
+    return move & 63
+
+
+def move_to(move):
+    """To square of move."""
+    return (move >> 6) & 63
+
+
+def move_flags(move):
+    """Flags of move (QUIET, CAPTURE, ...)."""
+    return move >> 12
+
+
+def move_promotion(move):
+    """Piece type promoted to, None if move is not a promotion."""
+    if move & 0x8000:
+        return KNIGHT + ((move >> 12) & 3)
+    return None
+
+
+def is_capture(move):
+    """True if move takes a piece (including en passant)."""
+    return (move >> 12) & CAPTURE == CAPTURE
+
+
+def move_uci(move):
+    """Move in long algebraic form, e.g. 'e2e4' or 'e7e8q'."""
+    text = square_name(move & 63) + square_name((move >> 6) & 63)
+    promotion = move_promotion(move)
+    if promotion is not None:
+        text += "nbrq"[promotion - KNIGHT]
+    return text
+
+
+def iter_squares(bitboard):
+    """Yields the square of every set bit, lowest first."""
+    while bitboard:
+        low = bitboard & -bitboard
+        yield low.bit_length() - 1
+        bitboard ^= low
+
+
+class Position:
+    """A chess position as twelve piece bitboards plus occupancy masks.
+
+    Attributes:
+        pieces: List of 12 bitboards indexed by piece code.
+        occupied: [white bitboard, black bitboard].
+        all_occupied: Bitboard of every occupied square.
+        mailbox: List of 64 piece codes (None for empty) for O(1) lookup
+                 of what stands on a square.
+        king_squares: [white king square, black king square], None when
+                      that king is not on the board. Kept up to date by
+                      put_piece and remove_piece.
+        turn: WHITE or BLACK to move.
+        castling: Castling rights bits (WHITE_OO, ...).
+        ep_square: Square a pawn can capture onto en passant, or None.
+        halfmove_clock: Half moves since last capture or pawn move.
+        fullmove_number: Starts at 1, increases after black moves.
+        undo_stack: One (move, captured piece, castling, ep_square,
+                    halfmove_clock, key) tuple per move made, for
+                    unmake_move.
+        key: 64 bit Zobrist key, kept up to date as pieces and state
+             change. Anything setting turn, castling or ep_square directly
+             must call update_key() afterwards.
+    """
+
+    def __init__(self):
+        """Inits an empty position with white to move."""
+        self.clear()
+
+    def clear(self):
+        """Removes every piece and resets the game state."""
+        self.pieces = [0]*12
+        self.occupied = [0, 0]
+        self.all_occupied = 0
+        self.mailbox = [None]*64
+        self.king_squares = [None, None]
+        self.turn = WHITE
+        self.castling = 0
+        self.ep_square = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.undo_stack = []
+        self.key = 0
+
+    def compute_key(self):
+        """Zobrist key of the position worked out from scratch."""
+        key = ZOBRIST_CASTLING[self.castling]
+        for sq, piece in enumerate(self.mailbox):
+            if piece is not None:
+                key ^= ZOBRIST_PIECES[piece][sq]
+        if self.ep_square is not None:
+            key ^= ZOBRIST_EP[self.ep_square & 7]
+        if self.turn == BLACK:
+            key ^= ZOBRIST_BLACK
+        return key
+
+    def update_key(self):
+        """Recomputes key after turn, castling or ep_square were set."""
+        self.key = self.compute_key()
+
+    def set_start_position(self):
+        """Sets up the normal starting position."""
+        self.clear()
+        for col in range(8):
+            self.put_piece(make_piece(BLACK, START_BACK_RANK[col]),
+                           square(0, col))
+            self.put_piece(B_PAWN, square(1, col))
+            self.put_piece(W_PAWN, square(6, col))
+            self.put_piece(make_piece(WHITE, START_BACK_RANK[col]),
+                           square(7, col))
+        self.castling = ALL_CASTLING
+        self.update_key()
+
+    def set_fen(self, fen):
+        """Sets up the position a FEN string describes.
+
+        The halfmove clock and fullmove number may be left off. An en
+        passant square is only kept if a pawn could capture onto it, the
+        same as make_move does.
+
+        Args:
+            fen: e.g. START_FEN.
+
+        Raises:
+            ValueError: fen is malformed, either side hasn't exactly one
+                        king, or the side not to move is in check. The
+                        position is then only partly set up.
+        """
+        fields = fen.split()
+        self.clear()
+        if not 2 <= len(fields) <= 6:
+            raise ValueError("FEN needs 2 to 6 fields: %r" % fen)
+        rows = fields[0].split("/")
+        if len(rows) != 8:
+            raise ValueError("FEN board needs 8 rows: %r" % fen)
+        for row, text in enumerate(rows):
+            col = 0
+            for char in text:
+                if "1" <= char <= "8":
+                    col += int(char)
+                elif char in FEN_LETTERS and col < 8:
+                    self.put_piece(FEN_LETTERS.index(char), square(row, col))
+                    col += 1
+                else:
+                    raise ValueError("bad FEN row %r" % text)
+            if col != 8:
+                raise ValueError("FEN row %r is not 8 squares" % text)
+
+        for color in (WHITE, BLACK):
+            if bin(self.pieces[color*6 + KING]).count("1") != 1:
+                raise ValueError("FEN needs one %s king: %r" % (
+                    COLOR_NAMES[color], fen))
+
+        if fields[1] not in ("w", "b"):
+            raise ValueError("FEN side to move must be w or b: %r" % fen)
+        self.turn = WHITE if fields[1] == "w" else BLACK
+        if self.in_check(self.turn ^ 1):
+            raise ValueError("FEN side not to move is in check: %r" % fen)
+
+        castling = fields[2] if len(fields) > 2 else "-"
+        if castling != "-":
+            for right, letter in _CASTLING_LETTERS:
+                if letter in castling:
+                    self.castling |= right
+            if castling.strip("KQkq"):
+                raise ValueError("bad FEN castling %r" % castling)
+
+        ep = fields[3] if len(fields) > 3 else "-"
+        if ep != "-":
+            ep_square = parse_square(ep)
+            if ep_square is None:
+                raise ValueError("bad FEN en passant square %r" % ep)
+            enemy_pawns = self.pieces[self.turn*6 + PAWN]
+            if PAWN_ATTACKS[self.turn ^ 1][ep_square] & enemy_pawns:
+                self.ep_square = ep_square
+
+        try:
+            if len(fields) > 4:
+                self.halfmove_clock = int(fields[4])
+            if len(fields) > 5:
+                self.fullmove_number = max(1, int(fields[5]))
+        except ValueError:
+            raise ValueError("bad FEN move counters: %r" % fen)
+        self.update_key()
+
+    def fen(self):
+        """FEN string of the position."""
+        rows = []
+        for row in range(8):
+            text = ""
+            empty = 0
+            for col in range(8):
+                piece = self.mailbox[square(row, col)]
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                text += FEN_LETTERS[piece]
+            if empty:
+                text += str(empty)
+            rows.append(text)
+        castling = "".join(letter for right, letter in _CASTLING_LETTERS
+                           if self.castling & right) or "-"
+        ep = "-" if self.ep_square is None else square_name(self.ep_square)
+        return "%s %s %s %s %d %d" % ("/".join(rows), "wb"[self.turn],
+                                      castling, ep, self.halfmove_clock,
+                                      self.fullmove_number)
+
+    def copy(self):
+        """Returns an independent copy of this position."""
+        other = Position.__new__(Position)
+        other.pieces = self.pieces[:]
+        other.occupied = self.occupied[:]
+        other.all_occupied = self.all_occupied
+        other.mailbox = self.mailbox[:]
+        other.king_squares = self.king_squares[:]
+        other.turn = self.turn
+        other.castling = self.castling
+        other.ep_square = self.ep_square
+        other.halfmove_clock = self.halfmove_clock
+        other.fullmove_number = self.fullmove_number
+        other.undo_stack = self.undo_stack[:]
+        other.key = self.key
+        return other
+
+    def piece_at(self, sq):
+        """Piece code on square, None if empty."""
+        return self.mailbox[sq]
+
+    def put_piece(self, piece, sq):
+        """Put piece on square, replacing anything already there.
+
+        Args:
+            piece: Piece code.
+            sq: Square number.
+        """
+        if self.mailbox[sq] is not None:
+            self.remove_piece(sq)
+        bit = 1 << sq
+        self.pieces[piece] |= bit
+        self.occupied[piece // 6] |= bit
+        self.all_occupied |= bit
+        self.mailbox[sq] = piece
+        self.key ^= ZOBRIST_PIECES[piece][sq]
+        if piece % 6 == KING:
+            self.king_squares[piece // 6] = sq
+
+    def remove_piece(self, sq):
+        """Remove whatever piece is on square.
+
+        Returns:
+            Piece code removed, None if square was empty.
+        """
+        piece = self.mailbox[sq]
+        if piece is None:
+            return None
+        mask = FULL ^ (1 << sq)
+        self.pieces[piece] &= mask
+        self.occupied[piece // 6] &= mask
+        self.all_occupied &= mask
+        self.mailbox[sq] = None
+        self.key ^= ZOBRIST_PIECES[piece][sq]
+        if piece % 6 == KING and self.king_squares[piece // 6] == sq:
+            self.king_squares[piece // 6] = None
+        return piece
+
+    def move_piece(self, from_sq, to_sq):
+        """Move piece between squares. Does not validate or change turn.
+
+        Returns:
+            Piece code captured on to_sq, None if nothing was taken.
+        """
+        piece = self.remove_piece(from_sq)
+        captured = self.remove_piece(to_sq)
+        if piece is not None:
+            self.put_piece(piece, to_sq)
+        return captured
+
+    def make_move(self, move):
+        """Plays a move in place and pushes what is needed to take it back.
+
+        The move must be legal here (from the move generator). No copy of
+        the position is made, so trying a move is make_move, look,
+        unmake_move.
+
+        Args:
+            move: 16 bit move.
+        """
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        flags = move >> 12
+        piece = self.mailbox[from_sq]
+        turn = self.turn
+        key_before = self.key
+
+        if flags == EP_CAPTURE:
+            captured = self.remove_piece(to_sq + 8 if turn == WHITE
+                                         else to_sq - 8)
+            self.move_piece(from_sq, to_sq)
+        else:
+            captured = self.move_piece(from_sq, to_sq)
+        self.undo_stack.append((move, captured, self.castling,
+                                self.ep_square, self.halfmove_clock,
+                                key_before))
+
+        if flags & PROMOTION:
+            self.put_piece(turn*6 + KNIGHT + (flags & 3), to_sq)
+        elif flags == KING_CASTLE:
+            self.move_piece(from_sq + 3, from_sq + 1)
+        elif flags == QUEEN_CASTLE:
+            self.move_piece(from_sq - 4, from_sq - 1)
+
+        key = self.key ^ ZOBRIST_BLACK ^ ZOBRIST_CASTLING[self.castling]
+        self.castling &= CASTLING_KEPT[from_sq] & CASTLING_KEPT[to_sq]
+        key ^= ZOBRIST_CASTLING[self.castling]
+        if self.ep_square is not None:
+            key ^= ZOBRIST_EP[self.ep_square & 7]
+        # Only keep an en passant square an enemy pawn could capture on, so
+        # positions that differ in nothing else get the same key.
+        self.ep_square = None
+        if flags == DOUBLE_PUSH:
+            ep_square = (from_sq + to_sq) >> 1
+            enemy_pawns = self.pieces[(turn ^ 1)*6 + PAWN]
+            if PAWN_ATTACKS[turn][ep_square] & enemy_pawns:
+                self.ep_square = ep_square
+                key ^= ZOBRIST_EP[ep_square & 7]
+        self.key = key
+
+        if piece % 6 == PAWN or captured is not None:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if turn == BLACK:
+            self.fullmove_number += 1
+        self.turn = turn ^ 1
+
+    def unmake_move(self):
+        """Takes back the last move made with make_move.
+
+        Returns:
+            The move taken back.
+        """
+        move, captured, castling, ep_square, halfmove_clock, key = \
+            self.undo_stack.pop()
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        flags = move >> 12
+        turn = self.turn ^ 1
+
+        if flags & PROMOTION:
+            self.remove_piece(to_sq)
+            self.put_piece(turn*6 + PAWN, from_sq)
+        else:
+            self.move_piece(to_sq, from_sq)
+            if flags == KING_CASTLE:
+                self.move_piece(from_sq + 1, from_sq + 3)
+            elif flags == QUEEN_CASTLE:
+                self.move_piece(from_sq - 1, from_sq - 4)
+        if captured is not None:
+            if flags == EP_CAPTURE:
+                self.put_piece(captured, to_sq + 8 if turn == WHITE
+                               else to_sq - 8)
+            else:
+                self.put_piece(captured, to_sq)
+
+        self.castling = castling
+        self.ep_square = ep_square
+        self.halfmove_clock = halfmove_clock
+        self.key = key
+        if turn == BLACK:
+            self.fullmove_number -= 1
+        self.turn = turn
+        return move
+
+    def square_attacked_by(self, color, sq):
+        """Which of color's pieces attack a square?
+
+        Looks outward from sq along the rook and bishop rays and the knight,
+        king and pawn offsets, so the cost doesn't depend on how many pieces
+        are on the board.
+
+        Args:
+            color: WHITE or BLACK, the attacking side.
+            sq: Square attacked.
+
+        Returns:
+            Bitboard of the attackers, 0 if the square is not attacked.
+        """
+        return attackers_to(self, sq, color)
+
+    def checkers(self, color=None):
+        """Bitboard of pieces giving check to color's king.
+
+        Args:
+            color: Side whose king is tested, default the side to move.
+        """
+        if color is None:
+            color = self.turn
+        king_sq = self.king_squares[color]
+        if king_sq is None:
+            return 0
+        return attackers_to(self, king_sq, color ^ 1)
+
+    def in_check(self, color=None):
+        """True if color's king (default side to move) is attacked."""
+        return self.checkers(color) != 0
+
+    def pieces_of(self, color, ptype):
+        """Bitboard of color's pieces of a type."""
+        return self.pieces[color*6 + ptype]
+
+    def __eq__(self, other):
+        return (isinstance(other, Position) and
+                self.pieces == other.pieces and
+                self.turn == other.turn and
+                self.castling == other.castling and
+                self.ep_square == other.ep_square)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __str__(self):
+        """Board as 8 lines of glyphs, '.' for empty squares."""
+        lines = []
+        for row in range(8):
+            line = []
+            for col in range(8):
+                piece = self.mailbox[square(row, col)]
+                line.append(u'.' if piece is None else PIECE_SYMBOLS[piece])
+            lines.append(u' '.join(line))
+        return u'\n'.join(lines)
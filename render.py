@@ -0,0 +1,773 @@
+################################################################################
+# Offscreen Rendering.
+################################################################################
+"""Draws boards without a display.
+
+OffscreenCanvas takes the calls ChessBoard makes on a Tk canvas and keeps
+the items in memory, so the board can be drawn and flushed with no window,
+e.g. for benchmarks:
+
+    board = ChessBoard(OffscreenCanvas(), 40)
+    board.draw_board()
+    board.flush()
+
+The Renderer backends turn positions straight into image files, with
+ChessBoard's colors and square layout and no Tk at all:
+
+    svg   SVGRenderer, squares as rectangles and pieces as their
+          PIECE_SYMBOLS glyphs; replays animate with SMIL.
+    png   PNGRenderer, written with zlib alone. Pieces are drawn from the
+          16x16 masks in PIECE_MASKS, scaled to the square size; replays
+          are animated PNGs whose frames only cover the squares that
+          changed.
+
+Both keep every square and piece sprite they have made, so after the first
+board each diagram is mostly copying. render_diagrams spreads thousands of
+diagrams over worker processes, each with its own renderer:
+
+    python render.py diagram --fen FEN board.png
+    python render.py replay games.pgn game.svg --game 3
+    python render.py bulk positions.fen diagrams/ --format png --workers 4
+"""
+import abc
+import argparse
+import multiprocessing
+import os
+import struct
+import sys
+import zlib
+
+from position import Position, PIECE_SYMBOLS, BLACK, piece_color
+from pgn import read_games, replay_game, PGNError
+from main import ChessBoard
+
+
+class OffscreenCanvas:
+    """In memory stand in for the Tk canvas methods ChessBoard uses.
+
+    Attributes:
+        items: {item id: {"kind": "rectangle" or "text", "coords": tuple,
+               plus the item's options}}, in the order made.
+        calls: Canvas method calls so far.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.calls = 0
+        self._next_id = 1
+
+    def _create(self, kind, coords, options):
+        self.calls += 1
+        item = self._next_id
+        self._next_id += 1
+        tags = options.get("tags", ())
+        options["tags"] = (tags,) if isinstance(tags, str) else tuple(tags)
+        options["kind"] = kind
+        options["coords"] = coords
+        self.items[item] = options
+        return item
+
+    def create_rectangle(self, x1, y1, x2, y2, **options):
+        """New rectangle item, returns its id."""
+        return self._create("rectangle", (x1, y1, x2, y2), options)
+
+    def create_text(self, x, y, **options):
+        """New text item, returns its id."""
+        return self._create("text", (x, y), options)
+
+    def itemconfigure(self, item, **options):
+        """Changes options of an item."""
+        self.calls += 1
+        self.items[item].update(options)
+
+    itemconfig = itemconfigure
+
+    def delete(self, tag_or_id):
+        """Removes an item by id, or every item with a tag ("all" for
+        every item)."""
+        self.calls += 1
+        if tag_or_id == "all":
+            self.items.clear()
+        elif tag_or_id in self.items:
+            del self.items[tag_or_id]
+        else:
+            for item in [item for item, options in self.items.items()
+                         if tag_or_id in options["tags"]]:
+                del self.items[item]
+
+
+# 16x16 piece shapes by piece type: "#" outline, "o" body, "." the square.
+PIECE_MASKS = (
+    (   # pawn
+        "................",
+        "................",
+        "................",
+        "................",
+        "......####......",
+        ".....#oooo#.....",
+        ".....#oooo#.....",
+        "......#oo#......",
+        ".....#oooo#.....",
+        "......#oo#......",
+        ".....#oooo#.....",
+        "....#oooooo#....",
+        "...#oooooooo#...",
+        "...##########...",
+        "................",
+        "................",
+    ),
+    (   # knight
+        "................",
+        "................",
+        ".....#.##.......",
+        "....#o#oo##.....",
+        "...#oooooo#.....",
+        "..#oo#ooooo#....",
+        ".#oooooooooo#...",
+        ".#ooo##oooooo#..",
+        "..###.#ooooo#...",
+        "......#oooo#....",
+        ".....#oooooo#...",
+        "....#oooooooo#..",
+        "....#oooooooo#..",
+        "....##########..",
+        "................",
+        "................",
+    ),
+    (   # bishop
+        "................",
+        ".......##.......",
+        "......#oo#......",
+        ".....#oo#o#.....",
+        "....#oo#ooo#....",
+        "....#oooooo#....",
+        ".....#oooo#.....",
+        "......#oo#......",
+        ".....#oooo#.....",
+        "......#oo#......",
+        ".....#oooo#.....",
+        "....#oooooo#....",
+        "...#oooooooo#...",
+        "...##########...",
+        "................",
+        "................",
+    ),
+    (   # rook
+        "................",
+        "................",
+        "...##..##..##...",
+        "...#o##oo##o#...",
+        "...#oooooooo#...",
+        "....#oooooo#....",
+        ".....#oooo#.....",
+        ".....#oooo#.....",
+        ".....#oooo#.....",
+        ".....#oooo#.....",
+        "....#oooooo#....",
+        "...#oooooooo#...",
+        "...#oooooooo#...",
+        "...##########...",
+        "................",
+        "................",
+    ),
+    (   # queen
+        "................",
+        "..#....##....#..",
+        "..##..#oo#..##..",
+        "..#o#.#oo#.#o#..",
+        "..#oo#oooo#oo#..",
+        "..#oooooooooo#..",
+        "...#oooooooo#...",
+        "....#oooooo#....",
+        ".....#oooo#.....",
+        ".....#oooo#.....",
+        "....#oooooo#....",
+        "...#oooooooo#...",
+        "...#oooooooo#...",
+        "...##########...",
+        "................",
+        "................",
+    ),
+    (   # king
+        "................",
+        ".......##.......",
+        "......####......",
+        ".......##.......",
+        "...###.##.###...",
+        "..#ooo#oo#ooo#..",
+        "..#oooo##oooo#..",
+        "..#oooooooooo#..",
+        "...#oooooooo#...",
+        "....#oooooo#....",
+        ".....#oooo#.....",
+        "....#oooooo#....",
+        "...#oooooooo#...",
+        "...##########...",
+        "................",
+        "................",
+    ),
+)
+
+# 3x5 shapes of the notation characters drawn on the PNG border.
+NOTATION_MASKS = {
+    "a": ("###", "..#", "###", "#.#", "###"),
+    "b": ("#..", "#..", "###", "#.#", "###"),
+    "c": ("...", "###", "#..", "#..", "###"),
+    "d": ("..#", "..#", "###", "#.#", "###"),
+    "e": ("###", "#.#", "###", "#..", "###"),
+    "f": (".##", "#..", "###", "#..", "#.."),
+    "g": ("###", "#.#", "###", "..#", "###"),
+    "h": ("#..", "#..", "###", "#.#", "#.#"),
+    "1": (".#.", "##.", ".#.", ".#.", "###"),
+    "2": ("###", "..#", "###", "#..", "###"),
+    "3": ("###", "..#", ".##", "..#", "###"),
+    "4": ("#.#", "#.#", "###", "..#", "..#"),
+    "5": ("###", "#..", "###", "..#", "###"),
+    "6": ("###", "#..", "###", "#.#", "###"),
+    "7": ("###", "..#", "..#", ".#.", ".#."),
+    "8": ("###", "#.#", "###", "#.#", "###"),
+}
+
+# Fill of the body of each color's pieces; both are outlined in
+# ChessBoard.not_select_color.
+PIECE_FILLS = ((255, 255, 255), (60, 60, 60))
+
+
+def game_frames(game):
+    """Yields each position of a game for an animated replay.
+
+    The same Position is played forward for every frame, so render each
+    frame before taking the next.
+
+    Args:
+        game: PGNGame.
+
+    Yields:
+        (position, highlighted squares): the start position with no
+        highlights, then the position after each move with the move's
+        from and to squares highlighted.
+
+    Raises:
+        PGNError: The game has an illegal move.
+    """
+    position = replay_game(game)
+    moves = []
+    while position.undo_stack:
+        moves.append(position.unmake_move())
+    yield position, ()
+    for move in reversed(moves):
+        position.make_move(move)
+        yield position, (move & 63, (move >> 6) & 63)
+
+
+class Renderer(abc.ABC):
+    """Base of the image backends: ChessBoard's look, no display.
+
+    Squares are square_size pixels with a one pixel light gap between
+    them, inside a border holding the notation, as ChessBoard draws them.
+    Squares are indexed like Position's, a8 = 0 at the top left.
+
+    Backends set extension and implement render and render_animation;
+    one missing either can't be made.
+
+    Attributes:
+        square_size: Side of a square in pixels.
+        step: Distance from one square to the next.
+        border: Width of the border around the squares.
+        width: Side of the whole image.
+        sprites: Cached pieces of drawing, by what they show.
+    """
+    extension = None
+
+    def __init__(self, square_size=40):
+        board = ChessBoard(None, square_size)
+        self.border_color = board.border_color
+        self.square_dark = board.square_dark
+        self.square_light = board.square_light
+        self.not_select_color = board.not_select_color
+        self.select_color = board.select_color
+        self.highlight_color = board.highlight_color
+        self.square_size = square_size
+        self.step = square_size + 1
+        self.border = max(4, square_size // 2)
+        self.width = 8*square_size + 7 + 2*self.border
+        self.sprites = {}
+
+    def square_origin(self, sq):
+        """Pixel x, y of the top left corner of a square."""
+        return (self.border + (sq & 7)*self.step,
+                self.border + (sq >> 3)*self.step)
+
+    def square_fill(self, sq, highlighted):
+        """Color of a square given the highlighted squares."""
+        if sq in highlighted:
+            return self.highlight_color
+        return self.square_light if ((sq >> 3) + (sq & 7)) % 2 == 0 \
+            else self.square_dark
+
+    @abc.abstractmethod
+    def render(self, position, highlighted=(), selected=None):
+        """Image of a position as bytes of a file.
+
+        Args:
+            position: Position to draw.
+            highlighted: Squares filled in the highlight color.
+            selected: Square whose piece is drawn as selected, or None.
+        """
+
+    @abc.abstractmethod
+    def render_animation(self, frames, delay=0.8):
+        """Animated image of positions shown one after another, as bytes
+        of a file.
+
+        Args:
+            frames: Iterable of (position, highlighted squares), such as
+                    game_frames(game). Each is drawn before the next is
+                    taken, so one Position may be played forward.
+            delay: Seconds each frame shows.
+        """
+
+    def save(self, path, position, highlighted=(), selected=None):
+        """Writes render() to a file."""
+        with open(path, "wb") as out:
+            out.write(self.render(position, highlighted, selected))
+
+
+class SVGRenderer(Renderer):
+    """Boards as SVG, pieces as text glyphs."""
+    extension = "svg"
+
+    def _color(self, rgb):
+        return "#%02x%02x%02x" % rgb
+
+    def _header(self):
+        return ('<svg xmlns="http://www.w3.org/2000/svg" width="%d" '
+                'height="%d" viewBox="0 0 %d %d">\n' %
+                ((self.width,)*4))
+
+    def _background(self):
+        """Border, squares and notation, made once."""
+        background = self.sprites.get("background")
+        if background is not None:
+            return background
+        size = self.square_size
+        parts = ['<rect width="%d" height="%d" fill="%s"/>\n' % (
+                     self.width, self.width, self._color(self.border_color)),
+                 '<rect x="%d" y="%d" width="%d" height="%d" fill="%s"/>\n' % (
+                     self.border, self.border, 8*size + 7, 8*size + 7,
+                     self._color(self.square_light))]
+        for sq in range(64):
+            parts.append(self._square(sq, self.square_fill(sq, ())))
+        font = ('font-family="Courier, monospace" font-size="%d" '
+                'text-anchor="middle" dominant-baseline="central"' %
+                max(6, round(self.border*.7)))
+        middle = self.border // 2
+        for index in range(8):
+            centre = self.border + index*self.step + size // 2
+            parts.append('<text x="%d" y="%d" %s>%d</text>\n' % (
+                middle, centre, font, 8 - index))
+            parts.append('<text x="%d" y="%d" %s>%s</text>\n' % (
+                centre, self.width - middle, font, chr(ord("a") + index)))
+        background = self.sprites["background"] = "".join(parts)
+        return background
+
+    def _square(self, sq, fill):
+        key = ("square", sq, fill)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            x, y = self.square_origin(sq)
+            sprite = self.sprites[key] = (
+                '<rect x="%d" y="%d" width="%d" height="%d" fill="%s"/>\n' %
+                (x, y, self.square_size, self.square_size, self._color(fill)))
+        return sprite
+
+    def _piece(self, sq, piece, selected):
+        key = ("piece", sq, piece, selected)
+        sprite = self.sprites.get(key)
+        if sprite is None:
+            x, y = self.square_origin(sq)
+            half = self.square_size // 2
+            color = self.select_color if selected else self.not_select_color
+            sprite = self.sprites[key] = (
+                '<text x="%d" y="%d" font-size="%d" text-anchor="middle" '
+                'dominant-baseline="central" fill="%s">%s</text>\n' %
+                (x + half, y + half, round(self.square_size*.8),
+                 self._color(color), PIECE_SYMBOLS[piece]))
+        return sprite
+
+    def _position(self, position, highlighted, selected):
+        """Highlights and pieces drawn over the background."""
+        parts = [self._square(sq, self.highlight_color) for sq in highlighted]
+        mailbox = position.mailbox
+        for sq in range(64):
+            if mailbox[sq] is not None:
+                parts.append(self._piece(sq, mailbox[sq], sq == selected))
+        return "".join(parts)
+
+    def render(self, position, highlighted=(), selected=None):
+        return (self._header() + self._background() +
+                self._position(position, highlighted, selected) +
+                "</svg>\n").encode("utf-8")
+
+    def render_animation(self, frames, delay=0.8):
+        groups = [self._position(position, highlighted, None)
+                  for position, highlighted in frames]
+        count = len(groups)
+        parts = [self._header(), self._background()]
+        for index, group in enumerate(groups):
+            # Discrete visibility switches at index/count and (index+1)/count
+            # of one loop through every frame.
+            values = ["visible"]
+            times = ["0"]
+            if index:
+                values = ["hidden", "visible"]
+                times = ["0", "%.6f" % (index / count)]
+            if index < count - 1:
+                values.append("hidden")
+                times.append("%.6f" % ((index + 1) / count))
+            parts.append('<g visibility="%s">\n<animate attributeName='
+                         '"visibility" values="%s" keyTimes="%s" dur="%gs" '
+                         'calcMode="discrete" repeatCount="indefinite"/>\n' %
+                         ("hidden" if index else "visible", ";".join(values),
+                          ";".join(times), count*delay))
+            parts.append(group)
+            parts.append("</g>\n")
+        parts.append("</svg>\n")
+        return "".join(parts).encode("utf-8")
+
+
+def _chunk(kind, data):
+    """One PNG chunk."""
+    return (struct.pack(">I", len(data)) + kind + data +
+            struct.pack(">I", zlib.crc32(kind + data)))
+
+
+class PNGRenderer(Renderer):
+    """Boards as 24 bit PNG, replays as animated PNG.
+
+    Attributes:
+        compress_level: zlib level of the image data.
+    """
+    extension = "png"
+
+    def __init__(self, square_size=40, compress_level=6):
+        Renderer.__init__(self, square_size)
+        self.compress_level = compress_level
+
+    def _background(self):
+        """Pixels of the board with every square empty, made once."""
+        background = self.sprites.get("background")
+        if background is not None:
+            return background
+        width = self.width
+        pixels = bytearray(bytes(self.border_color)*(width*width))
+        side = 8*self.square_size + 7
+        light = bytes(self.square_light)*side
+        for y in range(self.border, self.border + side):
+            offset = (y*width + self.border)*3
+            pixels[offset:offset + len(light)] = light
+        for sq in range(64):
+            self._blit(pixels, sq, self._sprite(None, self.square_fill(sq, ()),
+                                                False))
+        # Ranks down the left border, files along the bottom.
+        scale = max(1, self.border // 8)
+        middle = (self.border - 5*scale) // 2
+        for index in range(8):
+            centre = self.border + index*self.step + self.square_size // 2
+            self._draw_char(pixels, str(8 - index),
+                            (self.border - 3*scale) // 2,
+                            centre - 5*scale // 2, scale)
+            self._draw_char(pixels, chr(ord("a") + index),
+                            centre - 3*scale // 2,
+                            width - self.border + middle, scale)
+        background = self.sprites["background"] = bytes(pixels)
+        return background
+
+    def _draw_char(self, pixels, char, x, y, scale):
+        ink = bytes(self.not_select_color)*scale
+        for row, line in enumerate(NOTATION_MASKS[char]):
+            for col, cell in enumerate(line):
+                if cell != "#":
+                    continue
+                for dy in range(scale):
+                    offset = ((y + row*scale + dy)*self.width +
+                              x + col*scale)*3
+                    pixels[offset:offset + 3*scale] = ink
+
+    def _sprite(self, piece, fill, selected):
+        """Rows of pixels of one square, square_size bytes objects."""
+        key = (piece, fill, selected)
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            return sprite
+        size = self.square_size
+        if piece is None:
+            sprite = (bytes(fill)*size,)*size
+        else:
+            outline = self.select_color if selected \
+                else self.not_select_color
+            body = PIECE_FILLS[piece_color(piece)]
+            if selected and piece_color(piece) == BLACK:
+                body = self.select_color
+            cells = {".": bytes(fill), "#": bytes(outline), "o": bytes(body)}
+            columns = [x*16 // size for x in range(size)]
+            rows = [b"".join(cells[line[column]] for column in columns)
+                    for line in PIECE_MASKS[piece % 6]]
+            sprite = tuple(rows[y*16 // size] for y in range(size))
+        self.sprites[key] = sprite
+        return sprite
+
+    def _blit(self, pixels, sq, sprite):
+        x, y = self.square_origin(sq)
+        width = self.width*3
+        offset = y*width + x*3
+        length = self.square_size*3
+        for row in sprite:
+            pixels[offset:offset + length] = row
+            offset += width
+
+    def _squares(self, position, highlighted, selected):
+        """(piece, fill, selected) each square shows."""
+        mailbox = position.mailbox
+        return [(mailbox[sq], self.square_fill(sq, highlighted),
+                 sq == selected) for sq in range(64)]
+
+    def _draw(self, pixels, squares, only=range(64)):
+        """Blits the squares that differ from the background."""
+        for sq in only:
+            piece, fill, selected = squares[sq]
+            if piece is not None or fill == self.highlight_color:
+                self._blit(pixels, sq, self._sprite(piece, fill, selected))
+
+    def _idat(self, pixels, x, y, width, height):
+        """Compressed image data of a rectangle of the pixels."""
+        stride = self.width*3
+        view = memoryview(pixels)
+        rows = []
+        for row in range(y, y + height):
+            offset = row*stride + x*3
+            rows.append(b"\x00")
+            rows.append(view[offset:offset + width*3])
+        return zlib.compress(b"".join(rows), self.compress_level)
+
+    def _ihdr(self):
+        return _chunk(b"IHDR", struct.pack(">IIBBBBB", self.width,
+                                           self.width, 8, 2, 0, 0, 0))
+
+    def render(self, position, highlighted=(), selected=None):
+        pixels = bytearray(self._background())
+        self._draw(pixels, self._squares(position, highlighted, selected))
+        return b"".join((
+            b"\x89PNG\r\n\x1a\n", self._ihdr(),
+            _chunk(b"IDAT", self._idat(pixels, 0, 0, self.width,
+                                       self.width)),
+            _chunk(b"IEND", b"")))
+
+    def render_animation(self, frames, delay=0.8):
+        background = self._background()
+        pixels = bytearray(background)
+        delay_num = max(1, round(delay*100))
+        chunks = []
+        sequence = 0
+        shown = None
+        for position, highlighted in frames:
+            squares = self._squares(position, highlighted, None)
+            if shown is None:
+                changed = range(64)
+            else:
+                changed = [sq for sq in range(64)
+                           if squares[sq] != shown[sq]] or [0]
+            # Put back the background under the changed squares, then
+            # draw them.
+            for sq in changed:
+                x, y = self.square_origin(sq)
+                offset = (y*self.width + x)*3
+                for row in range(self.square_size):
+                    pixels[offset:offset + self.square_size*3] = \
+                        background[offset:offset + self.square_size*3]
+                    offset += self.width*3
+            self._draw(pixels, squares, changed)
+            shown = squares
+
+            if len(changed) == 64:
+                x = y = 0
+                width = height = self.width
+            else:
+                rows = [sq >> 3 for sq in changed]
+                cols = [sq & 7 for sq in changed]
+                x, y = self.square_origin(min(rows)*8 + min(cols))
+                width = (max(cols) - min(cols))*self.step + self.square_size
+                height = (max(rows) - min(rows))*self.step + self.square_size
+            chunks.append(_chunk(b"fcTL", struct.pack(
+                ">IIIIIHHBB", sequence, width, height, x, y, delay_num, 100,
+                0, 0)))
+            sequence += 1
+            data = self._idat(pixels, x, y, width, height)
+            if len(chunks) == 1:
+                chunks.append(_chunk(b"IDAT", data))
+            else:
+                chunks.append(_chunk(b"fdAT", struct.pack(">I", sequence) +
+                                     data))
+                sequence += 1
+        frame_count = sum(1 for chunk in chunks if chunk[4:8] == b"fcTL")
+        return b"".join([b"\x89PNG\r\n\x1a\n", self._ihdr(),
+                         _chunk(b"acTL", struct.pack(">II", frame_count, 0))] +
+                        chunks + [_chunk(b"IEND", b"")])
+
+
+RENDERERS = {"svg": SVGRenderer, "png": PNGRenderer}
+
+
+def make_renderer(kind, square_size=40):
+    """New renderer of a kind named in RENDERERS.
+
+    Raises:
+        ValueError: No such kind.
+    """
+    try:
+        return RENDERERS[kind](square_size)
+    except KeyError:
+        raise ValueError("no %r renderer, only %s" % (
+            kind, ", ".join(sorted(RENDERERS))))
+
+
+# Renderer of a render_diagrams worker process, made when it starts.
+_worker_renderer = None
+
+
+def _start_worker(kind, square_size):
+    global _worker_renderer
+    _worker_renderer = make_renderer(kind, square_size)
+
+
+def _render_job(job):
+    path, fen = job
+    position = Position()
+    position.set_fen(fen)
+    _worker_renderer.save(path, position)
+    return path
+
+
+def render_diagrams(fens, out_dir, kind="png", square_size=40, workers=None,
+                    chunksize=64):
+    """Writes a diagram of every position, spread over worker processes.
+
+    Each worker keeps one renderer, so its sprites are made once for the
+    whole run. Files are named by position number, 000001.png, ...
+
+    Args:
+        fens: Iterable of FEN strings, read as the workers need them.
+        out_dir: Directory for the images, made if missing.
+        kind: Name in RENDERERS.
+        square_size: Side of a square in pixels.
+        workers: Processes, default one per core. 1 renders here.
+        chunksize: Positions handed to a worker at a time.
+
+    Returns:
+        Diagrams written.
+    """
+    extension = RENDERERS[kind].extension
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = ((os.path.join(out_dir, "%06d.%s" % (index, extension)), fen)
+            for index, fen in enumerate(fens, 1))
+    if workers == 1:
+        _start_worker(kind, square_size)
+        return sum(1 for job in jobs if _render_job(job))
+    with multiprocessing.Pool(workers, _start_worker,
+                              (kind, square_size)) as pool:
+        return sum(1 for path in pool.imap_unordered(_render_job, jobs,
+                                                     chunksize))
+
+
+def _read_fens(path):
+    """FENs of a file of FEN lines, or of a packed file (.bin)."""
+    if path.endswith(".bin"):
+        from packed import read_positions
+        with open(path, "rb") as source:
+            for position in read_positions(source):
+                yield position.fen()
+        return
+    with open(path) as source:
+        for line in source:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+def _kind_of(path, parser):
+    kind = os.path.splitext(path)[1][1:].lower()
+    if kind not in RENDERERS:
+        parser.error("%s: give a .%s file" % (path,
+                                               " or .".join(sorted(RENDERERS))))
+    return kind
+
+
+def main(argv=None):
+    """Command line diagrams, replays and bulk rendering."""
+    parser = argparse.ArgumentParser(description="Draw positions and games "
+                                                 "as PNG or SVG images.")
+    commands = parser.add_subparsers(dest="command")
+    diagram = commands.add_parser("diagram", help="draw one position")
+    replay = commands.add_parser("replay", help="animate a game of a PGN "
+                                                "file")
+    bulk = commands.add_parser("bulk", help="draw every position of a file")
+    for command in (diagram, replay, bulk):
+        command.add_argument("--size", type=int, default=40,
+                             help="square side in pixels (default 40)")
+    diagram.add_argument("--fen", help="position, default the starting one")
+    diagram.add_argument("out", help="image file, .png or .svg")
+    replay.add_argument("pgn", help="PGN file")
+    replay.add_argument("out", help="image file, .png or .svg")
+    replay.add_argument("--game", type=int, default=1,
+                        help="number of the game in the file (default 1)")
+    replay.add_argument("--delay", type=float, default=0.8,
+                        help="seconds per move (default 0.8)")
+    bulk.add_argument("positions", help="file of FEN lines, or a packed "
+                                        ".bin file")
+    bulk.add_argument("out_dir", help="directory for the images")
+    bulk.add_argument("--format", choices=sorted(RENDERERS), default="png")
+    bulk.add_argument("--workers", type=int,
+                      help="processes (default one per core)")
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error("give diagram, replay or bulk")
+
+    if args.command == "diagram":
+        position = Position()
+        try:
+            if args.fen is None:
+                position.set_start_position()
+            else:
+                position.set_fen(args.fen)
+        except ValueError as error:
+            parser.error(str(error))
+        make_renderer(_kind_of(args.out, parser), args.size).save(args.out,
+                                                                  position)
+        return 0
+
+    if args.command == "replay":
+        renderer = make_renderer(_kind_of(args.out, parser), args.size)
+        with open(args.pgn) as source:
+            for number, game in enumerate(read_games(source), 1):
+                if number == args.game:
+                    break
+            else:
+                sys.stderr.write("%s has no game %d\n" % (args.pgn, args.game))
+                return 1
+        try:
+            data = renderer.render_animation(game_frames(game), args.delay)
+        except PGNError as error:
+            sys.stderr.write("%s game %d: %s\n" % (args.pgn, args.game, error))
+            return 1
+        with open(args.out, "wb") as out:
+            out.write(data)
+        return 0
+
+    count = render_diagrams(_read_fens(args.positions), args.out_dir,
+                            args.format, args.size, args.workers)
+    sys.stderr.write("%d diagrams in %s\n" % (count, args.out_dir))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
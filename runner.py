@@ -0,0 +1,278 @@
+################################################################################
+# Batch Game Runner.
+################################################################################
+"""Plays engine against engine games across a pool of worker processes.
+
+    python runner.py --games 40 --workers 4 \\
+        --engine fast:time=0.05 --engine deep:depth=3 --out games.pgn
+
+Each game is written out as PGN as soon as it finishes, with a stats line
+on stderr. The score and games/sec are printed at the end. Engines swap
+colors every game, and each pair of games starts from the same random
+opening so neither side is favored by it.
+"""
+import argparse
+import datetime
+import multiprocessing
+import random
+import sys
+import time
+
+from position import Position
+from movegen import generate_legal_moves, game_result
+from engine import Engine, MAX_PLY
+from book import OpeningBook
+from pgn import move_to_san, game_to_pgn
+
+
+class EngineConfig:
+    """Settings of one engine in a match.
+
+    Attributes:
+        name: Name written in the PGN White/Black tags.
+        think_time: Seconds per move, None for depth only.
+        max_depth: Deepest iteration per move.
+        tt_megabytes: Transposition table budget.
+        book_path: Opening book file, None for no book. Every worker maps
+                   the same file, so they share one copy of it.
+    """
+    __slots__ = ("name", "think_time", "max_depth", "tt_megabytes",
+                 "book_path")
+
+    def __init__(self, name, think_time=0.1, max_depth=MAX_PLY,
+                 tt_megabytes=16, book_path=None):
+        self.name = name
+        self.think_time = think_time
+        self.max_depth = max_depth
+        self.tt_megabytes = tt_megabytes
+        self.book_path = book_path
+
+    @classmethod
+    def parse(cls, text):
+        """Config from 'name:time=0.1,depth=4,hash=8,book=book.bin'.
+        Settings left out keep their defaults; depth without time means no
+        time limit."""
+        name, _, settings = text.partition(":")
+        config = cls(name or "engine")
+        values = dict(item.split("=", 1) for item in settings.split(",")
+                      if item)
+        if "depth" in values:
+            config.max_depth = int(values["depth"])
+            config.think_time = None
+        if "time" in values:
+            config.think_time = float(values["time"])
+        if "hash" in values:
+            config.tt_megabytes = int(values["hash"])
+        if "book" in values:
+            config.book_path = values["book"]
+        return config
+
+    def make_engine(self):
+        """New Engine with these settings."""
+        book = None
+        if self.book_path is not None:
+            book = OpeningBook(self.book_path)
+        return Engine(self.think_time, self.max_depth, self.tt_megabytes,
+                      book=book)
+
+
+class GameRecord:
+    """Outcome and stats of one finished game, sent back from a worker.
+
+    Attributes:
+        round: Game number, from 1.
+        white: White engine name.
+        black: Black engine name.
+        slots: (white, black) index of the engine in the match, 0 or 1.
+               Names may repeat, e.g. one config at two depths.
+        result: "1-0", "0-1" or "1/2-1/2".
+        reason: Why the game ended, e.g. "checkmate".
+        plies: Half moves played.
+        seconds: Wall time of the game.
+        nodes: [white nodes, black nodes] searched.
+        search_seconds: [white, black] seconds spent searching.
+        pgn: PGN text of the game.
+    """
+    __slots__ = ("round", "white", "black", "slots", "result", "reason",
+                 "plies",
+                 "seconds", "nodes", "search_seconds", "pgn")
+
+    def nps(self):
+        """Nodes/sec over both sides' searches."""
+        seconds = sum(self.search_seconds)
+        return int(sum(self.nodes) / seconds) if seconds > 0 else 0
+
+
+def play_game(task):
+    """Plays one game. Runs in a worker process.
+
+    Args:
+        task: (round, white EngineConfig, black EngineConfig,
+               (white slot, black slot), random opening plies, opening
+               seed, max plies)
+
+    Returns:
+        GameRecord.
+    """
+    game_round, white, black, slots, random_plies, seed, max_plies = task
+    start = time.perf_counter()
+    position = Position()
+    position.set_start_position()
+    engines = (white.make_engine(), black.make_engine())
+    rng = random.Random(seed)
+    nodes = [0, 0]
+    search_seconds = [0.0, 0.0]
+    sans = []
+
+    while True:
+        outcome = game_result(position)
+        if outcome is not None:
+            break
+        if len(sans) >= max_plies:
+            outcome = ("1/2-1/2", "ply limit")
+            break
+        turn = position.turn
+        if len(sans) < random_plies:
+            move = rng.choice(list(generate_legal_moves(position)))
+        else:
+            info = engines[turn].search(position)
+            move = info.move
+            nodes[turn] += info.nodes
+            search_seconds[turn] += info.elapsed
+        sans.append(move_to_san(position, move))
+        position.make_move(move)
+
+    record = GameRecord()
+    record.round = game_round
+    record.white = white.name
+    record.black = black.name
+    record.slots = slots
+    record.result, record.reason = outcome
+    record.plies = len(sans)
+    record.seconds = time.perf_counter() - start
+    record.nodes = nodes
+    record.search_seconds = search_seconds
+    headers = {
+        "Event": "Engine self-play",
+        "Site": "runner.py",
+        "Date": datetime.date.today().strftime("%Y.%m.%d"),
+        "Round": str(game_round),
+        "White": white.name,
+        "Black": black.name,
+        "Termination": record.reason,
+        "PlyCount": str(record.plies),
+    }
+    record.pgn = game_to_pgn(headers, sans, record.result)
+    return record
+
+
+def make_tasks(configs, games, random_plies=4, seed=1, max_plies=300):
+    """Tasks for play_game, swapping colors each game.
+
+    Args:
+        configs: One EngineConfig (plays itself, as slots 0 and 1) or two.
+        games: Number of games.
+        random_plies: Random moves at the start of each game.
+        seed: Seed for the random openings.
+        max_plies: Games longer than this are drawn.
+    """
+    first = configs[0]
+    second = configs[1] if len(configs) > 1 else configs[0]
+    tasks = []
+    for index in range(games):
+        slots = (0, 1) if index % 2 == 0 else (1, 0)
+        white, black = (first, second)[slots[0]], (first, second)[slots[1]]
+        tasks.append((index + 1, white, black, slots, random_plies,
+                      seed + index // 2, max_plies))
+    return tasks
+
+
+def run_games(tasks, workers, on_game):
+    """Plays tasks on a process pool, calling on_game as each one finishes.
+
+    Args:
+        tasks: From make_tasks.
+        workers: Number of processes. 1 plays in this process.
+        on_game: Called with each GameRecord in finishing order.
+    """
+    if workers <= 1:
+        for task in tasks:
+            on_game(play_game(task))
+        return
+    with multiprocessing.Pool(workers) as pool:
+        for record in pool.imap_unordered(play_game, tasks):
+            on_game(record)
+
+
+def main(argv=None):
+    """Command line batch runner."""
+    parser = argparse.ArgumentParser(description="Play engine games on "
+                                                 "several cores.")
+    parser.add_argument("--games", type=int, default=10,
+                        help="number of games (default 10)")
+    parser.add_argument("--workers", type=int,
+                        default=multiprocessing.cpu_count(),
+                        help="worker processes (default one per core)")
+    parser.add_argument("--engine", action="append", type=EngineConfig.parse,
+                        help="name:time=SECONDS,depth=N,hash=MB,book=FILE, "
+                             "given once for self-play or twice for a match")
+    parser.add_argument("--random-plies", type=int, default=4,
+                        help="random opening moves per game (default 4)")
+    parser.add_argument("--max-plies", type=int, default=300,
+                        help="draw games longer than this (default 300)")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="seed for the random openings")
+    parser.add_argument("--out", default="-",
+                        help="PGN output file (default stdout)")
+    args = parser.parse_args(argv)
+
+    configs = args.engine or [EngineConfig("engine")]
+    if len(configs) > 2:
+        parser.error("give --engine at most twice")
+    tasks = make_tasks(configs, args.games, args.random_plies, args.seed,
+                       args.max_plies)
+    out = sys.stdout if args.out == "-" else open(args.out, "w")
+
+    # Scores by slot, so engines of the same name are kept apart.
+    names = [configs[0].name, configs[-1].name]
+    if names[0] == names[1]:
+        names = ["%s#%d" % (name, slot + 1) for slot, name in enumerate(names)]
+    scores = [0.0, 0.0]
+    finished = [0]
+    start = time.perf_counter()
+
+    def on_game(record):
+        out.write(record.pgn)
+        out.flush()
+        finished[0] += 1
+        white, black = record.slots
+        if record.result == "1-0":
+            scores[white] += 1
+        elif record.result == "0-1":
+            scores[black] += 1
+        else:
+            scores[white] += .5
+            scores[black] += .5
+        sys.stderr.write("Game %d (%d/%d): %s vs %s %s (%s) %d plies "
+                         "%.1f s %d nps\n" %
+                         (record.round, finished[0], len(tasks), names[white],
+                          names[black], record.result, record.reason,
+                          record.plies, record.seconds, record.nps()))
+
+    try:
+        run_games(tasks, args.workers, on_game)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - start
+    sys.stderr.write("Games: %d in %.1f s (%.2f games/sec)\n" %
+                     (finished[0], elapsed,
+                      finished[0] / elapsed if elapsed > 0 else 0))
+    sys.stderr.write("Score: %s\n" % ", ".join(
+        "%s %.1f" % (name, score) for name, score in zip(names, scores)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+################################################################################
+# Lazy SMP Search.
+################################################################################
+"""Searches one position with several processes sharing a hash table.
+
+Python threads take turns on one core, so the helpers are processes. Every
+process runs the ordinary Engine search on the same root, and they share a
+SharedTranspositionTable, so what one process has searched is a table hit
+for the others. That is all the cooperation there is (Lazy SMP). Helpers
+with an odd number start one depth deeper than the main search, so the
+processes are mostly at different depths at any time and fill the table
+ahead of each other instead of repeating the same work in step.
+
+The main search keeps the time limit and chooses the move. When it is
+done, the helpers are stopped through a shared event and report their
+node counts.
+
+Run as a script to measure scaling, nodes/sec of all processes together
+and time to reach each depth, for each number of processes:
+
+    python smp.py --workers 1 2 4 8 --depth 6
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+
+from position import Position, move_uci
+from engine import Engine, SearchControl, MAX_PLY
+from tt import SharedTranspositionTable
+
+
+def _helper_main(index, tt_name, buckets, tasks, results, stop):
+    """Body of a helper process: searches each task until stopped."""
+    tt = SharedTranspositionTable.attach(tt_name, buckets)
+    engine = Engine(None, tt=tt)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            position, max_depth, age = task
+            tt.age = age
+            engine.search(position, max_depth=max_depth,
+                          control=SearchControl(stop_event=stop),
+                          first_depth=1 + index % 2)
+            results.put((index, engine.nodes))
+    finally:
+        tt.close()
+
+
+class LazySMP:
+    """Engine search spread over processes sharing one hash table.
+
+    Attributes:
+        workers: Processes searching, counting this one.
+        think_time: Default seconds per move.
+        max_depth: Default deepest iteration.
+        engine: Engine of the main search, in this process.
+        tt: SharedTranspositionTable of every process.
+        nodes: Nodes of the last search, all processes together.
+        helper_nodes: Nodes of the last search by each helper.
+    """
+
+    def __init__(self, workers=2, think_time=1.0, max_depth=MAX_PLY,
+                 tt_megabytes=16):
+        """Makes the shared table and starts workers - 1 helper processes.
+
+        Args:
+            workers: Processes searching, counting this one.
+            think_time: Default seconds per move.
+            max_depth: Default deepest iteration.
+            tt_megabytes: Budget of the shared table.
+        """
+        self.workers = workers
+        self.think_time = think_time
+        self.max_depth = max_depth
+        self.tt = SharedTranspositionTable(tt_megabytes)
+        self.engine = Engine(think_time, max_depth, tt=self.tt)
+        self.nodes = 0
+        self.helper_nodes = []
+        self._stop = multiprocessing.Event()
+        self._results = multiprocessing.Queue()
+        self._helpers = []
+        for index in range(1, workers):
+            tasks = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=_helper_main,
+                args=(index, self.tt.name, self.tt.buckets, tasks,
+                      self._results, self._stop),
+                daemon=True)
+            process.start()
+            self._helpers.append((process, tasks))
+
+    def close(self):
+        """Ends the helpers and frees the shared table."""
+        for process, tasks in self._helpers:
+            tasks.put(None)
+        for process, tasks in self._helpers:
+            process.join()
+        self._helpers = []
+        self.tt.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def search(self, position, think_time=None, max_depth=None,
+               on_iteration=None):
+        """Searches position with every process, see Engine.search.
+
+        Returns:
+            SearchInfo of the main search, with nodes counting every
+            process. None if the side to move has no legal moves.
+        """
+        if max_depth is None:
+            max_depth = self.max_depth
+        age = self.tt.age
+        for process, tasks in self._helpers:
+            tasks.put((position, max_depth, age))
+        try:
+            info = self.engine.search(position, think_time, max_depth,
+                                      on_iteration)
+        finally:
+            self._stop.set()
+            helper_nodes = [0]*len(self._helpers)
+            for process in self._helpers:
+                index, nodes = self._results.get()
+                helper_nodes[index - 1] = nodes
+            self._stop.clear()
+        self.helper_nodes = helper_nodes
+        self.nodes = self.engine.nodes + sum(helper_nodes)
+        if info is not None:
+            info.nodes = self.nodes
+        return info
+
+
+def benchmark(position, worker_counts, max_depth, tt_megabytes=16,
+              out=sys.stdout):
+    """Searches position to max_depth with each number of processes and
+    writes nodes/sec and the time each depth was reached.
+
+    Returns:
+        {workers: (seconds, nodes, [seconds to reach depth 1, 2, ...])}.
+    """
+    results = {}
+    for workers in worker_counts:
+        with LazySMP(workers, None, max_depth, tt_megabytes) as smp:
+            reached = []
+            start = time.perf_counter()
+            info = smp.search(position.copy(), on_iteration=lambda info:
+                              reached.append(info.elapsed))
+            elapsed = time.perf_counter() - start
+        results[workers] = (elapsed, smp.nodes, reached)
+        out.write("workers %d: depth %d in %.2f s, nodes %d, nps %d, "
+                  "move %s\n" % (workers, info.depth, elapsed, smp.nodes,
+                                 smp.nodes / elapsed if elapsed > 0 else 0,
+                                 move_uci(info.move)))
+        out.write("  time to depth: %s\n" % " ".join(
+            "%d:%.2f" % (depth, seconds)
+            for depth, seconds in enumerate(reached, 1)))
+    base = results[worker_counts[0]][0]
+    out.write("speedup to depth %d: %s\n" % (max_depth, " ".join(
+        "%dx%.2f" % (workers, base / results[workers][0])
+        for workers in worker_counts)))
+    return results
+
+
+def main(argv=None):
+    """Command line scaling benchmark."""
+    parser = argparse.ArgumentParser(description="Time Lazy SMP search to a "
+                                                 "fixed depth with different "
+                                                 "numbers of processes.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="process counts to try (default 1 2 4 8)")
+    parser.add_argument("--depth", type=int, default=6,
+                        help="depth to search to (default 6)")
+    parser.add_argument("--fen", help="position, default the starting one")
+    parser.add_argument("--hash", type=int, default=16,
+                        help="shared table megabytes (default 16)")
+    args = parser.parse_args(argv)
+
+    position = Position()
+    if args.fen is None:
+        position.set_start_position()
+    else:
+        try:
+            position.set_fen(args.fen)
+        except ValueError as error:
+            parser.error(str(error))
+    sys.stdout.write("cores: %d\n" % multiprocessing.cpu_count())
+    benchmark(position, args.workers, args.depth, args.hash)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
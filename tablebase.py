@@ -0,0 +1,613 @@
+################################################################################
+# Endgame Tablebases.
+################################################################################
+"""Perfect play tables for endings with few pieces, made by retrograde
+analysis.
+
+A table covers one material signature such as "KQvK" (white's pieces, then
+black's) and holds one byte per position, indexed directly from the piece
+squares:
+    0        draw
+    1-254    distance to mate in plies + 1. Even distances are losses for
+             the side to move (0 is checkmated), odd ones wins.
+    255      not a legal position
+Positions with the white king on the right half of the board are mirrored
+to the left half, which halves every table. Castling and en passant are
+not in the tables.
+
+Files are split into blocks compressed separately, with a table of block
+offsets up front. A probe maps the file, finds the block from the index
+and decompresses only that block, so it takes the same time however big
+the table is.
+
+Run as a script to make the three piece tables, then probe or benchmark
+them:
+
+    python tablebase.py generate --workers 4
+    python tablebase.py probe --fen "8/8/8/4k3/8/8/8/4KQ2 w - - 0 1"
+    python tablebase.py bench
+"""
+import argparse
+import mmap
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+from position import (Position, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK,
+                      QUEEN, KING, iter_squares)
+from movegen import generate_legal_moves, is_insufficient_material
+
+DRAW = 0
+ILLEGAL = 255
+
+# Probe results, for the side to move.
+WIN = 1
+LOSS = -1
+
+PIECE_ORDER = "KQRBNP"
+_LETTER_TYPE = {"K": KING, "Q": QUEEN, "R": ROOK, "B": BISHOP, "N": KNIGHT,
+                "P": PAWN}
+
+BLOCK_SIZE = 4096
+_MAGIC = b"TCTB"
+_VERSION = 1
+# magic, version, pieces, entries, block size, blocks, signature
+_HEADER = struct.Struct("<4sHHQII16s")
+
+# A successor outside the table (after a capture or promotion) is stored
+# as its final value plus this, next to the plain indexes of successors
+# inside the table.
+_EXIT = 1 << 40
+
+
+def default_directory():
+    """Directory tables are kept in, under the same cache as the attack
+    tables ($TURTLECHESS_CACHE or ~/.cache/turtlechess)."""
+    directory = os.environ.get("TURTLECHESS_CACHE")
+    if not directory:
+        directory = os.path.join(os.path.expanduser("~"), ".cache",
+                                 "turtlechess")
+    return os.path.join(directory, "tablebases")
+
+
+################################################################################
+# Material Signatures And Indexing.
+################################################################################
+def _side_letters(position, color):
+    """Piece letters of one side in PIECE_ORDER, e.g. 'KQ'."""
+    return "".join(letter*bin(position.pieces[color*6 +
+                                              _LETTER_TYPE[letter]]).count("1")
+                   for letter in PIECE_ORDER)
+
+
+def _strength(letters):
+    """Sort key of one side's pieces; the stronger side is white in a
+    table's signature."""
+    return (len(letters), [-PIECE_ORDER.index(letter) for letter in letters])
+
+
+def canonical_signature(white, black):
+    """Signature of the table holding white vs black pieces, and whether
+    colors must be swapped to use it."""
+    if _strength(white) >= _strength(black):
+        return "%sv%s" % (white, black), False
+    return "%sv%s" % (black, white), True
+
+
+def signature_layout(signature):
+    """Piece codes in index order for a signature, white king first."""
+    white, black = signature.split("v")
+    return ([_LETTER_TYPE[letter] for letter in white] +
+            [6 + _LETTER_TYPE[letter] for letter in black])
+
+
+def table_entries(signature):
+    """Number of positions in a signature's table."""
+    return 2*32*64**(len(signature) - 2)
+
+
+def _index(turn, squares):
+    """Table index of squares (in layout order) with turn to move."""
+    if squares[0] & 7 >= 4:
+        squares = [sq ^ 7 for sq in squares]
+    king = squares[0]
+    index = turn*32 + (king >> 3)*4 + (king & 7)
+    for sq in squares[1:]:
+        index = index*64 + sq
+    return index
+
+
+def _decode(index, pieces):
+    """(turn, squares) of a table index."""
+    squares = [0]*pieces
+    for slot in range(pieces - 1, 0, -1):
+        squares[slot] = index & 63
+        index >>= 6
+    king = index & 31
+    squares[0] = (king >> 2)*8 + (king & 3)
+    return index >> 5, squares
+
+
+def _squares_of(position, layout, swap):
+    """Squares of position's pieces in layout order, flipping the board
+    and colors first if swap."""
+    squares = []
+    left = {}
+    for piece in layout:
+        if swap:
+            piece = (piece + 6) % 12
+        found = left.get(piece)
+        if found is None:
+            found = list(iter_squares(position.pieces[piece]))
+            if swap:
+                found = [sq ^ 56 for sq in found]
+            left[piece] = found
+        squares.append(found.pop())
+    return squares
+
+
+def decode_value(value):
+    """(WIN/DRAW/LOSS, plies to mate or None) of a table byte."""
+    if value == DRAW or value == ILLEGAL:
+        return DRAW, None
+    dtm = value - 1
+    return (WIN if dtm & 1 else LOSS), dtm
+
+
+################################################################################
+# Probing.
+################################################################################
+class _Table:
+    """One mapped table file."""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.pieces, self.entries, self.block_size,
+         self.blocks, signature) = _HEADER.unpack_from(self.map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("%s is not a tablebase file" % path)
+        self.signature = signature.rstrip(b"\0").decode("ascii")
+        self.layout = signature_layout(self.signature)
+        self.offsets = struct.unpack_from("<%dQ" % (self.blocks + 1),
+                                          self.map, _HEADER.size)
+        self.cache = {}
+
+    def value(self, index):
+        """Table byte of an index."""
+        block = index // self.block_size
+        data = self.cache.get(block)
+        if data is None:
+            if len(self.cache) >= 64:
+                self.cache.clear()
+            data = zlib.decompress(
+                self.map[self.offsets[block]:self.offsets[block + 1]])
+            self.cache[block] = data
+        return data[index - block*self.block_size]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class Tablebase:
+    """Tables found in a directory, opened as they are first probed.
+
+    Attributes:
+        directory: Where the .tctb files are.
+        probes: Number of probe() calls.
+        hits: Number of probe() calls answered from a table.
+    """
+
+    def __init__(self, directory=None):
+        """Inits tablebase.
+
+        Args:
+            directory: Directory of table files, default default_directory().
+        """
+        self.directory = directory or default_directory()
+        self.probes = 0
+        self.hits = 0
+        self._tables = {}
+
+    def table(self, signature):
+        """_Table of a signature, None if there is no file for it."""
+        table = self._tables.get(signature, False)
+        if table is False:
+            path = os.path.join(self.directory, signature + ".tctb")
+            table = _Table(path) if os.path.exists(path) else None
+            self._tables[signature] = table
+        return table
+
+    def available(self):
+        """Signatures of the table files in the directory."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.directory)
+                      if name.endswith(".tctb"))
+
+    def probe_value(self, position):
+        """Raw table byte of position (see the module docstring), None if
+        no table covers it."""
+        self.probes += 1
+        if position.castling or position.ep_square is not None:
+            return None
+        white = _side_letters(position, WHITE)
+        black = _side_letters(position, BLACK)
+        if white[:1] != "K" or black[:1] != "K":
+            return None
+        signature, swap = canonical_signature(white, black)
+        table = self.table(signature)
+        if table is None:
+            return None
+        turn = position.turn ^ 1 if swap else position.turn
+        value = table.value(_index(turn, _squares_of(position, table.layout,
+                                                     swap)))
+        self.hits += 1
+        return value
+
+    def probe(self, position):
+        """Result of perfect play from position.
+
+        Returns:
+            (WIN, DRAW or LOSS for the side to move, plies to mate or None
+            for a draw), None if no table covers the position or it can't
+            come up in a game.
+        """
+        value = self.probe_value(position)
+        if value is None or value == ILLEGAL:
+            return None
+        return decode_value(value)
+
+    def close(self):
+        """Unmaps every open table."""
+        for table in self._tables.values():
+            if table is not None:
+                table.close()
+        self._tables = {}
+
+
+################################################################################
+# Generation.
+################################################################################
+def signatures(pieces):
+    """Signatures of every table with up to pieces pieces that isn't a
+    dead draw, in the order they must be made (captures and promotions
+    lead to tables earlier in the list)."""
+    found = set()
+    letters = "QRBNP"
+
+    def combos(count, start=0):
+        if count == 0:
+            yield ""
+            return
+        for position in range(start, len(letters)):
+            for rest in combos(count - 1, position):
+                yield letters[position] + rest
+
+    for total in range(3, pieces + 1):
+        for white_count in range(total - 1):
+            for white in combos(white_count):
+                for black in combos(total - 2 - white_count):
+                    signature, swap = canonical_signature("K" + white,
+                                                          "K" + black)
+                    if not _is_dead_draw(signature):
+                        found.add(signature)
+    return sorted(found, key=lambda signature: (len(signature),
+                                                signature.count("P"),
+                                                signature))
+
+
+def _is_dead_draw(signature):
+    """True if no side can ever mate with this material."""
+    position = Position()
+    sq = 8
+    for piece in signature_layout(signature):
+        position.put_piece(piece, sq)
+        sq += 1
+    return is_insufficient_material(position)
+
+
+_worker_tablebase = None
+
+
+def _scan_chunk(task):
+    """First pass over part of a table. Runs in a worker process.
+
+    Finds illegal positions, mates and stalemates, and every position's
+    successors.
+
+    Args:
+        task: (signature, first index, end index, tablebase directory)
+
+    Returns:
+        (first, values bytes, successor counts array, successors array)
+        where each position's successors follow on from the last one's.
+    """
+    global _worker_tablebase
+    signature, first, end, directory = task
+    if _worker_tablebase is None or _worker_tablebase.directory != directory:
+        _worker_tablebase = Tablebase(directory)
+    tablebase = _worker_tablebase
+    layout = signature_layout(signature)
+    pieces = len(layout)
+    values = bytearray(end - first)
+    counts = array('H', bytes(2*(end - first)))
+    successors = array('Q')
+    position = Position()
+
+    for index in range(first, end):
+        turn, squares = _decode(index, pieces)
+        slot = index - first
+        if (len(set(squares)) != pieces or
+                any(layout[i] % 6 == PAWN and not 8 <= squares[i] < 56
+                    for i in range(pieces))):
+            values[slot] = ILLEGAL
+            continue
+        position.clear()
+        for piece, sq in zip(layout, squares):
+            position.put_piece(piece, sq)
+        position.turn = turn
+        if position.in_check(turn ^ 1):
+            values[slot] = ILLEGAL
+            continue
+
+        moves = list(generate_legal_moves(position))
+        if not moves:
+            # Checkmated is lost in 0 plies; stalemate stays a draw.
+            values[slot] = 1 if position.in_check() else DRAW
+            continue
+        for move in moves:
+            if move >> 12 & 12:   # capture or promotion leaves the table
+                position.make_move(move)
+                if is_insufficient_material(position):
+                    value = DRAW
+                else:
+                    value = tablebase.probe_value(position)
+                    if value is None:
+                        raise ValueError("%s needs a table for %s" %
+                                         (signature, position.fen()))
+                position.unmake_move()
+                successors.append(_EXIT + value)
+            else:
+                from_sq = move & 63
+                moved = squares[:]
+                moved[squares.index(from_sq)] = (move >> 6) & 63
+                successors.append(_index(turn ^ 1, moved))
+        counts[slot] = len(moves)
+    return first, bytes(values), counts, successors
+
+
+def generate_table(signature, directory, workers=1, out=None):
+    """Makes one table file by retrograde analysis.
+
+    Tables its captures and promotions lead to must already be in
+    directory (see signatures for the order).
+
+    Args:
+        signature: e.g. "KQvK".
+        directory: Where to write signature.tctb.
+        workers: Processes for the first pass.
+        out: File for progress lines, None for none.
+
+    Returns:
+        Path of the file written.
+    """
+    entries = table_entries(signature)
+    start = time.perf_counter()
+    chunk = max(BLOCK_SIZE, entries // (workers*8))
+    tasks = [(signature, first, min(first + chunk, entries), directory)
+             for first in range(0, entries, chunk)]
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            chunks = pool.map(_scan_chunk, tasks)
+    else:
+        chunks = [_scan_chunk(task) for task in tasks]
+    scanned = time.perf_counter()
+
+    # value 0 (draw) doubles as "not known yet" until the end.
+    values = bytearray(entries)
+    remaining = array('H', bytes(2*entries))   # moves not known to lose
+    worst = bytearray(entries)                  # deepest win handed over
+    buckets = {}                                # plies -> [(index, value)]
+    edge_to = array('I')                        # in table moves
+    edge_from = array('I')
+    for first, chunk_values, counts, successors in chunks:
+        values[first:first + len(chunk_values)] = chunk_values
+        position = 0
+        for slot, count in enumerate(counts):
+            if not count:
+                continue
+            index = first + slot
+            left = 0
+            best_win = None
+            for successor in successors[position:position + count]:
+                if successor >= _EXIT:
+                    value = successor - _EXIT
+                    if value == DRAW:
+                        left += 1
+                    elif (value - 1) & 1:   # opponent wins after this move
+                        worst[index] = max(worst[index], value)
+                    elif best_win is None or value < best_win:
+                        best_win = value
+                else:
+                    left += 1
+                    edge_to.append(successor)
+                    edge_from.append(index)
+            position += count
+            remaining[index] = left
+            if best_win is not None:
+                buckets.setdefault(best_win, []).append((index, best_win + 1))
+            elif left == 0:
+                buckets.setdefault(worst[index], []).append(
+                    (index, worst[index] + 1))
+
+    for index, value in enumerate(values):
+        if value == 1:
+            buckets.setdefault(0, []).append((index, 1))
+            values[index] = DRAW
+
+    # Predecessors of each position, as one flat array with offsets.
+    starts = array('I', bytes(4*(entries + 1)))
+    for successor in edge_to:
+        starts[successor + 1] += 1
+    for index in range(entries):
+        starts[index + 1] += starts[index]
+    fill = array('I', starts)
+    predecessors = array('I', bytes(4*len(edge_to)))
+    for successor, index in zip(edge_to, edge_from):
+        predecessors[fill[successor]] = index
+        fill[successor] += 1
+    del edge_to, edge_from, fill
+
+    # Resolve positions in order of distance to mate.
+    done = bytearray(entries)
+    plies = 0
+    while buckets:
+        found = buckets.pop(plies, ())
+        for index, value in found:
+            if done[index]:
+                continue
+            done[index] = 1
+            values[index] = value
+            losing = (value - 1) & 1 == 0
+            for previous in predecessors[starts[index]:starts[index + 1]]:
+                if done[previous]:
+                    continue
+                if losing:
+                    buckets.setdefault(value, []).append(
+                        (previous, value + 1))
+                else:
+                    if value > worst[previous]:
+                        worst[previous] = value
+                    remaining[previous] -= 1
+                    if remaining[previous] == 0:
+                        buckets.setdefault(worst[previous], []).append(
+                            (previous, worst[previous] + 1))
+        plies += 1
+        if plies > 253:
+            raise ValueError("%s has mates longer than a byte holds" %
+                             signature)
+
+    path = write_table(signature, values, directory)
+    if out is not None:
+        out.write("%s: %d positions, scan %.1f s, solve %.1f s\n" %
+                  (signature, entries, scanned - start,
+                   time.perf_counter() - scanned))
+    return path
+
+
+def write_table(signature, values, directory):
+    """Writes table bytes as a block compressed file.
+
+    Returns:
+        Path of the file.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    blocks = [zlib.compress(bytes(values[first:first + BLOCK_SIZE]), 9)
+              for first in range(0, len(values), BLOCK_SIZE)]
+    offsets = [_HEADER.size + 8*(len(blocks) + 1)]
+    for block in blocks:
+        offsets.append(offsets[-1] + len(block))
+    path = os.path.join(directory, signature + ".tctb")
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as out:
+        out.write(_HEADER.pack(_MAGIC, _VERSION, len(signature) - 1,
+                               len(values), BLOCK_SIZE, len(blocks),
+                               signature.encode("ascii")))
+        out.write(struct.pack("<%dQ" % len(offsets), *offsets))
+        for block in blocks:
+            out.write(block)
+    os.replace(temporary, path)
+    return path
+
+
+################################################################################
+# Command Line.
+################################################################################
+def benchmark(tablebase, count=100000, seed=1):
+    """Probes random legal positions from every table.
+
+    Returns:
+        Probes/sec.
+    """
+    rng = random.Random(seed)
+    positions = []
+    tables = [tablebase.table(signature)
+              for signature in tablebase.available()]
+    tables = [table for table in tables if table is not None]
+    while len(positions) < 1000 and tables:
+        table = rng.choice(tables)
+        index = rng.randrange(table.entries)
+        if table.value(index) == ILLEGAL:
+            continue
+        turn, squares = _decode(index, table.pieces)
+        position = Position()
+        for piece, sq in zip(table.layout, squares):
+            position.put_piece(piece, sq)
+        position.turn = turn
+        position.update_key()
+        positions.append(position)
+    if not positions:
+        return 0
+    start = time.perf_counter()
+    for number in range(count):
+        tablebase.probe(positions[number % len(positions)])
+    return count / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    """Command line table generation, probing and benchmark."""
+    parser = argparse.ArgumentParser(description="Endgame tablebases.")
+    parser.add_argument("--dir", default=default_directory(),
+                        help="table directory (default %(default)s)")
+    commands = parser.add_subparsers(dest="command")
+    generate = commands.add_parser("generate", help="make tables")
+    generate.add_argument("tables", nargs="*",
+                          help="signatures such as KQvK, default all up to "
+                               "--pieces")
+    generate.add_argument("--pieces", type=int, default=3,
+                          help="most pieces, kings included (default 3; "
+                               "4 takes hours and gigabytes)")
+    generate.add_argument("--workers", type=int,
+                          default=multiprocessing.cpu_count(),
+                          help="processes (default one per core)")
+    probe = commands.add_parser("probe", help="look up a position")
+    probe.add_argument("--fen", required=True)
+    bench = commands.add_parser("bench", help="measure probes/sec")
+    bench.add_argument("--probes", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        wanted = args.tables or signatures(args.pieces)
+        for signature in wanted:
+            generate_table(signature, args.dir, args.workers, sys.stderr)
+        return 0
+    if args.command == "probe":
+        position = Position()
+        position.set_fen(args.fen)
+        result = Tablebase(args.dir).probe(position)
+        if result is None:
+            print("not in tables")
+        else:
+            wdl, dtm = result
+            print({WIN: "win", DRAW: "draw", LOSS: "loss"}[wdl] +
+                  ("" if dtm is None else " mate in %d plies" % dtm))
+        return 0
+    if args.command == "bench":
+        tablebase = Tablebase(args.dir)
+        rate = benchmark(tablebase, args.probes)
+        print("Tables: %s" % ", ".join(tablebase.available()))
+        print("Probes/sec: %d" % rate)
+        return 0
+    parser.error("give generate, probe or bench")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
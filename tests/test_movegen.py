@@ -0,0 +1,58 @@
+"""Perft regression tests: legal move counts of the standard positions."""
+import unittest
+
+from position import Position, START_FEN
+from movegen import generate_legal_moves, perft
+
+# (name, FEN, node counts at depth 1, 2, ...)
+PERFT_POSITIONS = (
+    ("startpos", START_FEN, (20, 400, 8902)),
+    ("kiwipete",
+     "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     (48, 2039, 97862)),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     (14, 191, 2812, 43238)),
+    ("position4",
+     "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     (6, 264, 9467)),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     (44, 1486, 62379)),
+    ("position6",
+     "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - "
+     "0 10",
+     (46, 2079, 89890)),
+)
+
+
+class PerftTest(unittest.TestCase):
+
+    def test_standard_positions(self):
+        for name, fen, counts in PERFT_POSITIONS:
+            position = Position()
+            position.set_fen(fen)
+            for depth, expected in enumerate(counts, 1):
+                with self.subTest(position=name, depth=depth):
+                    self.assertEqual(perft(position, depth), expected)
+
+    def test_position_unchanged(self):
+        for name, fen, counts in PERFT_POSITIONS:
+            with self.subTest(position=name):
+                position = Position()
+                position.set_fen(fen)
+                perft(position, 2)
+                self.assertEqual(position.fen(), fen)
+                self.assertEqual(position.key, position.compute_key())
+                self.assertEqual(position.undo_stack, [])
+
+    def test_make_unmake_keeps_key(self):
+        position = Position()
+        position.set_fen(PERFT_POSITIONS[1][1])
+        for move in generate_legal_moves(position):
+            position.make_move(move)
+            with self.subTest(move=move):
+                self.assertEqual(position.key, position.compute_key())
+            position.unmake_move()
+
+
+if __name__ == "__main__":
+    unittest.main()
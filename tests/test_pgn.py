@@ -0,0 +1,144 @@
+"""SAN parse and emit, and PGN games read, written and replayed."""
+import unittest
+
+from position import Position, START_FEN, move_uci
+from movegen import generate_legal_moves
+from pgn import (PGNError, PGNGame, move_to_san, san_to_move, game_to_pgn,
+                 read_games, replay_game)
+
+KIWIPETE = ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq "
+            "- 0 1")
+
+# (FEN, UCI move, SAN)
+SAN_CASES = (
+    (START_FEN, "e2e4", "e4"),
+    (START_FEN, "g1f3", "Nf3"),
+    (KIWIPETE, "e1g1", "O-O"),
+    (KIWIPETE, "e1c1", "O-O-O"),
+    (KIWIPETE, "d5e6", "dxe6"),
+    (KIWIPETE, "e5f7", "Nxf7"),
+    ("7k/8/8/8/8/8/8/R4RK1 w - - 0 1", "a1c1", "Rac1"),
+    ("7k/8/8/R7/8/8/8/R5K1 w - - 0 1", "a1a3", "R1a3"),
+    ("8/7k/8/8/8/Q7/8/Q1Q3K1 w - - 0 1", "a1b2", "Qa1b2"),
+    ("7k/P7/8/8/8/8/8/K7 w - - 0 1", "a7a8q", "a8=Q+"),
+    ("7k/P7/8/8/8/8/8/K7 w - - 0 1", "a7a8n", "a8=N"),
+    ("rnbqkbnr/pppp1ppp/8/4p3/6P1/5P2/PPPPP2P/RNBQKBNR b KQkq - 0 2",
+     "d8h4", "Qh4#"),
+    ("rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+     "e5f6", "exf6"),
+)
+
+# Positions whose every legal move goes through SAN and back.
+ROUND_TRIP_FENS = (
+    START_FEN,
+    KIWIPETE,
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    "8/7k/8/8/8/Q7/8/Q1Q3K1 w - - 0 1",
+)
+
+SCHOLARS_MATE = """[Event "Test"]
+[White "A"]
+[Black "B"]
+
+1. e4 {king pawn} e5 2. Bc4 (2. Nf3 Nc6) Nc6 3. Qh5 $1 Nf6?? 4. Qxf7# 1-0
+"""
+
+
+def _position(fen):
+    position = Position()
+    position.set_fen(fen)
+    return position
+
+
+def _move(position, uci):
+    for move in generate_legal_moves(position):
+        if move_uci(move) == uci:
+            return move
+    raise AssertionError("no legal move %s" % uci)
+
+
+class SANTest(unittest.TestCase):
+
+    def test_move_to_san(self):
+        for fen, uci, san in SAN_CASES:
+            with self.subTest(fen=fen, move=uci):
+                position = _position(fen)
+                self.assertEqual(move_to_san(position, _move(position, uci)),
+                                 san)
+                self.assertEqual(position.fen(), fen)
+
+    def test_san_to_move(self):
+        for fen, uci, san in SAN_CASES:
+            with self.subTest(fen=fen, san=san):
+                position = _position(fen)
+                self.assertEqual(move_uci(san_to_move(position, san)), uci)
+
+    def test_round_trip(self):
+        for fen in ROUND_TRIP_FENS:
+            position = _position(fen)
+            legal_moves = list(generate_legal_moves(position))
+            for move in legal_moves:
+                san = move_to_san(position, move, legal_moves)
+                with self.subTest(fen=fen, san=san):
+                    self.assertEqual(san_to_move(position, san, legal_moves),
+                                     move)
+
+    def test_lenient_spellings(self):
+        position = _position(KIWIPETE)
+        self.assertEqual(move_uci(san_to_move(position, "0-0")), "e1g1")
+        self.assertEqual(move_uci(san_to_move(position, "0-0-0")), "e1c1")
+        self.assertEqual(move_uci(san_to_move(position, "Nxf7!?")), "e5f7")
+        position = _position("7k/P7/8/8/8/8/8/K7 w - - 0 1")
+        self.assertEqual(move_uci(san_to_move(position, "a8Q")), "a7a8q")
+
+    def test_bad_san(self):
+        for fen, san in ((START_FEN, "e5"), (START_FEN, "Nf4"),
+                         (START_FEN, "O-O"), (START_FEN, "xyz"),
+                         ("7k/8/8/8/8/8/8/R4RK1 w - - 0 1", "Rc1")):
+            with self.subTest(fen=fen, san=san):
+                with self.assertRaises(PGNError):
+                    san_to_move(_position(fen), san)
+
+
+class PGNTest(unittest.TestCase):
+
+    def test_read_and_replay(self):
+        games = list(read_games(SCHOLARS_MATE.splitlines(True)))
+        self.assertEqual(len(games), 1)
+        game = games[0]
+        self.assertEqual(game.headers["White"], "A")
+        self.assertEqual(game.result, "1-0")
+        self.assertEqual(game.sans, ["e4", "e5", "Bc4", "Nc6", "Qh5", "Nf6??",
+                                     "Qxf7#"])
+        position = replay_game(game)
+        self.assertEqual(len(position.undo_stack), 7)
+        self.assertEqual(next(generate_legal_moves(position), None), None)
+
+    def test_write_and_read(self):
+        sans = ["e4", "e5", "Nf3", "Nc6", "Bb5", "a6"]
+        text = game_to_pgn({"Event": "Test"}, sans, "1/2-1/2")
+        game, = read_games(text.splitlines(True))
+        self.assertEqual(game.sans, sans)
+        self.assertEqual(game.result, "1/2-1/2")
+        self.assertEqual(game.headers["Event"], "Test")
+        self.assertEqual(game.headers["Site"], "?")
+
+    def test_black_to_move_from_fen(self):
+        fen = "rnbqkbnr/pppp1ppp/8/4p3/6P1/5P2/PPPPP2P/RNBQKBNR b KQkq - 0 2"
+        text = game_to_pgn({"FEN": fen}, ["Qh4#"], "0-1")
+        self.assertIn("2... Qh4# 0-1", text)
+        game, = read_games(text.splitlines(True))
+        self.assertEqual(len(replay_game(game).undo_stack), 1)
+
+    def test_replay_errors(self):
+        game = PGNGame(sans=["e4", "e5", "Ke3"])
+        with self.assertRaisesRegex(PGNError, r"move 2\. illegal move Ke3"):
+            replay_game(game)
+        game = PGNGame({"FEN": "4k3/8/8/8/8/8/8/8 w - - 0 1"}, ["Kd7"])
+        with self.assertRaisesRegex(PGNError, "bad FEN tag"):
+            replay_game(game)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+"""FEN and packed record round trips, and FENs set_fen must reject."""
+import io
+import unittest
+
+from position import Position, START_FEN
+from packed import (RECORD_SIZE, pack_position, unpack_position,
+                    write_positions, read_positions, read_position_at)
+
+FENS = (
+    START_FEN,
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+    "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+    "4k3/8/8/8/8/8/8/4K3 b - - 57 120",
+)
+
+ILLEGAL_FENS = (
+    "",
+    "8/8/8/8/8/8/8/8 w - - 0 1",                       # no kings
+    "4k3/8/8/8/8/8/8/8 w - - 0 1",                     # no white king
+    "8/8/8/8/8/8/8/4K3 w - - 0 1",                     # no black king
+    "4k3/8/8/8/8/8/8/3KK3 w - - 0 1",                  # two white kings
+    "4k3/8/8/8/8/8/8/4R1K1 w - - 0 1",                 # black in check
+    "4k3/8/8/8/8/8/8 w - - 0 1",                       # 7 rows
+    "4k3/8/8/8/8/8/8/4K4 w - - 0 1",                   # 9 squares in a row
+    "4k3/8/8/8/8/8/8/4X3 w - - 0 1",                   # bad letter
+    "4k3/8/8/8/8/8/8/4K3 x - - 0 1",                   # bad side to move
+    "4k3/8/8/8/8/8/8/4K3 w KX - 0 1",                  # bad castling
+    "4k3/8/8/8/8/8/8/4K3 w - z9 0 1",                  # bad en passant
+    "4k3/8/8/8/8/8/8/4K3 w - - x 1",                   # bad counter
+)
+
+
+def _position(fen):
+    position = Position()
+    position.set_fen(fen)
+    return position
+
+
+class FENTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for fen in FENS:
+            with self.subTest(fen=fen):
+                position = _position(fen)
+                self.assertEqual(position.fen(), fen)
+                self.assertEqual(_position(position.fen()), position)
+                self.assertEqual(position.key, position.compute_key())
+
+    def test_start_position(self):
+        position = Position()
+        position.set_start_position()
+        self.assertEqual(position.fen(), START_FEN)
+
+    def test_counters_optional(self):
+        self.assertEqual(
+            _position("4k3/8/8/8/8/8/8/4K3 w -").fen(),
+            "4k3/8/8/8/8/8/8/4K3 w - - 0 1")
+
+    def test_illegal(self):
+        for fen in ILLEGAL_FENS:
+            with self.subTest(fen=fen):
+                with self.assertRaises(ValueError):
+                    Position().set_fen(fen)
+
+
+class PackedTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for fen in FENS:
+            with self.subTest(fen=fen):
+                record = pack_position(_position(fen))
+                self.assertEqual(len(record), RECORD_SIZE)
+                position = unpack_position(record)
+                self.assertEqual(position.fen(), fen)
+                self.assertEqual(position.key, _position(fen).key)
+
+    def test_counters_capped(self):
+        position = unpack_position(pack_position(
+            _position("4k3/8/8/8/8/8/8/4K3 w - - 300 99999")))
+        self.assertEqual(position.halfmove_clock, 255)
+        self.assertEqual(position.fullmove_number, 65535)
+
+    def test_file(self):
+        out = io.BytesIO()
+        count = write_positions(out, (_position(fen) for fen in FENS))
+        self.assertEqual(count, len(FENS))
+        out.seek(0)
+        self.assertEqual([position.fen() for position in read_positions(
+            out, chunk_records=3)], list(FENS))
+        self.assertEqual(read_position_at(out, 4).fen(), FENS[4])
+
+    def test_truncated_file(self):
+        data = pack_position(_position(START_FEN))
+        with self.assertRaises(ValueError):
+            list(read_positions(io.BytesIO(data + data[:5])))
+
+
+if __name__ == "__main__":
+    unittest.main()
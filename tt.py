@@ -0,0 +1,215 @@
+################################################################################
+# Transposition Table.
+################################################################################
+"""Fixed size table of search results keyed by Zobrist key.
+
+Memory is set once from a budget in megabytes and never grows. Each bucket
+holds two 16 byte slots (a key word and a packed data word):
+    slot 0 - depth preferred. Only replaced by a result searched at least as
+             deep, by the same position, or once it is left over from an
+             earlier search.
+    slot 1 - always replaced.
+
+A slot's key word holds the key XORed with the data word, so a slot torn
+by two processes writing it at once (see SharedTranspositionTable) doesn't
+match any key and just reads as empty.
+"""
+from array import array
+
+# Bound of a stored score.
+EXACT = 0
+LOWER = 1   # search failed high, real score is at least this
+UPPER = 2   # search failed low, real score is at most this
+
+ENTRY_BYTES = 16
+BUCKET_SLOTS = 2
+
+# Data word: move bits 0-15, score + 32768 bits 16-31, depth bits 32-39,
+# bound bits 40-41, age bits 42-47.
+_SCORE_OFFSET = 32768
+_AGE_MASK = 63
+
+
+def _bucket_count(megabytes):
+    """Largest power of two number of buckets that fits in megabytes."""
+    budget = int(megabytes*1024*1024)
+    buckets = 1
+    while buckets*2*BUCKET_SLOTS*ENTRY_BYTES <= budget:
+        buckets *= 2
+    return buckets
+
+
+class TranspositionTable:
+    """Bounded hash table of (move, score, depth, bound) by position key.
+
+    Attributes:
+        buckets: Number of buckets, a power of two.
+        keys: array of 64 bit key XOR data words, two per bucket.
+        data: array of packed data words, two per bucket.
+        age: Search generation, bumped by new_search().
+        probes: Number of probe() calls.
+        hits: Number of probe() calls that found the key.
+    """
+
+    def __init__(self, megabytes=16):
+        """Inits an empty table.
+
+        Args:
+            megabytes: Memory budget. The table uses the largest power of
+                       two number of buckets that fits in it.
+        """
+        buckets = _bucket_count(megabytes)
+        self.buckets = buckets
+        self._mask = buckets - 1
+        self.keys = array('Q', bytes(8*BUCKET_SLOTS*buckets))
+        self.data = array('Q', bytes(8*BUCKET_SLOTS*buckets))
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+
+    @property
+    def memory_bytes(self):
+        """Bytes used by the slots."""
+        return self.buckets*BUCKET_SLOTS*ENTRY_BYTES
+
+    def clear(self):
+        """Forgets every entry."""
+        size = len(self.keys)
+        self.keys = array('Q', bytes(8*size))
+        self.data = array('Q', bytes(8*size))
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+
+    def new_search(self):
+        """Marks the start of a search so older entries become replaceable."""
+        self.age = (self.age + 1) & _AGE_MASK
+
+    def probe(self, key):
+        """Looks up a position.
+
+        Args:
+            key: Zobrist key of position.
+
+        Returns:
+            (move, score, depth, bound), None if the position isn't stored.
+        """
+        self.probes += 1
+        index = (key & self._mask) << 1
+        keys = self.keys
+        data = self.data[index]
+        if keys[index] ^ data != key:
+            data = self.data[index + 1]
+            if keys[index + 1] ^ data != key:
+                return None
+        self.hits += 1
+        return (data & 0xFFFF,
+                ((data >> 16) & 0xFFFF) - _SCORE_OFFSET,
+                (data >> 32) & 0xFF,
+                (data >> 40) & 3)
+
+    def store(self, key, move, score, depth, bound):
+        """Stores a search result.
+
+        Args:
+            key: Zobrist key of position.
+            move: Best move found, 0 if none. When 0 and the position is
+                  already in the slot, the stored move is kept.
+            score: Score, -32768 to 32767.
+            depth: Depth searched, clamped to 0-255.
+            bound: EXACT, LOWER or UPPER.
+        """
+        index = (key & self._mask) << 1
+        keys = self.keys
+        data = self.data
+        depth = 0 if depth < 0 else 255 if depth > 255 else depth
+
+        old = data[index]
+        same = keys[index] ^ old == key
+        if not (same or depth >= (old >> 32) & 0xFF or
+                (old >> 42) & _AGE_MASK != self.age):
+            index += 1
+            old = data[index]
+            same = keys[index] ^ old == key
+        if move == 0 and same:
+            move = old & 0xFFFF
+
+        word = (move |
+                ((score + _SCORE_OFFSET) << 16) |
+                (depth << 32) |
+                (bound << 40) |
+                (self.age << 42))
+        keys[index] = key ^ word
+        data[index] = word
+
+    def hashfull(self):
+        """Permille of the first 1000 slots holding entries of this search."""
+        data = self.data
+        keys = self.keys
+        used = 0
+        for index in range(min(1000, len(data))):
+            if keys[index] and (data[index] >> 42) & _AGE_MASK == self.age:
+                used += 1
+        return used*1000 // min(1000, len(data))
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """TranspositionTable whose slots live in shared memory, so processes
+    searching the same game share what they find.
+
+    One process makes the table and the others attach to it by name.
+    Stores aren't locked; a slot torn by two writers reads as empty.
+
+    Attributes:
+        name: Name of the shared memory block, for attach().
+    """
+
+    def __init__(self, megabytes=16, name=None, buckets=None):
+        """Makes a new table, or attaches to an existing one.
+
+        Args:
+            megabytes: Memory budget of a new table.
+            name: Shared memory name of a table to attach to, None to make
+                  a new one.
+            buckets: Buckets of the table attached to.
+        """
+        from multiprocessing import shared_memory
+        self._owner = name is None
+        if self._owner:
+            buckets = _bucket_count(megabytes)
+        self.buckets = buckets
+        self._mask = buckets - 1
+        if self._owner:
+            self._memory = shared_memory.SharedMemory(
+                create=True, size=self.memory_bytes)
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+        self.name = self._memory.name
+        self._words = memoryview(self._memory.buf).cast('Q')
+        size = BUCKET_SLOTS*buckets
+        self.keys = self._words[:size]
+        self.data = self._words[size:2*size]
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+
+    @classmethod
+    def attach(cls, name, buckets):
+        """Table made by another process, by its name and buckets."""
+        return cls(name=name, buckets=buckets)
+
+    def clear(self):
+        """Forgets every entry, for every process."""
+        self._memory.buf[:self.memory_bytes] = bytes(self.memory_bytes)
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+
+    def close(self):
+        """Detaches, and frees the memory if this process made it."""
+        self.keys.release()
+        self.data.release()
+        self._words.release()
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()